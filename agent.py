@@ -7,6 +7,7 @@ A FastAPI-based financial portfolio and watchlist management system with AI assi
 import os
 import sys
 import asyncio
+import logging
 from typing import List
 import uvicorn # type: ignore
 from fastapi import FastAPI # type: ignore
@@ -21,18 +22,21 @@ from langchain.agents import create_tool_calling_agent, AgentExecutor # type: ig
 # Local imports
 from config import (
     ANTHROPIC_API_KEY, ANTHROPIC_MODEL, SYSTEM_PROMPT, 
-    HOST, PORT, MAX_CONCURRENT_REQUESTS
+    HOST, PORT, MAX_CONCURRENT_REQUESTS, LOG_LEVEL
 )
 from models import (
     ChatRequest, ChatResponse, AsyncChatRequest, AsyncChatResponse,
     RequestStatusResponse, WebSearchInput
 )
 from tools import TOOLS
+import json_utils
 from api_routes import (
-    root, health_check, chat_with_agent, chat_with_agent_async,
-    get_request_status, list_active_requests, get_user_sessions, get_session_messages, close_chat_session
+    get_agent, root, health_check, chat_with_agent, chat_with_agent_async,
+    get_request_status, stream_request_response, list_active_requests, get_user_sessions, get_session_messages, close_chat_session
 )
-from request_processor import process_request_queue
+from request_processor import process_request_queue, restore_pending_requests, cleanup_request_store, close_request_store
+
+logger = logging.getLogger(__name__)
 
 # ====== AI Agent Setup ======
 def build_agent():
@@ -73,17 +77,9 @@ def build_agent():
         early_stopping_method="generate"
     )
 
-# Global agent instance
-agent_executor = None
+# Agent readiness flag; the agent itself is cached by api_routes.get_agent
 agent_ready = False
 
-def get_agent():
-    """Get or create the global agent instance"""
-    global agent_executor
-    if agent_executor is None:
-        agent_executor = build_agent()
-    return agent_executor
-
 # ====== FastAPI App ======
 app = FastAPI(
     title="Porta Finance Assistant API",
@@ -117,11 +113,29 @@ async def api_chat_with_agent(request: ChatRequest):
 async def api_chat_with_agent_async(request: AsyncChatRequest):
     return await chat_with_agent_async(request)
 
+# Shared Brave Search session so searches reuse keep-alive connections instead of a new TLS handshake each
+_brave_session = None
+
+def _get_brave_session():
+    """Get the shared Brave Search client session, creating it on first use"""
+    global _brave_session
+    import aiohttp
+    if _brave_session is None or _brave_session.closed:
+        _brave_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=8, ttl_dns_cache=300, keepalive_timeout=60)
+        )
+    return _brave_session
+
+async def close_brave_session():
+    """Close the shared Brave Search session"""
+    if _brave_session is not None and not _brave_session.closed:
+        await _brave_session.close()
+
 @app.post("/api/v1/web-search/")
 async def api_web_search(request: WebSearchInput):
     """Web search endpoint that integrates with Brave Search API"""
     try:
-        print(f"[LOG] Web search request: {request}")
+        logger.debug("Web search request: %s", request)
         
         # Check if Brave Search API key is configured
         from config import BRAVE_SEARCH_API_KEY, BRAVE_SEARCH_BASE_URL
@@ -149,48 +163,48 @@ async def api_web_search(request: WebSearchInput):
         if request.result_filter and request.result_filter != "web":
             brave_payload["result_filter"] = request.result_filter
         
-        print(f"[LOG] Making request to Brave Search API: {brave_payload}")
+        logger.debug("Making request to Brave Search API: %s", brave_payload)
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                BRAVE_SEARCH_BASE_URL,
-                params=brave_payload,
-                headers={
-                    "Accept": "application/json",
-                    "X-Subscription-Token": BRAVE_SEARCH_API_KEY,
-                    "User-Agent": "Porta-Finance-Assistant/1.0"
-                },
-                timeout=aiohttp.ClientTimeout(total=30)
-            ) as response:
-                print(f"[LOG] Brave Search API response status: {response.status}")
+        session = _get_brave_session()
+        async with session.get(
+            BRAVE_SEARCH_BASE_URL,
+            params=brave_payload,
+            headers={
+                "Accept": "application/json",
+                "X-Subscription-Token": BRAVE_SEARCH_API_KEY,
+                "User-Agent": "Porta-Finance-Assistant/1.0"
+            },
+            timeout=aiohttp.ClientTimeout(total=30)
+        ) as response:
+            logger.info("Brave Search API response status: %s", response.status)
+            
+            if response.status == 200:
+                result = await response.json(loads=json_utils.loads)
+                logger.debug("Brave Search API response success")
+                return result
+            elif response.status == 401:
+                raise HTTPException(
+                    status_code=401, 
+                    detail="Brave Search API authentication failed. Please check your API key."
+                )
+            elif response.status == 429:
+                raise HTTPException(
+                    status_code=429, 
+                    detail="Brave Search API rate limit exceeded. Please try again later."
+                )
+            elif response.status == 400:
+                error_detail = await response.json(loads=json_utils.loads)
+                raise HTTPException(
+                    status_code=400, 
+                    detail=f"Invalid search request: {error_detail.get('message', 'Unknown error')}"
+                )
+            else:
+                error_detail = await response.text()
+                raise HTTPException(
+                    status_code=502, 
+                    detail=f"Brave Search API error (HTTP {response.status}): {error_detail}"
+                )
                 
-                if response.status == 200:
-                    result = await response.json()
-                    print(f"[LOG] Brave Search API response success")
-                    return result
-                elif response.status == 401:
-                    raise HTTPException(
-                        status_code=401, 
-                        detail="Brave Search API authentication failed. Please check your API key."
-                    )
-                elif response.status == 429:
-                    raise HTTPException(
-                        status_code=429, 
-                        detail="Brave Search API rate limit exceeded. Please try again later."
-                    )
-                elif response.status == 400:
-                    error_detail = await response.json()
-                    raise HTTPException(
-                        status_code=400, 
-                        detail=f"Invalid search request: {error_detail.get('message', 'Unknown error')}"
-                    )
-                else:
-                    error_detail = await response.text()
-                    raise HTTPException(
-                        status_code=502, 
-                        detail=f"Brave Search API error (HTTP {response.status}): {error_detail}"
-                    )
-                    
     except HTTPException:
         raise
     except aiohttp.ClientConnectorError:
@@ -204,7 +218,7 @@ async def api_web_search(request: WebSearchInput):
             detail="Brave Search API request timed out. Please try again."
         )
     except Exception as e:
-        print(f"[ERROR] Web search error: {str(e)}")
+        logger.error("Web search error: %s", e)
         raise HTTPException(
             status_code=500, 
             detail=f"Unexpected error during web search: {str(e)}"
@@ -214,6 +228,10 @@ async def api_web_search(request: WebSearchInput):
 async def api_get_request_status(request_id: str):
     return await get_request_status(request_id)
 
+@app.get("/chat/stream/{request_id}")
+async def api_stream_request_response(request_id: str):
+    return await stream_request_response(request_id)
+
 @app.get("/chat/requests")
 async def api_list_active_requests():
     return await list_active_requests()
@@ -303,20 +321,20 @@ def test_watchlist_tool():
         print(f"Making POST request to: {WATCHLIST_API_URL}")
         print(f"Payload: {payload}")
         
-        response = requests.post(WATCHLIST_API_URL, json=payload, headers={"Content-Type": "application/json"})
+        response = requests.post(WATCHLIST_API_URL, data=json_utils.dumps_bytes(payload), headers={"Content-Type": "application/json"})
         
         print(f"Response status: {response.status_code}")
         print(f"Response headers: {dict(response.headers)}")
         
         if response.status_code in [200, 201]:  # 200 OK, 201 Created
-            result = response.json()
+            result = json_utils.loads(response.content)
             print(f"✅ API call successful: {result}")
         else:
             print(f"❌ API call failed with status {response.status_code}")
             try:
-                error_result = response.json()
+                error_result = json_utils.loads(response.content)
                 print(f"Error details: {error_result}")
-            except:
+            except json_utils.JSONDecodeError:
                 print(f"Error text: {response.text}")
                 
     except requests.exceptions.ConnectionError:
@@ -352,15 +370,23 @@ if __name__ == "__main__":
                 print(f"❌ Failed to initialize database: {e}")
                 print("⚠️  Chat sessions and messages may not work")
             
+            restored = restore_pending_requests()
+            if restored:
+                print(f"🔄 Restored {restored} pending requests from previous run")
+            
             asyncio.create_task(process_request_queue())
+            asyncio.create_task(cleanup_request_store())
             print("✅ Async request processor started!")
             
+            from tools import warm_http_clients
+            asyncio.create_task(warm_http_clients())
+            
             # Initialize agent in background
             async def init_agent():
                 global agent_ready
                 try:
                     print("🔄 Initializing AI agent in background...")
-                    agent = await asyncio.get_event_loop().run_in_executor(None, get_agent)
+                    agent = await asyncio.get_running_loop().run_in_executor(None, get_agent)
                     agent_ready = True
                     print("✅ AI agent initialized successfully!")
                 except Exception as e:
@@ -378,6 +404,13 @@ if __name__ == "__main__":
                 print("✅ Database service cleaned up!")
             except Exception as e:
                 print(f"⚠️  Error during database cleanup: {e}")
+            
+            from tools import close_http_clients
+            await close_http_clients()
+            await close_brave_session()
+            await close_request_store()
+        
+        logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
         
         print("🚀 Starting Porta Finance Assistant API...")
         print("✅ Async processing enabled - supports multiple concurrent requests!")
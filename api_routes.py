@@ -4,192 +4,59 @@ FastAPI routes for Porta Finance Assistant
 """
 
 import asyncio
+import logging
+import threading
 import time
 import uuid
-import json
 from datetime import datetime
 from typing import Dict, Any
 
 from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
 
-from config import REQUEST_RESULTS, REQUEST_LOCK, ACTIVE_REQUESTS, MAX_STORED_REQUESTS, REQUEST_QUEUE
+from config import REQUEST_RESULTS, MAX_STORED_REQUESTS, MAX_CONCURRENT_REQUESTS, REQUEST_QUEUE
 from models import (
     ChatRequest, ChatResponse, AsyncChatRequest, AsyncChatResponse, 
     RequestStatusResponse
 )
 from database import db_service
+from request_queue import format_timestamp, FINISHED_STATUSES
+from request_processor import clean_agent_response, active_request_count, open_response_stream, RESPONSE_STREAMS
+import json_utils
 
-def clean_agent_response(result: Any) -> str:
-    """
-    Clean and normalize agent response to extract clean text content.
-    Handles nested JSON strings and various response formats.
-    """
-    print(f"[DEBUG] Raw agent result: {result}")
-    print(f"[DEBUG] Result type: {type(result)}")
-    
-    # Convert result to string first to handle all cases
-    result_str = str(result)
-    print(f"[DEBUG] Result as string: {result_str}")
-    
-    # Check if the result string contains the entire chat history (this should not happen)
-    if "'input':" in result_str and "'chat_history':" in result_str:
-        print(f"[DEBUG] WARNING: Result contains entire chat history, this indicates an agent configuration issue")
-        # Try to extract just the output part if it exists
-        if "'output':" in result_str:
-            try:
-                # Try to parse and extract just the output
-                import ast
-                parsed = ast.literal_eval(result_str)
-                if isinstance(parsed, dict) and "output" in parsed:
-                    output = parsed["output"]
-                    print(f"[DEBUG] Extracted output from chat history: {output}")
-                    return _extract_text_from_nested_content(str(output))
-            except:
-                pass
-        # If we can't extract output, return a generic message
-        return "I apologize, but there was an issue processing your request. Please try again."
-    
-    # Check if the result string contains JSON-like structures
-    if "'text':" in result_str or '"text":' in result_str:
-        print(f"[DEBUG] Detected text field in result string")
-        return _extract_text_from_nested_content(result_str)
-    
-    if isinstance(result, dict):
-        if "output" in result:
-            output = result["output"]
-            print(f"[DEBUG] Found 'output' field: {output}")
-            return _extract_text_from_nested_content(str(output))
-        elif "text" in result:
-            text = result["text"]
-            print(f"[DEBUG] Found 'text' field: {text}")
-            return _extract_text_from_nested_content(str(text))
-        elif "content" in result:
-            content = result["content"]
-            print(f"[DEBUG] Found 'content' field: {content}")
-            return _extract_text_from_nested_content(str(content))
-        else:
-            print(f"[DEBUG] No recognized fields, converting to string")
-            return _extract_text_from_nested_content(str(result))
-    
-    elif isinstance(result, list) and len(result) > 0:
-        first_item = result[0]
-        print(f"[DEBUG] First list item: {first_item}")
-        if isinstance(first_item, dict):
-            if "text" in first_item:
-                text = first_item["text"]
-                print(f"[DEBUG] Found 'text' in first item: {text}")
-                return _extract_text_from_nested_content(str(text))
-            elif "content" in first_item:
-                content = first_item["content"]
-                print(f"[DEBUG] Found 'content' in first item: {content}")
-                return _extract_text_from_nested_content(str(content))
-            else:
-                print(f"[DEBUG] No recognized fields in first item, converting to string")
-                return _extract_text_from_nested_content(str(first_item))
-        else:
-            print(f"[DEBUG] First item is not dict, converting to string")
-            return _extract_text_from_nested_content(str(first_item))
-    
-    else:
-        print(f"[DEBUG] Result is not dict or list, converting to string")
-        return _extract_text_from_nested_content(str(result))
-
-def _extract_text_from_nested_content(text_content: str) -> str:
-    """
-    Extract clean text from potentially nested JSON content.
-    """
-    if not isinstance(text_content, str):
-        text_content = str(text_content)
-    
-    print(f"[DEBUG] Extracting text from: {text_content}")
-    
-    # First, try to handle the case where the content looks like a Python repr of a list
-    # This handles cases like "[{'text': '...', 'type': 'text', 'index': 0}]"
-    if text_content.startswith("[{") and text_content.endswith("}]"):
-        print(f"[DEBUG] Detected Python repr of list, trying to extract text")
-        try:
-            # Try to evaluate it as Python literal (safer than eval)
-            import ast
-            parsed_content = ast.literal_eval(text_content)
-            print(f"[DEBUG] Successfully parsed with ast.literal_eval: {parsed_content}")
-            
-            if isinstance(parsed_content, list) and len(parsed_content) > 0:
-                first_item = parsed_content[0]
-                print(f"[DEBUG] First parsed item: {first_item}")
-                if isinstance(first_item, dict) and "text" in first_item:
-                    final_text = first_item["text"]
-                    print(f"[DEBUG] Extracted final text: {final_text}")
-                    return final_text
-                else:
-                    final_text = str(first_item)
-                    print(f"[DEBUG] Converted first item to string: {final_text}")
-                    return final_text
-            else:
-                final_text = str(parsed_content)
-                print(f"[DEBUG] Converted parsed content to string: {final_text}")
-                return final_text
-        except (ValueError, SyntaxError) as e:
-            print(f"[DEBUG] ast.literal_eval failed: {e}, trying JSON parsing")
-    
-    # Check if it looks like a JSON string
-    text_content = text_content.strip()
-    if (text_content.startswith('[') and text_content.endswith(']')) or \
-       (text_content.startswith('{') and text_content.endswith('}')):
-        try:
-            parsed_content = json.loads(text_content)
-            print(f"[DEBUG] Successfully parsed JSON: {parsed_content}")
-            
-            if isinstance(parsed_content, list) and len(parsed_content) > 0:
-                first_item = parsed_content[0]
-                print(f"[DEBUG] First parsed item: {first_item}")
-                if isinstance(first_item, dict) and "text" in first_item:
-                    final_text = first_item["text"]
-                    print(f"[DEBUG] Extracted final text: {final_text}")
-                    return final_text
-                else:
-                    final_text = str(first_item)
-                    print(f"[DEBUG] Converted first item to string: {final_text}")
-                    return final_text
-            elif isinstance(parsed_content, dict) and "text" in parsed_content:
-                final_text = parsed_content["text"]
-                print(f"[DEBUG] Extracted text from dict: {final_text}")
-                return final_text
-            else:
-                final_text = str(parsed_content)
-                print(f"[DEBUG] Converted parsed content to string: {final_text}")
-                return final_text
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"[DEBUG] JSON parsing failed: {e}, trying ast.literal_eval")
-            try:
-                import ast
-                parsed_content = ast.literal_eval(text_content)
-                print(f"[DEBUG] Successfully parsed with ast.literal_eval: {parsed_content}")
-                
-                if isinstance(parsed_content, list) and len(parsed_content) > 0:
-                    first_item = parsed_content[0]
-                    if isinstance(first_item, dict) and "text" in first_item:
-                        return first_item["text"]
-                    else:
-                        return str(first_item)
-                elif isinstance(parsed_content, dict) and "text" in parsed_content:
-                    return parsed_content["text"]
-                else:
-                    return str(parsed_content)
-            except (ValueError, SyntaxError) as e2:
-                print(f"[DEBUG] ast.literal_eval also failed: {e2}")
-    
-    print(f"[DEBUG] No JSON detected, returning original content: {text_content}")
-    return text_content
+logger = logging.getLogger(__name__)
 
 # Database functions are now handled by database.py service
 
+def _format_request_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace a stored request record's epoch timestamps with formatted ones"""
+    created_at_ts = record.pop("created_at_ts", None)
+    completed_at_ts = record.pop("completed_at_ts", None)
+    record["created_at"] = format_timestamp(created_at_ts)
+    record["completed_at"] = format_timestamp(completed_at_ts) if completed_at_ts is not None else None
+    return record
+
+# Shared agent instance, built once on first use
+_agent = None
+_agent_lock = threading.Lock()
+
 def get_agent():
     """Get or create the global agent instance"""
-    from agent import agent_executor
-    if agent_executor is None:
-        from agent import build_agent
-        agent_executor = build_agent()
-    return agent_executor
+    global _agent
+    agent = _agent
+    if agent is not None:
+        return agent
+    with _agent_lock:
+        if _agent is None:
+            from agent import build_agent
+            _agent = build_agent()
+        return _agent
+
+def reset_agent():
+    """Drop the cached agent so the next get_agent() call rebuilds it"""
+    global _agent
+    with _agent_lock:
+        _agent = None
 
 async def root():
     """Health check endpoint"""
@@ -203,9 +70,8 @@ async def health_check():
     """Detailed health check"""
     try:
         from tools import TOOLS
-        with REQUEST_LOCK:
-            queue_size = REQUEST_QUEUE.qsize()
-            active_requests = ACTIVE_REQUESTS
+        queue_size = REQUEST_QUEUE.qsize()
+        active_requests = active_request_count()
             
         return {
             "status": "healthy",
@@ -215,7 +81,7 @@ async def health_check():
             "async_processing": {
                 "queue_size": queue_size,
                 "active_requests": active_requests,
-                "max_concurrent": 5
+                "max_concurrent": MAX_CONCURRENT_REQUESTS
             }
         }
     except Exception as e:
@@ -278,7 +144,7 @@ async def chat_with_agent(request: ChatRequest):
         # Use the next available sequence number
         next_sequence = max_sequence + 1
         
-        print(f"[DEBUG] Session {session_id}: max_sequence={max_sequence}, next_sequence={next_sequence}")
+        logger.debug("Session %s: max_sequence=%s, next_sequence=%s", session_id, max_sequence, next_sequence)
         
         # Store user message FIRST
         try:
@@ -290,16 +156,16 @@ async def chat_with_agent(request: ChatRequest):
                 role="user",
                 sequence_number=next_sequence
             )
-            print(f"[DEBUG] Stored user message with sequence {next_sequence}")
+            logger.debug("Stored user message with sequence %s", next_sequence)
         except Exception as e:
-            print(f"[ERROR] Failed to store user message: {str(e)}")
+            logger.error("Failed to store user message: %s", e)
             # Try to get a fresh sequence number
             try:
                 # Get fresh count and try again
                 fresh_messages = await db_service.get_session_messages(session_id, limit=100)
                 fresh_max_sequence = max(msg.get("sequence_number", 0) for msg in fresh_messages) if fresh_messages else 0
                 fresh_next_sequence = fresh_max_sequence + 1
-                print(f"[DEBUG] Retrying with fresh sequence: {fresh_next_sequence}")
+                logger.debug("Retrying with fresh sequence: %s", fresh_next_sequence)
                 
                 user_message_id = await db_service.store_message(
                     session_id=session_id,
@@ -310,9 +176,9 @@ async def chat_with_agent(request: ChatRequest):
                     sequence_number=fresh_next_sequence
                 )
                 next_sequence = fresh_next_sequence
-                print(f"[DEBUG] Successfully stored user message with sequence {next_sequence}")
+                logger.debug("Successfully stored user message with sequence %s", next_sequence)
             except Exception as retry_e:
-                print(f"[ERROR] Retry also failed: {str(retry_e)}")
+                logger.error("Retry also failed: %s", retry_e)
                 return ChatResponse(
                     response="I apologize, but there was an issue processing your request. Please try again.",
                     user_id=request.user_id,
@@ -332,18 +198,18 @@ async def chat_with_agent(request: ChatRequest):
                 prefs_result = get_user_preferences(request.user_id)
                 if prefs_result.get('ok'):
                     user_preferences = prefs_result.get('preferences')
-                    print(f"[DEBUG] Pre-loaded user preferences for {request.user_id}")
+                    logger.debug("Pre-loaded user preferences for %s", request.user_id)
                 else:
-                    print(f"[DEBUG] No user preferences found for {request.user_id}")
+                    logger.debug("No user preferences found for %s", request.user_id)
             else:
-                print(f"[DEBUG] Auto-loading user preferences disabled")
+                logger.debug("Auto-loading user preferences disabled")
         except Exception as e:
-            print(f"[DEBUG] Could not pre-load user preferences: {str(e)}")
+            logger.debug("Could not pre-load user preferences: %s", e)
         
         # Invoke agent with full conversation context
-        print(f"[DEBUG] Invoking agent with input: {request.message}")
-        print(f"[DEBUG] Chat history length: {len(enhanced_history)}")
-        print(f"[DEBUG] User preferences loaded: {user_preferences is not None}")
+        logger.debug("Invoking agent with input: %s", request.message)
+        logger.debug("Chat history length: %s", len(enhanced_history))
+        logger.debug("User preferences loaded: %s", user_preferences is not None)
         
         try:
             # Prepare agent input with user preferences
@@ -355,12 +221,12 @@ async def chat_with_agent(request: ChatRequest):
             # Add user preferences to agent input if available
             if user_preferences:
                 agent_input["user_preferences"] = user_preferences
-                print(f"[DEBUG] Added user preferences to agent input")
+                logger.debug("Added user preferences to agent input")
             
             result = agent.invoke(agent_input)
-            print(f"[DEBUG] Agent invocation successful, result type: {type(result)}")
+            logger.debug("Agent invocation successful, result type: %s", type(result))
         except Exception as e:
-            print(f"[ERROR] Agent invocation failed: {str(e)}")
+            logger.error("Agent invocation failed: %s", e)
             return ChatResponse(
                 response="I apologize, but there was an issue processing your request. Please try again.",
                 user_id=request.user_id,
@@ -373,7 +239,7 @@ async def chat_with_agent(request: ChatRequest):
         
         # Check if response is suspiciously long (might contain entire chat history)
         if len(response_text) > 2000:  # Arbitrary threshold
-            print(f"[DEBUG] WARNING: Response is very long ({len(response_text)} chars), might contain chat history")
+            logger.warning("Response is very long (%s chars), might contain chat history", len(response_text))
             # Try to extract just the last meaningful response
             if "'output':" in response_text:
                 try:
@@ -385,14 +251,14 @@ async def chat_with_agent(request: ChatRequest):
                             last_item = output[-1]
                             if isinstance(last_item, dict) and "text" in last_item:
                                 response_text = last_item["text"]
-                                print(f"[DEBUG] Extracted last response text: {response_text[:100]}...")
-                except:
+                                logger.debug("Extracted last response text: %s...", response_text[:100])
+                except (ValueError, SyntaxError):
                     pass
             
             # If still too long, truncate and add note
             if len(response_text) > 1000:
                 response_text = response_text[:1000] + "...\n\n[Response truncated due to length]"
-                print(f"[DEBUG] Response truncated to {len(response_text)} chars")
+                logger.debug("Response truncated to %s chars", len(response_text))
         
         # Ensure response is string
         if not isinstance(response_text, str):
@@ -408,15 +274,15 @@ async def chat_with_agent(request: ChatRequest):
                 role="assistant",
                 sequence_number=next_sequence + 1
             )
-            print(f"[DEBUG] Stored assistant message with sequence {next_sequence + 1}")
+            logger.debug("Stored assistant message with sequence %s", next_sequence + 1)
         except Exception as e:
-            print(f"[ERROR] Failed to store assistant message: {str(e)}")
+            logger.error("Failed to store assistant message: %s", e)
             # Try to get a fresh sequence number for the assistant message
             try:
                 fresh_messages = await db_service.get_session_messages(session_id, limit=100)
                 fresh_max_sequence = max(msg.get("sequence_number", 0) for msg in fresh_messages) if fresh_messages else 0
                 fresh_next_sequence = fresh_max_sequence + 1
-                print(f"[DEBUG] Retrying assistant message with fresh sequence: {fresh_next_sequence}")
+                logger.debug("Retrying assistant message with fresh sequence: %s", fresh_next_sequence)
                 
                 assistant_message_id = await db_service.store_message(
                     session_id=session_id,
@@ -426,11 +292,11 @@ async def chat_with_agent(request: ChatRequest):
                     role="assistant",
                     sequence_number=fresh_next_sequence
                 )
-                print(f"[DEBUG] Successfully stored assistant message with sequence {fresh_next_sequence}")
+                logger.debug("Successfully stored assistant message with sequence %s", fresh_next_sequence)
             except Exception as retry_e:
-                print(f"[ERROR] Assistant message retry also failed: {str(retry_e)}")
+                logger.error("Assistant message retry also failed: %s", retry_e)
                 # Continue without storing the assistant message, but return the response
-                print(f"[WARNING] Could not store assistant message, but continuing with response")
+                logger.warning("Could not store assistant message, but continuing with response")
         
         return ChatResponse(
             response=response_text,
@@ -440,7 +306,7 @@ async def chat_with_agent(request: ChatRequest):
         )
         
     except Exception as e:
-        print(f"[ERROR] Chat error: {str(e)}")
+        logger.error("Chat error: %s", e)
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
 async def chat_with_agent_async(request: AsyncChatRequest):
@@ -452,21 +318,25 @@ async def chat_with_agent_async(request: AsyncChatRequest):
             "request_id": request_id,
             "message": request.message,
             "user_id": request.user_id,
-            "chat_history": request.chat_history
+            "chat_history": request.chat_history,
+            "stream": request.stream
         }
         
-        with REQUEST_LOCK:
-            REQUEST_RESULTS[request_id] = {
-                "request_id": request_id,
-                "status": "queued",
-                "response": None,
-                "user_id": request.user_id,
-                "error": None,
-                "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-                "completed_at": None
-            }
+        # Enqueue first so a full queue leaves no orphaned result; workers can't run before the record is set
+        try:
+            REQUEST_QUEUE.put_nowait(request_data)
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Request queue is full, please retry later")
         
-        REQUEST_QUEUE.put(request_data)
+        REQUEST_RESULTS.set(request_id, {
+            "request_id": request_id,
+            "status": "queued",
+            "response": None,
+            "user_id": request.user_id,
+            "error": None,
+            "created_at_ts": time.time(),
+            "completed_at_ts": None
+        })
         
         return AsyncChatResponse(
             request_id=request_id,
@@ -474,33 +344,59 @@ async def chat_with_agent_async(request: AsyncChatRequest):
             message="Request queued for processing"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error queuing request: {str(e)}")
 
 async def get_request_status(request_id: str):
     """Get the status and result of an async request"""
     try:
-        with REQUEST_LOCK:
-            if request_id not in REQUEST_RESULTS:
-                raise HTTPException(status_code=404, detail="Request not found")
-            
-            result = REQUEST_RESULTS[request_id]
-            return RequestStatusResponse(**result)
+        result = REQUEST_RESULTS.get(request_id)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Request not found")
+        
+        return RequestStatusResponse(**_format_request_record(result))
             
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving request status: {str(e)}")
 
+async def stream_request_response(request_id: str):
+    """Stream an async request's response as server-sent events"""
+    if REQUEST_RESULTS.get(request_id) is None:
+        raise HTTPException(status_code=404, detail="Request not found")
+    
+    stream = open_response_stream(request_id)
+    if stream is None:
+        raise HTTPException(status_code=409, detail="Request is already being streamed")
+    
+    async def events():
+        try:
+            result = REQUEST_RESULTS.get(request_id)
+            if result is not None and result["status"] not in FINISHED_STATUSES:
+                while (token := await stream.get()) is not None:
+                    yield f"data: {json_utils.dumps({'token': token})}\n\n"
+            
+            # Finish with the full stored record, which also covers requests that weren't streamed
+            result = REQUEST_RESULTS.get(request_id)
+            if result is not None:
+                yield f"event: done\ndata: {json_utils.dumps(_format_request_record(result))}\n\n"
+        finally:
+            if RESPONSE_STREAMS.get(request_id) is stream:
+                RESPONSE_STREAMS.pop(request_id)
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 async def list_active_requests():
     """List all active and recent requests"""
     try:
-        with REQUEST_LOCK:
-            return {
-                "active_requests": ACTIVE_REQUESTS,
-                "queue_size": REQUEST_QUEUE.qsize(),
-                "recent_requests": list(REQUEST_RESULTS.values())[-10:]
-            }
+        return {
+            "active_requests": active_request_count(),
+            "queue_size": REQUEST_QUEUE.qsize(),
+            "recent_requests": [_format_request_record(record) for record in REQUEST_RESULTS.snapshot()[-10:]]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing requests: {str(e)}")
 
@@ -4,9 +4,8 @@ Configuration settings for Porta Finance Assistant
 """
 
 import os
-import threading
-from queue import Queue
-from typing import Dict, Any
+
+from request_queue import PersistentRequestQueue, ShardedResults
 
 # Load environment variables
 try:
@@ -39,13 +38,36 @@ USER_PREFERENCES_API_URL = "http://localhost:8000/api/v1/user-preferences/"
 USER_INTERACTIONS_API_URL = "http://localhost:8000/api/v1/user-interactions/"
 PREFERENCE_HISTORY_API_URL = "http://localhost:8000/api/v1/preference-history/"
 
+# Delete portfolio/watchlist entries with one DELETE ?user_id=&ticker= call instead of list-then-delete.
+# Only enable against a backend that scopes that DELETE to the matching entries.
+FILTERED_DELETE_ENABLED = os.getenv("FILTERED_DELETE_ENABLED", "false").lower() in ("1", "true", "yes")
+
 # ====== Web Search Configuration ======
 BRAVE_SEARCH_API_KEY = os.getenv("BRAVE_SEARCH_API_KEY")
 BRAVE_SEARCH_BASE_URL = os.getenv("BRAVE_SEARCH_BASE_URL", "https://api.search.brave.com/res/v1/web/search")
+WEB_SEARCH_CACHE_TTL = int(os.getenv("WEB_SEARCH_CACHE_TTL", "300"))  # Reuse web_search results for equivalent queries for 5 minutes
+
+# ====== Tool Cache Configuration ======
+# Writes made through the tools drop the affected entries, so these only bound staleness from changes made elsewhere
+LIST_CACHE_TTL = int(os.getenv("LIST_CACHE_TTL", "60"))        # Portfolio/watchlist listings, in seconds
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", "30"))  # Portfolio summaries follow prices, so expire sooner
+
+# ====== Logging Configuration ======
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # Per-request tool/route detail is logged at DEBUG
 
 # ====== Request Processing Configuration ======
-MAX_CONCURRENT_REQUESTS = 5
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "5"))
 MAX_STORED_REQUESTS = 100
+REQUEST_QUEUE_DB_PATH = os.getenv("REQUEST_QUEUE_DB_PATH", "request_queue.db")
+REQUEST_QUEUE_SIZE = int(os.getenv("REQUEST_QUEUE_SIZE", "1000"))  # Async requests waiting beyond this are rejected
+REQUEST_RETENTION_SECONDS = 3600  # Keep finished requests on disk for 1 hour
+STREAM_BUFFER_SIZE = 64    # Tokens buffered per streaming client
+STREAM_SEND_TIMEOUT = 30   # Seconds to wait on a stalled streaming client before dropping it
+
+# ====== News Service Configuration ======
+NEWS_PREFETCH_DEPTH = 4       # Tickers whose news is fetched ahead of LLM processing
+NEWS_PROCESSING_WORKERS = 2   # Concurrent LLM processing workers per news batch
+NEWS_REFRESH_SECONDS = int(os.getenv("NEWS_REFRESH_SECONDS", "900"))  # Skip tickers whose news was processed more recently than this
 
 # ====== Response Configuration ======
 MAX_RESPONSE_LENGTH = 150  # Maximum words in response unless detailed explanation requested
@@ -54,21 +76,14 @@ ULTRA_CONCISE_MODE = True  # Enable ultra-concise responses for most queries
 
 # ====== User Preferences Configuration ======
 AUTO_LOAD_USER_PREFERENCES = True  # Automatically load user preferences for every message
-PREFERENCE_CACHE_TTL = 300         # Cache user preferences for 5 minutes (in seconds)
+PREFERENCE_CACHE_TTL = 300         # Reuse fetched user preferences for 5 minutes (in seconds)
 
 # ====== Default User Configuration ======
 DEFAULT_USER_ID = "f00dc8bd-eabc-4143-b1f0-fbcb9715a02e"
 
-# ====== Data Storage ======
-PORTFOLIO: Dict[str, Dict[str, Dict[str, Any]]] = {}
-WATCHLIST: Dict[str, Dict[str, Dict[str, Any]]] = {}
-DOC_CACHE: Dict[str, Any] = {}
-
 # ====== Async Request Management ======
-REQUEST_QUEUE = Queue()
-REQUEST_RESULTS: Dict[str, Dict[str, Any]] = {}
-REQUEST_LOCK = threading.Lock()
-ACTIVE_REQUESTS = 0
+REQUEST_QUEUE = PersistentRequestQueue(REQUEST_QUEUE_DB_PATH, maxsize=REQUEST_QUEUE_SIZE)
+REQUEST_RESULTS = ShardedResults(num_shards=16)
 
 # ====== System Prompt ======
 SYSTEM_PROMPT_TEMPLATE = """You are Porta, a finance-focused assistant. Your job: manage a user's portfolio and watchlist while being aware of their preferences and investment profile.
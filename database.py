@@ -6,11 +6,11 @@ Handles chat sessions and messages storage
 
 import uuid
 import asyncio
-import json
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 import asyncpg
 from config import DATABASE_URL
+import json_utils
 
 class DatabaseService:
     """Database service for managing chat sessions and messages"""
@@ -102,9 +102,9 @@ class DatabaseService:
                 """,
                 message_id, session_id, user_id, message_type, content, role,
                 sequence_number, 
-                json.dumps(tool_calls) if tool_calls else None, 
-                json.dumps(tool_results) if tool_results else None, 
-                json.dumps(metadata) if metadata else None
+                json_utils.dumps(tool_calls) if tool_calls else None, 
+                json_utils.dumps(tool_results) if tool_results else None, 
+                json_utils.dumps(metadata) if metadata else None
             )
             
             # Update session stats
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+JSON helpers for Porta Finance Assistant
+Uses orjson when it is installed and falls back to the standard json module
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson # type: ignore
+except ImportError:
+    orjson = None
+
+# json.JSONDecodeError and orjson.JSONDecodeError both subclass ValueError
+JSONDecodeError = ValueError
+
+def dumps(obj: Any, sort_keys: bool = False) -> str:
+    """Serialize obj to a JSON string, stringifying values JSON can't represent"""
+    if orjson is not None:
+        option = orjson.OPT_SORT_KEYS if sort_keys else 0
+        return orjson.dumps(obj, default=str, option=option).decode()
+    return json.dumps(obj, default=str, sort_keys=sort_keys)
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Serialize obj to UTF-8 encoded JSON, e.g. for an HTTP request body"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, default=str).encode()
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Deserialize a JSON string or bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
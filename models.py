@@ -3,61 +3,98 @@
 Pydantic models for Porta Finance Assistant API
 """
 
-from typing import Optional, Dict, Any, List
-from pydantic import BaseModel, Field, constr
+import sys
+from decimal import Decimal
+from typing import Annotated, Optional, Dict, Any, List
+from pydantic import AfterValidator, BaseModel, BeforeValidator, Field, PlainSerializer, constr
 
 # ====== Type Definitions ======
-Ticker = constr(pattern=r"^[A-Za-z][A-Za-z0-9.\-]{0,9}$")
+def _strip(value: Any) -> Any:
+    return value.strip() if isinstance(value, str) else value
+
+def _strip_upper(value: Any) -> Any:
+    return value.strip().upper() if isinstance(value, str) else value
+
+# Normalized once during validation so tools receive clean values; interned because the same few
+# tickers and user ids key the URL and list caches on every call
+Ticker = Annotated[constr(pattern=r"^[A-Za-z][A-Za-z0-9.\-]{0,9}$"), BeforeValidator(_strip_upper), AfterValidator(sys.intern)]
+UserId = Annotated[constr(min_length=1), BeforeValidator(_strip), AfterValidator(sys.intern)]
+NonEmptyText = Annotated[constr(min_length=1), BeforeValidator(_strip)]
+SearchQuery = Annotated[constr(min_length=1, max_length=500), BeforeValidator(_strip)]
+TargetUrl = Annotated[constr(pattern=r"^https?://"), BeforeValidator(_strip)]
+# Exact amounts, sent to the portfolio API as decimal strings (e.g., "100.0000") like the agent gave them
+PositiveDecimal = Annotated[Decimal, Field(gt=0), PlainSerializer(str)]
 
 # ====== Tool Input Models ======
 class AddPortfolioInput(BaseModel):
-    user_id: str = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
+    user_id: UserId = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
     ticker: Ticker
-    quantity: str = Field(..., description="Number of shares (e.g., '100.0000')")
-    buy_price: str = Field(..., description="Purchase price per share (e.g., '150.5000')")
+    quantity: PositiveDecimal = Field(..., description="Number of shares (e.g., '100.0000')")
+    buy_price: PositiveDecimal = Field(..., description="Purchase price per share (e.g., '150.5000')")
     note: Optional[str] = None
 
 class RemovePortfolioInput(BaseModel):
-    user_id: str = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
+    user_id: UserId = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
     ticker: Ticker
 
 class ListPortfolioInput(BaseModel):
-    user_id: str = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
+    user_id: UserId = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
+    summary_only: bool = Field(default=False, description="Return only the number of holdings, not the holdings themselves")
+    fields: Optional[List[str]] = Field(default=None, description="Only return these fields of each holding (e.g., ['ticker', 'quantity', 'buy_price']); all fields if omitted")
 
 class GetPortfolioSummaryInput(BaseModel):
-    user_id: str = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
+    user_id: UserId = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
     include_pnl: bool = Field(default=True, description="Include PnL calculations")
 
+class GetUserSnapshotInput(BaseModel):
+    user_id: UserId = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
+    include_pnl: bool = Field(default=True, description="Include PnL calculations in the portfolio summary")
+
 class AddWatchlistInput(BaseModel):
-    user_id: str = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
+    user_id: UserId = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
+    ticker: Ticker
+    note: Optional[str] = None
+
+class WatchlistItemInput(BaseModel):
     ticker: Ticker
     note: Optional[str] = None
 
+class AddManyWatchlistInput(BaseModel):
+    user_id: UserId = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
+    items: List[WatchlistItemInput] = Field(..., min_length=1, max_length=50, description="Tickers to add, each with an optional note")
+
 class RemoveWatchlistInput(BaseModel):
-    user_id: str = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
+    user_id: UserId = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
     ticker: Ticker
 
+class RemoveManyWatchlistInput(BaseModel):
+    user_id: UserId = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
+    tickers: List[Ticker] = Field(..., min_length=1, max_length=50, description="Tickers to remove")
+
 class ListWatchlistInput(BaseModel):
-    user_id: str = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
+    user_id: UserId = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
+    summary_only: bool = Field(default=False, description="Return only the number of watchlist entries, not the entries themselves")
+    fields: Optional[List[str]] = Field(default=None, description="Only return these fields of each entry (e.g., ['ticker']); all fields if omitted")
 
 class GetWatchlistEntryInput(BaseModel):
-    user_id: str = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
+    user_id: UserId = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e")
     ticker: Ticker
 
 class WebSearchInput(BaseModel):
-    query: str = Field(..., description="Search query string (1-500 characters)")
+    query: SearchQuery = Field(..., description="Search query string (1-500 characters)")
     result_filter: Optional[str] = Field(default="web", description="Filter results by type (web, news, videos, locations, faq, discussions, infobox, mixed, summarizer, rich)")
     search_lang: Optional[str] = Field(default="en_US", description="Search language (e.g., en_US, fr_FR)")
     country: Optional[str] = Field(default="US", description="Country code (e.g., US, FR)")
     ui_lang: Optional[str] = Field(default="en", description="UI language (e.g., en, fr)")
-    count: Optional[int] = Field(default=10, ge=1, le=50, description="Number of results (1-50)")
-    offset: Optional[int] = Field(default=0, ge=0, description="Offset for pagination")
+    count: int = Field(default=10, ge=1, le=50, description="Number of results (1-50)")
+    offset: int = Field(default=0, ge=0, description="Offset for pagination")
     safesearch: Optional[str] = Field(default="moderate", description="Safe search setting (strict, moderate, off)")
 
 class StressTestInput(BaseModel):
-    target_url: str = Field(..., description="URL to stress test (e.g., 'http://localhost:8000/health')")
+    target_url: TargetUrl = Field(..., description="URL to stress test (e.g., 'http://localhost:8000/health')")
     num_requests: int = Field(default=10, ge=1, le=100, description="Number of concurrent requests to send (1-100)")
     timeout_seconds: int = Field(default=5, ge=1, le=30, description="Timeout for each request in seconds (1-30)")
+    measure_body: bool = Field(default=False, description="Download each response body and time to its end, rather than stopping at the response headers")
 
 # ====== API Request/Response Models ======
 class ChatRequest(BaseModel):
@@ -76,6 +113,7 @@ class AsyncChatRequest(BaseModel):
     message: str = Field(..., description="User's message/prompt")
     user_id: str = Field(default="f00dc8bd-eabc-4143-b1f0-fbcb9715a02e", description="User identifier")
     chat_history: List[Dict[str, str]] = Field(default=[], description="Previous chat history")
+    stream: bool = Field(default=False, description="Stream response tokens via /chat/stream/{request_id}")
 
 class AsyncChatResponse(BaseModel):
     request_id: str = Field(..., description="Unique request identifier")
@@ -109,7 +147,7 @@ class UserPreferences(BaseModel):
     updated_at: Optional[str] = None
 
 class UserPreferencesInput(BaseModel):
-    user_id: str = Field(..., description="User identifier")
+    user_id: UserId = Field(..., description="User identifier")
     experience_level: Optional[str] = Field(None, description="Experience level: beginner, intermediate, advanced, expert")
     investment_style: Optional[str] = Field(None, description="Investment style: conservative, moderate, aggressive, day_trader, swing_trader, long_term")
     risk_tolerance: Optional[str] = Field(None, description="Risk tolerance: low, medium, high")
@@ -123,14 +161,14 @@ class UserPreferencesInput(BaseModel):
     timezone: Optional[str] = Field(None, description="User's timezone")
 
 class UserInteractionInput(BaseModel):
-    user_id: str = Field(..., description="User identifier")
-    interaction_type: str = Field(..., description="Type of interaction: tool_used, feedback_given, preference_changed, search_performed, portfolio_viewed")
+    user_id: UserId = Field(..., description="User identifier")
+    interaction_type: NonEmptyText = Field(..., description="Type of interaction: tool_used, feedback_given, preference_changed, search_performed, portfolio_viewed")
     content: Optional[Dict[str, Any]] = Field(None, description="Interaction content details")
     satisfaction_score: Optional[int] = Field(None, ge=1, le=5, description="Satisfaction score from 1-5")
     metadata: Optional[Dict[str, Any]] = Field(None, description="Additional metadata about the interaction")
 
 class GetUserPreferencesInput(BaseModel):
-    user_id: str = Field(..., description="User identifier")
+    user_id: UserId = Field(..., description="User identifier")
 
 class ListUserPreferencesInput(BaseModel):
     page: int = Field(default=1, ge=1, description="Page number")
@@ -140,13 +178,13 @@ class ListUserPreferencesInput(BaseModel):
     risk_tolerance: Optional[str] = Field(None, description="Filter by risk tolerance")
 
 class GetUserInteractionsInput(BaseModel):
-    user_id: str = Field(..., description="User identifier")
+    user_id: UserId = Field(..., description="User identifier")
     page: int = Field(default=1, ge=1, description="Page number")
     size: int = Field(default=10, ge=1, le=100, description="Page size")
     interaction_type: Optional[str] = Field(None, description="Filter by interaction type")
 
 class GetPreferenceHistoryInput(BaseModel):
-    user_id: str = Field(..., description="User identifier")
+    user_id: UserId = Field(..., description="User identifier")
     page: int = Field(default=1, ge=1, description="Page number")
     size: int = Field(default=10, ge=1, le=100, description="Page size")
     field_name: Optional[str] = Field(None, description="Filter by field name")
@@ -7,7 +7,7 @@ Fetches holdings from API, gets related news, processes through LLM, and stores
 import asyncio
 import logging
 import hashlib
-import json
+from collections import OrderedDict
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
@@ -21,8 +21,10 @@ from dotenv import load_dotenv
 from config import (
     ANTHROPIC_API_KEY, DATABASE_URL, PORTFOLIO_API_URL, 
     WATCHLIST_API_URL, DEFAULT_USER_ID, BRAVE_SEARCH_API_KEY,
-    USER_PREFERENCES_API_URL
+    USER_PREFERENCES_API_URL, NEWS_PREFETCH_DEPTH, NEWS_PROCESSING_WORKERS,
+    NEWS_REFRESH_SECONDS
 )
+import json_utils
 
 # Load environment variables
 load_dotenv()
@@ -65,6 +67,9 @@ class PortfolioItem:
     buy_price: str
     note: Optional[str] = None
 
+# News ids known to be stored, remembered so repeat runs skip the existence query
+KNOWN_NEWS_IDS_SIZE = 4096
+
 class NewsDatabase:
     """Database operations for news storage"""
     
@@ -72,6 +77,14 @@ class NewsDatabase:
         self.database_url = database_url
         self.pool = None
         self._lock = asyncio.Lock()
+        self._known_news_ids: "OrderedDict[str, None]" = OrderedDict()
+    
+    def _remember_news_id(self, news_id: str):
+        """Record a stored news id, dropping the least recently seen beyond KNOWN_NEWS_IDS_SIZE"""
+        self._known_news_ids[news_id] = None
+        self._known_news_ids.move_to_end(news_id)
+        if len(self._known_news_ids) > KNOWN_NEWS_IDS_SIZE:
+            self._known_news_ids.popitem(last=False)
     
     async def connect(self):
         """Create database connection pool"""
@@ -85,7 +98,7 @@ class NewsDatabase:
             await self.create_tables()
             logger.info("Database connection established")
         except Exception as e:
-            logger.error(f"Database connection failed: {e}")
+            logger.error("Database connection failed: %s", e)
             raise
     
     async def close(self):
@@ -100,7 +113,7 @@ class NewsDatabase:
                 raise Exception("Database pool not initialized")
             return await self.pool.acquire()
         except Exception as e:
-            logger.error(f"Failed to get database connection: {e}")
+            logger.error("Failed to get database connection: %s", e)
             raise
     
     async def create_tables(self):
@@ -173,7 +186,7 @@ class NewsDatabase:
                 finally:
                     await self.pool.release(conn)
             except Exception as e:
-                logger.error(f"Failed to create tables: {e}")
+                logger.error("Failed to create tables: %s", e)
                 raise
     
     async def store_news(self, news_item: NewsItem, ticker_source: str = 'portfolio') -> bool:
@@ -201,14 +214,15 @@ class NewsDatabase:
                 news_item.news_id, news_item.ticker, news_item.title, 
                 news_item.description, news_item.url, news_item.source,
                 news_item.published_at, news_item.content, 
-                json.dumps(news_item.bullet_points), news_item.sentiment,
+                json_utils.dumps(news_item.bullet_points), news_item.sentiment,
                 news_item.relevance_score, ticker_source, news_item.personalized_insights, news_item.created_at, news_item.updated_at
                 )
+                self._remember_news_id(news_item.news_id)
                 return True
             finally:
                 await self.pool.release(conn)
         except Exception as e:
-            logger.error(f"Failed to store news: {e}")
+            logger.error("Failed to store news: %s", e)
             return False
     
     async def store_watchlist_cache(self, watchlist_tickers: List[str], user_id: str):
@@ -223,11 +237,11 @@ class NewsDatabase:
                         ON CONFLICT (ticker) DO UPDATE SET
                             last_updated = CURRENT_TIMESTAMP
                     """, ticker, user_id)
-                logger.info(f"Cached {len(watchlist_tickers)} watchlist tickers")
+                logger.info("Cached %s watchlist tickers", len(watchlist_tickers))
             finally:
                 await self.pool.release(conn)
         except Exception as e:
-            logger.error(f"Failed to cache watchlist: {e}")
+            logger.error("Failed to cache watchlist: %s", e)
     
     async def get_watchlist_from_cache(self, user_id: str) -> List[str]:
         """Get watchlist tickers from cache"""
@@ -242,22 +256,44 @@ class NewsDatabase:
             finally:
                 await self.pool.release(conn)
         except Exception as e:
-            logger.error(f"Failed to get watchlist from cache: {e}")
+            logger.error("Failed to get watchlist from cache: %s", e)
             return []
     
+    async def get_recently_processed(self, max_age_seconds: int) -> set:
+        """Get tickers whose news was processed successfully within the last max_age_seconds"""
+        try:
+            conn = await self._get_connection()
+            try:
+                rows = await conn.fetch("""
+                    SELECT ticker FROM news_processing_status
+                    WHERE status = 'completed' AND last_processed > CURRENT_TIMESTAMP - $1 * INTERVAL '1 second'
+                """, max_age_seconds)
+                return {row['ticker'] for row in rows}
+            finally:
+                await self.pool.release(conn)
+        except Exception as e:
+            logger.error("Failed to get recently processed tickers: %s", e)
+            return set()
+    
     async def news_exists(self, news_id: str) -> bool:
         """Check if news item already exists"""
+        # Stored news is never deleted, so a remembered id needs no query
+        if news_id in self._known_news_ids:
+            self._known_news_ids.move_to_end(news_id)
+            return True
         try:
             conn = await self._get_connection()
             try:
                 result = await conn.fetchval(
                     "SELECT 1 FROM news WHERE news_id = $1", news_id
                 )
+                if result is not None:
+                    self._remember_news_id(news_id)
                 return result is not None
             finally:
                 await self.pool.release(conn)
         except Exception as e:
-            logger.error(f"Failed to check news existence: {e}")
+            logger.error("Failed to check news existence: %s", e)
             return False
     
     async def store_portfolio_cache(self, portfolios: List[PortfolioItem]):
@@ -277,11 +313,11 @@ class NewsDatabase:
                             last_updated = CURRENT_TIMESTAMP
                     """, portfolio.ticker, portfolio.user_id, portfolio.quantity, 
                          portfolio.buy_price, portfolio.note)
-                logger.info(f"Cached {len(portfolios)} portfolios")
+                logger.info("Cached %s portfolios", len(portfolios))
             finally:
                 await self.pool.release(conn)
         except Exception as e:
-            logger.error(f"Failed to cache portfolios: {e}")
+            logger.error("Failed to cache portfolios: %s", e)
     
     async def get_portfolios_from_cache(self) -> List[PortfolioItem]:
         """Get portfolios from cache"""
@@ -303,7 +339,7 @@ class NewsDatabase:
             finally:
                 await self.pool.release(conn)
         except Exception as e:
-            logger.error(f"Failed to get portfolios from cache: {e}")
+            logger.error("Failed to get portfolios from cache: %s", e)
             return []
     
     async def update_processing_status(self, ticker: str, news_count: int, status: str = 'completed', ticker_source: str = 'portfolio'):
@@ -323,7 +359,7 @@ class NewsDatabase:
             finally:
                 await self.pool.release(conn)
         except Exception as e:
-            logger.error(f"Failed to update processing status: {e}")
+            logger.error("Failed to update processing status: %s", e)
 
 class NewsAPI:
     """Handles news API calls"""
@@ -331,6 +367,25 @@ class NewsAPI:
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.base_url = "https://api.search.brave.com/res/v1/news/search"
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Get the shared client session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=64,
+                    limit_per_host=8,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=60
+                )
+            )
+        return self._session
+    
+    async def close(self):
+        """Close the shared client session"""
+        if self._session and not self._session.closed:
+            await self._session.close()
     
     async def search_news(self, ticker: str, count: int = 20) -> List[Dict[str, Any]]:
         """Search for news related to a ticker"""
@@ -338,51 +393,53 @@ class NewsAPI:
             if not self.api_key:
                 logger.error("No Brave Search API key configured")
                 return []
+            
+            session = self._get_session()
+            
+            # Build query exactly like the example - use valid parameters
+            query = f"{ticker} stock"
+            params = {
+                'q': query,
+                'count': count,
+                'search_lang': 'en',  # Fixed: use 'en' instead of 'en_US'
+                'country': 'US'
+            }
+            
+            headers = {
+                'Accept': 'application/json',
+                'X-Subscription-Token': self.api_key
+            }
+            
+            logger.info("Searching news for %s with query: '%s' and params: %s", ticker, query, params)
+            logger.info("Full URL: %s?q=%s&count=%s", self.base_url, query, count)
+            
+            async with session.get(self.base_url, params=params, headers=headers, timeout=30) as response:
+                logger.info("News API response status for %s: %s", ticker, response.status)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("News API response headers: %s", dict(response.headers))
                 
-            async with aiohttp.ClientSession() as session:
-                # Build query exactly like the example - use valid parameters
-                query = f"{ticker} stock"
-                params = {
-                    'q': query,
-                    'count': count,
-                    'search_lang': 'en',  # Fixed: use 'en' instead of 'en_US'
-                    'country': 'US'
-                }
-                
-                headers = {
-                    'Accept': 'application/json',
-                    'X-Subscription-Token': self.api_key
-                }
-                
-                logger.info(f"Searching news for {ticker} with query: '{query}' and params: {params}")
-                logger.info(f"Full URL: {self.base_url}?q={query}&count={count}")
-                
-                async with session.get(self.base_url, params=params, headers=headers, timeout=30) as response:
-                    logger.info(f"News API response status for {ticker}: {response.status}")
-                    logger.info(f"News API response headers: {dict(response.headers)}")
+                if response.status == 200:
+                    data = await response.json(loads=json_utils.loads)
+                    logger.info("News API raw response for %s: %s", ticker, data)
                     
-                    if response.status == 200:
-                        data = await response.json()
-                        logger.info(f"News API raw response for {ticker}: {data}")
-                        
-                        results = data.get('results', [])
-                        logger.info(f"Found {len(results)} news items for {ticker}")
-                        
-                        # Log first result for debugging
-                        if results:
-                            first_result = results[0]
-                            logger.info(f"First news result for {ticker}: {first_result}")
-                        
-                        return results
-                    else:
-                        response_text = await response.text()
-                        logger.warning(f"News API returned status {response.status} for {ticker}")
-                        logger.warning(f"News API error response: {response_text}")
-                        return []
+                    results = data.get('results', [])
+                    logger.info("Found %s news items for %s", len(results), ticker)
+                    
+                    # Log first result for debugging
+                    if results:
+                        first_result = results[0]
+                        logger.info("First news result for %s: %s", ticker, first_result)
+                    
+                    return results
+                else:
+                    response_text = await response.text()
+                    logger.warning("News API returned status %s for %s", response.status, ticker)
+                    logger.warning("News API error response: %s", response_text)
+                    return []
         except Exception as e:
-            logger.error(f"Failed to fetch news for {ticker}: {e}")
+            logger.error("Failed to fetch news for %s: %s", ticker, e)
             import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.error("Traceback: %s", traceback.format_exc())
             return []
 
 class UserPreferencesAPI:
@@ -396,21 +453,21 @@ class UserPreferencesAPI:
         try:
             async with aiohttp.ClientSession() as session:
                 url = f"{self.base_url}{user_id}/"
-                logger.info(f"Fetching user preferences from: {url}")
+                logger.info("Fetching user preferences from: %s", url)
                 
                 async with session.get(url, timeout=30) as response:
-                    logger.info(f"User Preferences API response status: {response.status}")
+                    logger.info("User Preferences API response status: %s", response.status)
                     
                     if response.status == 200:
-                        data = await response.json()
-                        logger.info(f"User preferences fetched: {data}")
+                        data = await response.json(loads=json_utils.loads)
+                        logger.info("User preferences fetched: %s", data)
                         return data
                     else:
                         response_text = await response.text()
-                        logger.warning(f"User Preferences API returned status {response.status}: {response_text}")
+                        logger.warning("User Preferences API returned status %s: %s", response.status, response_text)
                         return None
         except Exception as e:
-            logger.error(f"Failed to fetch user preferences: {e}")
+            logger.error("Failed to fetch user preferences: %s", e)
             return None
 
 class LLMProcessor:
@@ -479,9 +536,9 @@ PERSONALIZATION INSTRUCTIONS:
             # Create personalized prompt
             prompt = self._create_personalized_prompt(title, description, content, ticker, user_prefs)
             
-            logger.info(f"Processing news for {ticker} with personalized LLM...")
+            logger.info("Processing news for %s with personalized LLM...", ticker)
             if user_prefs:
-                logger.info(f"Using user preferences: {user_prefs.get('experience_level', 'N/A')} level, {user_prefs.get('risk_tolerance', 'N/A')} risk tolerance")
+                logger.info("Using user preferences: %s level, %s risk tolerance", user_prefs.get('experience_level', 'N/A'), user_prefs.get('risk_tolerance', 'N/A'))
             
             response = await asyncio.to_thread(
                 self.client.messages.create,
@@ -492,7 +549,7 @@ PERSONALIZATION INSTRUCTIONS:
             )
             
             response_text = response.content[0].text.strip()
-            logger.info(f"LLM raw response for {ticker}: {response_text[:200]}...")
+            logger.info("LLM raw response for %s: %s...", ticker, response_text[:200])
             
             # Try to extract JSON from the response
             try:
@@ -502,9 +559,9 @@ PERSONALIZATION INSTRUCTIONS:
                 
                 if start != -1 and end != 0:
                     json_text = response_text[start:end]
-                    logger.info(f"Extracted JSON for {ticker}: {json_text}")
+                    logger.info("Extracted JSON for %s: %s", ticker, json_text)
                     
-                    result = json.loads(json_text)
+                    result = json_utils.loads(json_text)
                     
                     # Validate the response
                     bullet_points = result.get('bullet_points', [])
@@ -539,12 +596,12 @@ PERSONALIZATION INSTRUCTIONS:
                         'personalized_insights': personalized_insights
                     }
                 else:
-                    logger.warning(f"No JSON found in LLM response for {ticker}")
+                    logger.warning("No JSON found in LLM response for %s", ticker)
                     raise ValueError("No JSON content found")
                     
-            except (json.JSONDecodeError, ValueError) as e:
-                logger.warning(f"Failed to parse LLM response for {ticker}: {e}")
-                logger.warning(f"Full response: {response_text}")
+            except json_utils.JSONDecodeError as e:
+                logger.warning("Failed to parse LLM response for %s: %s", ticker, e)
+                logger.warning("Full response: %s", response_text)
                 
                 # Generate fallback response
                 return {
@@ -560,9 +617,9 @@ PERSONALIZATION INSTRUCTIONS:
                 }
                 
         except Exception as e:
-            logger.error(f"LLM processing failed for {ticker}: {e}")
+            logger.error("LLM processing failed for %s: %s", ticker, e)
             import traceback
-            logger.error(f"LLM error traceback: {traceback.format_exc()}")
+            logger.error("LLM error traceback: %s", traceback.format_exc())
             
             return {
                 'bullet_points': [
@@ -587,14 +644,14 @@ class HoldingsAPI:
         try:
             async with aiohttp.ClientSession() as session:
                 url = f"{self.base_url}{user_id}/holdings"
-                logger.info(f"Fetching portfolio from: {url}")
+                logger.info("Fetching portfolio from: %s", url)
                 
                 async with session.get(url, timeout=30) as response:
-                    logger.info(f"Portfolio API response status: {response.status}")
+                    logger.info("Portfolio API response status: %s", response.status)
                     
                     if response.status == 200:
-                        data = await response.json()
-                        logger.info(f"Portfolio API response: {data}")
+                        data = await response.json(loads=json_utils.loads)
+                        logger.info("Portfolio API response: %s", data)
                         
                         portfolios = []
                         for item in data.get('holdings', []):
@@ -606,15 +663,15 @@ class HoldingsAPI:
                                 note=item.get('note')
                             ))
                         
-                        logger.info(f"Parsed {len(portfolios)} portfolio holdings: {[p.ticker for p in portfolios]}")
+                        logger.info("Parsed %s portfolio holdings: %s", len(portfolios), [p.ticker for p in portfolios])
                         return portfolios
                     else:
-                        logger.warning(f"Portfolio API returned status {response.status}")
+                        logger.warning("Portfolio API returned status %s", response.status)
                         response_text = await response.text()
-                        logger.warning(f"Portfolio API response: {response_text}")
+                        logger.warning("Portfolio API response: %s", response_text)
                         return []
         except Exception as e:
-            logger.error(f"Failed to fetch portfolio: {e}")
+            logger.error("Failed to fetch portfolio: %s", e)
             return []
     
     async def fetch_watchlist(self, user_id: str) -> List[str]:
@@ -622,14 +679,14 @@ class HoldingsAPI:
         try:
             async with aiohttp.ClientSession() as session:
                 url = f"{WATCHLIST_API_URL}{user_id}/"
-                logger.info(f"Fetching watchlist from: {url}")
+                logger.info("Fetching watchlist from: %s", url)
                 
                 async with session.get(url, timeout=30) as response:
-                    logger.info(f"Watchlist API response status: {response.status}")
+                    logger.info("Watchlist API response status: %s", response.status)
                     
                     if response.status == 200:
-                        data = await response.json()
-                        logger.info(f"Watchlist API response: {data}")
+                        data = await response.json(loads=json_utils.loads)
+                        logger.info("Watchlist API response: %s", data)
                         
                         watchlist = []
                         for item in data.get('watchlist', []):
@@ -637,15 +694,15 @@ class HoldingsAPI:
                             if ticker:
                                 watchlist.append(ticker)
                         
-                        logger.info(f"Parsed {len(watchlist)} watchlist items: {watchlist}")
+                        logger.info("Parsed %s watchlist items: %s", len(watchlist), watchlist)
                         return watchlist
                     else:
-                        logger.warning(f"Watchlist API returned status {response.status}")
+                        logger.warning("Watchlist API returned status %s", response.status)
                         response_text = await response.text()
-                        logger.warning(f"Watchlist API response: {response_text}")
+                        logger.warning("Watchlist API response: %s", response_text)
                         return []
         except Exception as e:
-            logger.error(f"Failed to fetch watchlist: {e}")
+            logger.error("Failed to fetch watchlist: %s", e)
             return []
 
 class NewsAggregator:
@@ -680,7 +737,7 @@ class NewsAggregator:
                 await asyncio.sleep(1)
                 
         except Exception as e:
-            logger.error(f"Failed to start news aggregator: {e}")
+            logger.error("Failed to start news aggregator: %s", e)
             raise
         finally:
             await self.db.close()
@@ -688,20 +745,20 @@ class NewsAggregator:
     async def _load_user_preferences(self):
         """Load user preferences for personalization"""
         try:
-            logger.info(f"Loading user preferences for user: {self.user_id}")
+            logger.info("Loading user preferences for user: %s", self.user_id)
             self.user_preferences = await self.user_prefs_api.fetch_user_preferences(self.user_id)
             
             if self.user_preferences:
-                logger.info(f"✅ User preferences loaded successfully")
-                logger.info(f"   Experience Level: {self.user_preferences.get('experience_level', 'N/A')}")
-                logger.info(f"   Risk Tolerance: {self.user_preferences.get('risk_tolerance', 'N/A')}")
-                logger.info(f"   Investment Style: {self.user_preferences.get('investment_style', 'N/A')}")
-                logger.info(f"   Preferred Sectors: {', '.join(self.user_preferences.get('preferred_sectors', []))}")
+                logger.info("✅ User preferences loaded successfully")
+                logger.info("   Experience Level: %s", self.user_preferences.get('experience_level', 'N/A'))
+                logger.info("   Risk Tolerance: %s", self.user_preferences.get('risk_tolerance', 'N/A'))
+                logger.info("   Investment Style: %s", self.user_preferences.get('investment_style', 'N/A'))
+                logger.info("   Preferred Sectors: %s", ', '.join(self.user_preferences.get('preferred_sectors', [])))
             else:
                 logger.warning("⚠️  No user preferences found, using default analysis")
                 
         except Exception as e:
-            logger.error(f"Failed to load user preferences: {e}")
+            logger.error("Failed to load user preferences: %s", e)
             self.user_preferences = None
     
     async def _run_scheduler(self):
@@ -715,7 +772,7 @@ class NewsAggregator:
                 await asyncio.sleep(30)
                 
             except Exception as e:
-                logger.error(f"Scheduler error: {e}")
+                logger.error("Scheduler error: %s", e)
                 await asyncio.sleep(10)  # Wait 10 seconds on error before retrying
     
     async def _process_news_batch(self):
@@ -725,16 +782,26 @@ class NewsAggregator:
             
             # Get all tickers we need to process (holdings + watchlist)
             portfolio_tickers = set()
-            watchlist_tickers = set()
             
-            # Fetch holdings from API
-            portfolios = await self.portfolio_api.fetch_portfolio(self.user_id)
+            # Fetch holdings and watchlist from the APIs concurrently
+            portfolios, watchlist_tickers = await asyncio.gather(
+                self.portfolio_api.fetch_portfolio(self.user_id),
+                self.portfolio_api.fetch_watchlist(self.user_id),
+                return_exceptions=True
+            )
+            if isinstance(portfolios, Exception):
+                logger.error("Failed to fetch portfolio: %s", portfolios)
+                portfolios = []
+            if isinstance(watchlist_tickers, Exception):
+                logger.error("Failed to fetch watchlist: %s", watchlist_tickers)
+                watchlist_tickers = []
+            
             if portfolios:
                 for portfolio in portfolios:
                     portfolio_tickers.add(portfolio.ticker)
                 # Cache holdings
                 await self.db.store_portfolio_cache(portfolios)
-                logger.info(f"Found {len(portfolios)} portfolio holdings")
+                logger.info("Found %s portfolio holdings", len(portfolios))
             else:
                 logger.warning("No portfolios found, using cached data")
                 cached_portfolios = await self.db.get_portfolios_from_cache()
@@ -746,12 +813,10 @@ class NewsAggregator:
                     logger.info("No cached portfolios, using test data")
                     portfolio_tickers = {'AAPL', 'GOOGL', 'MSFT', 'TSLA'}
             
-            # Fetch watchlist
-            watchlist_tickers = await self.portfolio_api.fetch_watchlist(self.user_id)
             if watchlist_tickers:
                 # Cache watchlist
                 await self.db.store_watchlist_cache(watchlist_tickers, self.user_id)
-                logger.info(f"Found {len(watchlist_tickers)} watchlist items")
+                logger.info("Found %s watchlist items", len(watchlist_tickers))
             else:
                 logger.warning("No watchlist found, using cached data")
                 cached_watchlist = await self.db.get_watchlist_from_cache(self.user_id)
@@ -769,37 +834,80 @@ class NewsAggregator:
                 logger.warning("No tickers available for news processing")
                 return
             
-            logger.info(f"Processing news for {len(all_tickers)} total tickers")
-            logger.info(f"Portfolio tickers: {', '.join(sorted(portfolio_tickers))}")
-            logger.info(f"Watchlist tickers: {', '.join(sorted(watchlist_tickers))}")
+            logger.info("Processing news for %s total tickers", len(all_tickers))
+            logger.info("Portfolio tickers: %s", ', '.join(sorted(portfolio_tickers)))
+            logger.info("Watchlist tickers: %s", ', '.join(sorted(watchlist_tickers)))
             
-            # Process news for portfolio tickers
-            for ticker in sorted(portfolio_tickers):
-                await self._process_news_for_ticker(ticker, 'portfolio')
-                await asyncio.sleep(1)  # Rate limiting
+            # Processing status is persisted, so fresh tickers are skipped across restarts too
+            fresh = await self.db.get_recently_processed(NEWS_REFRESH_SECONDS)
+            if fresh:
+                logger.info("Skipping %s tickers processed in the last %ss", len(fresh & all_tickers), NEWS_REFRESH_SECONDS)
             
-            # Process news for watchlist tickers
-            for ticker in sorted(watchlist_tickers):
-                await self._process_news_for_ticker(ticker, 'watchlist')
-                await asyncio.sleep(1)  # Rate limiting
+            # Process news for portfolio tickers, then watchlist tickers; a ticker that is both held and
+            # watched is one job, so its sources are processed in turn by the same worker
+            ticker_sources: Dict[str, List[str]] = {}
+            for ticker in sorted(portfolio_tickers - fresh):
+                ticker_sources.setdefault(ticker, []).append('portfolio')
+            for ticker in sorted(set(watchlist_tickers) - fresh):
+                ticker_sources.setdefault(ticker, []).append('watchlist')
+            await self._run_news_pipeline(list(ticker_sources.items()))
             
             logger.info("News batch processing completed")
             
         except Exception as e:
-            logger.error(f"News batch processing failed: {e}")
+            logger.error("News batch processing failed: %s", e)
             import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.error("Traceback: %s", traceback.format_exc())
     
-    async def _process_news_for_ticker(self, ticker: str, ticker_source: str = 'portfolio'):
-        """Process news for a specific ticker"""
+    async def _run_news_pipeline(self, ticker_jobs: List[tuple]):
+        """Fetch news for upcoming tickers while earlier tickers are processed by the LLM"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=NEWS_PREFETCH_DEPTH)
+        
+        async def fetch_news():
+            for ticker, ticker_sources in ticker_jobs:
+                news_items = await self.news_api.search_news(ticker, count=15)
+                await queue.put((ticker, ticker_sources, news_items))
+                await asyncio.sleep(1)  # Rate limiting
+            # One sentinel per worker so every consumer exits; the workers are still draining the queue
+            for _ in range(NEWS_PROCESSING_WORKERS):
+                await queue.put(None)
+        
+        async def process_news():
+            while True:
+                job = await queue.get()
+                if job is None:
+                    return
+                ticker, ticker_sources, news_items = job
+                # One source at a time, so the second skips the articles the first already stored
+                for ticker_source in ticker_sources:
+                    try:
+                        await self._process_news_for_ticker(ticker, ticker_source, news_items)
+                    except Exception as e:
+                        # One bad ticker must not stop the worker
+                        logger.error("News job for %s (%s) failed: %s", ticker, ticker_source, e)
+        
+        tasks = [asyncio.ensure_future(fetch_news())]
+        tasks += [asyncio.ensure_future(process_news()) for _ in range(NEWS_PROCESSING_WORKERS)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # If any side failed, the others would wait forever on the bounded queue
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _process_news_for_ticker(self, ticker: str, ticker_source: str = 'portfolio',
+                                       news_items: Optional[List[Dict[str, Any]]] = None):
+        """Process news for a specific ticker, fetching it first unless already prefetched"""
         try:
-            logger.info(f"Processing news for {ticker} (source: {ticker_source})")
+            logger.info("Processing news for %s (source: %s)", ticker, ticker_source)
             
             # Fetch news from API
-            news_items = await self.news_api.search_news(ticker, count=15)
+            if news_items is None:
+                news_items = await self.news_api.search_news(ticker, count=15)
             
             if not news_items:
-                logger.info(f"No news found for {ticker}")
+                logger.info("No news found for %s", ticker)
                 await self.db.update_processing_status(ticker, 0, 'completed', ticker_source)
                 return
             
@@ -848,10 +956,10 @@ class NewsAggregator:
                 await asyncio.sleep(0.5)
             
             await self.db.update_processing_status(ticker, processed_count, 'completed', ticker_source)
-            logger.info(f"Processed {processed_count} news items for {ticker} ({ticker_source})")
+            logger.info("Processed %s news items for %s (%s)", processed_count, ticker, ticker_source)
             
         except Exception as e:
-            logger.error(f"Failed to process news for {ticker}: {e}")
+            logger.error("Failed to process news for %s: %s", ticker, e)
             await self.db.update_processing_status(ticker, 0, 'error', ticker_source)
     
     def _generate_news_id(self, news_data: Dict[str, Any]) -> str:
@@ -862,6 +970,7 @@ class NewsAggregator:
     async def stop(self):
         """Stop the news aggregator service"""
         self.running = False
+        await self.news_api.close()
         logger.info("News aggregator service stopped")
 
 async def main():
@@ -873,7 +982,7 @@ async def main():
     except KeyboardInterrupt:
         logger.info("Received interrupt signal")
     except Exception as e:
-        logger.error(f"Service error: {e}")
+        logger.error("Service error: %s", e)
     finally:
         await aggregator.stop()
 
@@ -888,7 +997,10 @@ async def test_news_api():
         news_api = NewsAPI(api_key)
         print("🔍 Testing news API with GOOG...")
         
-        results = await news_api.search_news("GOOG", count=2)
+        try:
+            results = await news_api.search_news("GOOG", count=2)
+        finally:
+            await news_api.close()
         
         if results:
             print(f"✅ Success! Found {len(results)} news items")
@@ -3,77 +3,96 @@
 Asynchronous request processing for Porta Finance Assistant
 """
 
+import ast
 import asyncio
+import logging
+import re
 import time
-import threading
-import json
 from concurrent.futures import ThreadPoolExecutor
-from queue import Queue
+from functools import singledispatch
 from typing import Dict, Any
 
-from config import MAX_CONCURRENT_REQUESTS, MAX_STORED_REQUESTS
+from config import MAX_CONCURRENT_REQUESTS, MAX_STORED_REQUESTS, REQUEST_RETENTION_SECONDS
+from config import STREAM_BUFFER_SIZE, STREAM_SEND_TIMEOUT
+import json_utils
+from tools import prefetch_user_state, user_state_cached
 
 # Import shared variables from config
-from config import REQUEST_QUEUE, REQUEST_RESULTS, REQUEST_LOCK, ACTIVE_REQUESTS
+from config import REQUEST_QUEUE, REQUEST_RESULTS
 
 executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS)
 
+logger = logging.getLogger(__name__)
+
+# Start of a JSON array/object or Python list/dict repr, after optional whitespace
+_STRUCTURED_START = re.compile(r"\s*[\[{]")
+
+# Single -> double quote translation turning simple Python list reprs into JSON
+_QUOTE_SWAP = str.maketrans("'", '"')
+
+# Chat history roles passed through to the agent
+_VALID_ROLES = frozenset(("user", "assistant"))
+
+# Requests currently being processed by queue workers (only touched on the event loop)
+_active_requests = 0
+
+# Token queues for clients streaming a request's response, keyed by request_id
+RESPONSE_STREAMS: Dict[str, asyncio.Queue] = {}
+_STREAM_END = None
+
+# Running listing prefetches by user, held so they aren't garbage collected mid-flight and can be cancelled
+_PREFETCHES: Dict[str, asyncio.Task] = {}
+
+@singledispatch
 def clean_agent_response(result: Any) -> str:
     """
     Clean and normalize agent response to extract clean text content.
     Handles nested JSON strings and various response formats.
     """
-    print(f"[DEBUG] Raw agent result: {result}")
-    print(f"[DEBUG] Result type: {type(result)}")
-    
-    # Convert result to string first to handle all cases
-    result_str = str(result)
-    print(f"[DEBUG] Result as string: {result_str}")
-    
-    # Check if the result string contains JSON-like structures
-    if "'text':" in result_str or '"text":' in result_str:
-        print(f"[DEBUG] Detected text field in result string")
-        return _extract_text_from_nested_content(result_str)
-    
-    if isinstance(result, dict):
-        if "output" in result:
-            output = result["output"]
-            print(f"[DEBUG] Found 'output' field: {output}")
-            return _extract_text_from_nested_content(str(output))
-        elif "text" in result:
-            text = result["text"]
-            print(f"[DEBUG] Found 'text' field: {text}")
-            return _extract_text_from_nested_content(str(text))
-        elif "content" in result:
-            content = result["content"]
-            print(f"[DEBUG] Found 'content' field: {content}")
-            return _extract_text_from_nested_content(str(content))
-        else:
-            print(f"[DEBUG] No recognized fields, converting to string")
-            return _extract_text_from_nested_content(str(result))
+    logger.debug("Result is %s, converting to string", type(result))
+    return _extract_text_from_nested_content(_to_text(result))
+
+@clean_agent_response.register(str)
+def _clean_str_response(result: str) -> str:
+    # Plain strings go straight to the nested-content extractor
+    return _extract_text_from_nested_content(result)
+
+@clean_agent_response.register(dict)
+def _clean_dict_response(result: dict) -> str:
+    for field in ("output", "text", "content"):
+        if field in result:
+            logger.debug("Found '%s' field", field)
+            return clean_agent_response(result[field])
     
-    elif isinstance(result, list) and len(result) > 0:
-        first_item = result[0]
-        print(f"[DEBUG] First list item: {first_item}")
-        if isinstance(first_item, dict):
-            if "text" in first_item:
-                text = first_item["text"]
-                print(f"[DEBUG] Found 'text' in first item: {text}")
-                return _extract_text_from_nested_content(str(text))
-            elif "content" in first_item:
-                content = first_item["content"]
-                print(f"[DEBUG] Found 'content' in first item: {content}")
-                return _extract_text_from_nested_content(str(content))
-            else:
-                print(f"[DEBUG] No recognized fields in first item, converting to string")
-                return _extract_text_from_nested_content(str(first_item))
-        else:
-            print(f"[DEBUG] First item is not dict, converting to string")
-            return _extract_text_from_nested_content(str(first_item))
+    # An echoed agent input without an output indicates an agent configuration issue
+    if "input" in result and "chat_history" in result:
+        logger.warning("Result contains entire chat history, this indicates an agent configuration issue")
+        return "I apologize, but there was an issue processing your request. Please try again."
     
-    else:
-        print(f"[DEBUG] Result is not dict or list, converting to string")
-        return _extract_text_from_nested_content(str(result))
+    logger.debug("No recognized fields, converting to string")
+    return _extract_text_from_nested_content(_to_text(result))
+
+@clean_agent_response.register(list)
+def _clean_list_response(result: list) -> str:
+    if result:
+        logger.debug("Using first list item")
+        return clean_agent_response(result[0])
+    return _extract_text_from_nested_content(_to_text(result))
+
+def _to_text(value: Any) -> str:
+    """Stringify a value, serializing dicts/lists as JSON rather than Python repr"""
+    if isinstance(value, (dict, list)):
+        return json_utils.dumps(value)
+    return str(value)
+
+def _first_text(parsed: Any) -> str:
+    """Pick the text out of parsed content: a list's first item, or a dict's 'text' field"""
+    if isinstance(parsed, list) and parsed:
+        item = parsed[0]
+        return item["text"] if isinstance(item, dict) and "text" in item else str(item)
+    if isinstance(parsed, dict) and "text" in parsed:
+        return parsed["text"]
+    return str(parsed)
 
 def _extract_text_from_nested_content(text_content: str) -> str:
     """
@@ -82,187 +101,306 @@ def _extract_text_from_nested_content(text_content: str) -> str:
     if not isinstance(text_content, str):
         text_content = str(text_content)
     
-    print(f"[DEBUG] Extracting text from: {text_content}")
+    logger.debug("Extracting text from: %s", text_content)
     
-    # First, try to handle the case where the content looks like a Python repr of a list
-    # This handles cases like "[{'text': '...', 'type': 'text', 'index': 0}]"
-    if text_content.startswith("[{") and text_content.endswith("}]"):
-        print(f"[DEBUG] Detected Python repr of list, trying to extract text")
+    # Plain text (the common case) can't be JSON or a Python literal
+    if not text_content:
+        return text_content
+    first_char = text_content[0]
+    if first_char not in "[{" and not (first_char.isspace() and _STRUCTURED_START.match(text_content)):
+        return text_content
+    
+    # Python repr of a list like "[{'text': '...', 'type': 'text', 'index': 0}]"
+    if text_content.startswith("[{") and text_content.endswith("}]") and "'" in text_content:
+        # With no double quotes or escapes in the repr, swapping quotes yields valid JSON
+        if '"' not in text_content and "\\" not in text_content:
+            try:
+                return _first_text(json_utils.loads(text_content.translate(_QUOTE_SWAP)))
+            except json_utils.JSONDecodeError as e:
+                logger.debug("Quote-swapped JSON parsing failed: %s, trying ast.literal_eval", e)
         try:
-            # Try to evaluate it as Python literal (safer than eval)
-            import ast
-            parsed_content = ast.literal_eval(text_content)
-            print(f"[DEBUG] Successfully parsed with ast.literal_eval: {parsed_content}")
-            
-            if isinstance(parsed_content, list) and len(parsed_content) > 0:
-                first_item = parsed_content[0]
-                print(f"[DEBUG] First parsed item: {first_item}")
-                if isinstance(first_item, dict) and "text" in first_item:
-                    final_text = first_item["text"]
-                    print(f"[DEBUG] Extracted final text: {final_text}")
-                    return final_text
-                else:
-                    final_text = str(first_item)
-                    print(f"[DEBUG] Converted first item to string: {final_text}")
-                    return final_text
-            else:
-                final_text = str(parsed_content)
-                print(f"[DEBUG] Converted parsed content to string: {final_text}")
-                return final_text
+            # Evaluate it as a Python literal (safer than eval)
+            return _first_text(ast.literal_eval(text_content))
         except (ValueError, SyntaxError) as e:
-            print(f"[DEBUG] ast.literal_eval failed: {e}, trying JSON parsing")
+            logger.debug("ast.literal_eval failed: %s, trying JSON parsing", e)
     
-    # Check if it looks like a JSON string
+    # JSON array or object
     text_content = text_content.strip()
     if (text_content.startswith('[') and text_content.endswith(']')) or \
        (text_content.startswith('{') and text_content.endswith('}')):
         try:
-            parsed_content = json.loads(text_content)
-            print(f"[DEBUG] Successfully parsed JSON: {parsed_content}")
-            
-            if isinstance(parsed_content, list) and len(parsed_content) > 0:
-                first_item = parsed_content[0]
-                print(f"[DEBUG] First parsed item: {first_item}")
-                if isinstance(first_item, dict) and "text" in first_item:
-                    final_text = first_item["text"]
-                    print(f"[DEBUG] Extracted final text: {final_text}")
-                    return final_text
-                else:
-                    final_text = str(first_item)
-                    print(f"[DEBUG] Converted first item to string: {final_text}")
-                    return final_text
-            elif isinstance(parsed_content, dict) and "text" in parsed_content:
-                final_text = parsed_content["text"]
-                print(f"[DEBUG] Extracted text from dict: {final_text}")
-                return final_text
-            else:
-                final_text = str(parsed_content)
-                print(f"[DEBUG] Converted parsed content to string: {final_text}")
-                return final_text
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"[DEBUG] JSON parsing failed: {e}, trying ast.literal_eval")
+            return _first_text(json_utils.loads(text_content))
+        except json_utils.JSONDecodeError as e:
+            logger.debug("JSON parsing failed: %s", e)
+        
+        # Python repr of a dict or list that isn't valid JSON
+        if "'" in text_content:
             try:
-                import ast
-                parsed_content = ast.literal_eval(text_content)
-                print(f"[DEBUG] Successfully parsed with ast.literal_eval: {parsed_content}")
-                
-                if isinstance(parsed_content, list) and len(parsed_content) > 0:
-                    first_item = parsed_content[0]
-                    if isinstance(first_item, dict) and "text" in first_item:
-                        return first_item["text"]
-                    else:
-                        return str(first_item)
-                elif isinstance(parsed_content, dict) and "text" in parsed_content:
-                    return parsed_content["text"]
-                else:
-                    return str(parsed_content)
-            except (ValueError, SyntaxError) as e2:
-                print(f"[DEBUG] ast.literal_eval also failed: {e2}")
+                return _first_text(ast.literal_eval(text_content))
+            except (ValueError, SyntaxError) as e:
+                logger.debug("ast.literal_eval also failed: %s", e)
     
-    print(f"[DEBUG] No JSON detected, returning original content: {text_content}")
+    logger.debug("No JSON detected, returning original content")
     return text_content
 
+def _start_prefetch(user_id: str):
+    """Prefetch the user's listings unless they are already cached or being fetched"""
+    if user_id in _PREFETCHES or user_state_cached(user_id):
+        return
+    prefetch = asyncio.ensure_future(prefetch_user_state(user_id))
+    _PREFETCHES[user_id] = prefetch
+    prefetch.add_done_callback(lambda done: _prefetch_done(user_id, done))
+
+def _prefetch_done(user_id: str, prefetch: asyncio.Task):
+    """Forget a finished prefetch, retrieving its exception so it isn't reported as unhandled"""
+    if _PREFETCHES.get(user_id) is prefetch:
+        del _PREFETCHES[user_id]
+    if not prefetch.cancelled() and prefetch.exception() is not None:
+        logger.debug("Prefetch for user %s failed: %s", user_id, prefetch.exception())
+
+def _mark_processing(request_id: str):
+    """Flag a request as picked up by a worker"""
+    REQUEST_RESULTS.update(request_id, status="processing")
+    REQUEST_QUEUE.mark_status(request_id, "processing")
+
+def _record_error(request_id: str, error_msg: str) -> Dict[str, Any]:
+    """Store an error result for a request"""
+    REQUEST_RESULTS.update(
+        request_id,
+        status="error",
+        error=error_msg,
+        completed_at_ts=time.time()
+    )
+    REQUEST_QUEUE.mark_status(request_id, "error")
+    return {"status": "error", "error": error_msg}
+
+def _record_response(request_id: str, result: Any) -> Dict[str, Any]:
+    """Clean the agent result and store it as the request's response"""
+    # Handle response format using the utility function
+    response_text = clean_agent_response(result)
+    
+    # Ensure response is string
+    if not isinstance(response_text, str):
+        response_text = str(response_text)
+    
+    return _store_response(request_id, response_text)
+
+def _store_response(request_id: str, response_text: str) -> Dict[str, Any]:
+    """Store a cleaned response text as the request's result"""
+    # Update results
+    REQUEST_RESULTS.update(
+        request_id,
+        status="completed",
+        response=response_text,
+        completed_at_ts=time.time()
+    )
+    
+    # Cleanup old requests
+    REQUEST_RESULTS.evict_finished(MAX_STORED_REQUESTS)
+    REQUEST_QUEUE.mark_status(request_id, "completed")
+    
+    return {"status": "success", "response": response_text}
+
+def _build_agent_input(request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the agent input from a queued request"""
+    # Convert chat history - keep only user/assistant turns
+    history = [
+        {"role": role, "content": msg.get("content", "")}
+        for msg in request_data["chat_history"]
+        if (role := msg.get("role")) in _VALID_ROLES
+    ]
+    return {
+        "input": request_data["message"],
+        "chat_history": history
+    }
+
+_agent_getter = None
+
+def _get_agent():
+    """Get the shared agent, resolving api_routes.get_agent once (it imports this module)"""
+    global _agent_getter
+    if _agent_getter is None:
+        from api_routes import get_agent
+        _agent_getter = get_agent
+    return _agent_getter()
+
 def process_request_sync(request_data: Dict[str, Any]) -> Dict[str, Any]:
     """Process a single request synchronously"""
-    import config
-    
     request_id = request_data["request_id"]
-    message = request_data["message"]
-    user_id = request_data["user_id"]
-    chat_history = request_data["chat_history"]
     
     try:
-        with config.REQUEST_LOCK:
-            config.REQUEST_RESULTS[request_id]["status"] = "processing"
+        _mark_processing(request_id)
         
         # Get agent with error handling
         try:
-            from api_routes import get_agent
-            agent = get_agent()
+            agent = _get_agent()
         except Exception as e:
-            error_msg = f"AI agent not ready: {str(e)}"
-            with config.REQUEST_LOCK:
-                config.REQUEST_RESULTS[request_id].update({
-                    "status": "error",
-                    "error": error_msg,
-                    "completed_at": time.strftime("%Y-%m-%d %H:%M:%S")
-                })
-            return {"status": "error", "error": error_msg}
-        
-        # Convert chat history
-        history = []
-        for msg in chat_history:
-            if msg.get("role") == "user":
-                history.append({"role": "user", "content": msg.get("content", "")})
-            elif msg.get("role") == "assistant":
-                history.append({"role": "assistant", "content": msg.get("content", "")})
+            return _record_error(request_id, f"AI agent not ready: {str(e)}")
         
         # Invoke agent
-        result = agent.invoke({
-            "input": message,
-            "chat_history": history
-        })
+        result = agent.invoke(_build_agent_input(request_data))
         
-        # Handle response format using the utility function
-        response_text = clean_agent_response(result)
+        return _record_response(request_id, result)
         
-        # Ensure response is string
-        if not isinstance(response_text, str):
-            response_text = str(response_text)
+    except Exception as e:
+        logger.exception("Error in request %s", request_id)
+        return _record_error(request_id, f"Error processing request: {e}")
+
+async def process_request_async(request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Process a request on the event loop"""
+    # Never merged with an identical message in flight: a chat turn can call write tools, and each one must run
+    return await _invoke_agent_async(request_data)
+
+async def _invoke_agent_async(request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Process a single request on the event loop using the agent's native async API"""
+    request_id = request_data["request_id"]
+    
+    try:
+        # Get agent with error handling
+        try:
+            agent = _get_agent()
+        except Exception as e:
+            _mark_processing(request_id)
+            return _record_error(request_id, f"AI agent not ready: {str(e)}")
         
-        # Update results
-        with config.REQUEST_LOCK:
-            config.REQUEST_RESULTS[request_id].update({
-                "status": "completed",
-                "response": response_text,
-                "completed_at": time.strftime("%Y-%m-%d %H:%M:%S")
-            })
-            
-            # Cleanup old requests
-            if len(config.REQUEST_RESULTS) > MAX_STORED_REQUESTS:
-                old_requests = [
-                    rid for rid, data in config.REQUEST_RESULTS.items()
-                    if data["status"] in ["completed", "error"]
-                ]
-                if len(old_requests) > MAX_STORED_REQUESTS // 2:
-                    for rid in old_requests[:len(old_requests) - MAX_STORED_REQUESTS // 2]:
-                        config.REQUEST_RESULTS.pop(rid, None)
+        # Fall back to the thread pool for agents without an async API
+        if not hasattr(agent, "ainvoke"):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, process_request_sync, request_data)
         
-        return {"status": "success", "response": response_text}
+        _mark_processing(request_id)
         
-    except Exception as e:
-        error_msg = f"Error processing request: {str(e)}"
-        print(f"Error in request {request_id}: {error_msg}")
+        # Fetch the user's listings alongside the first model call; the agent usually asks for them next
+        _start_prefetch(request_data["user_id"])
         
-        with config.REQUEST_LOCK:
-            config.REQUEST_RESULTS[request_id].update({
-                "status": "error",
-                "error": error_msg,
-                "completed_at": time.strftime("%Y-%m-%d %H:%M:%S")
-            })
+        # Invoke agent, streaming model output when the client asked for it
+        agent_input = _build_agent_input(request_data)
+        if request_data.get("stream") and hasattr(agent, "astream_events"):
+            result = await _stream_agent(agent, agent_input, request_id)
+        else:
+            result = await agent.ainvoke(agent_input)
+        
+        return _record_response(request_id, result)
         
-        return {"status": "error", "error": error_msg}
+    except Exception as e:
+        logger.exception("Error in request %s", request_id)
+        return _record_error(request_id, f"Error processing request: {e}")
 
-async def process_request_queue():
-    """Background task to process queued requests"""
-    import config
+async def _stream_agent(agent, agent_input: Dict[str, Any], request_id: str) -> Any:
+    """Run the agent through astream_events, publishing model text to the request's stream"""
+    result = None
+    async for event in agent.astream_events(agent_input, version="v2"):
+        kind = event["event"]
+        if kind == "on_chat_model_stream":
+            text = _chunk_text(event["data"]["chunk"].content)
+            if text:
+                await _publish_token(request_id, text)
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            # End of the root run carries the agent's final output
+            result = event["data"].get("output")
+    return result
+
+def _chunk_text(content: Any) -> str:
+    """Text of a streamed message chunk; Anthropic chunks may be lists of content blocks"""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block.get("text", "")
+        for block in content
+        if isinstance(block, dict) and block.get("type") == "text"
+    )
+
+def open_response_stream(request_id: str):
+    """Register a token queue for a request's response, or None if it is already being streamed"""
+    if request_id in RESPONSE_STREAMS:
+        return None
+    stream = RESPONSE_STREAMS[request_id] = asyncio.Queue(maxsize=STREAM_BUFFER_SIZE)
+    return stream
+
+async def _publish_token(request_id: str, text: str):
+    """Hand a token to the request's streaming client, dropping clients that stop reading"""
+    stream = RESPONSE_STREAMS.get(request_id)
+    if stream is None:
+        return
+    try:
+        await asyncio.wait_for(stream.put(text), STREAM_SEND_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Streaming client for request %s stalled, closing stream", request_id)
+        _close_response_stream(request_id)
+
+def _close_response_stream(request_id: str):
+    """Signal the end of a request's token stream"""
+    stream = RESPONSE_STREAMS.pop(request_id, None)
+    if stream is None:
+        return
+    # Make room for the end marker if the client has fallen behind
+    while stream.full():
+        stream.get_nowait()
+    stream.put_nowait(_STREAM_END)
+
+def active_request_count() -> int:
+    """Number of queued requests currently being processed"""
+    return _active_requests
+
+async def _request_worker():
+    """Take requests off the queue and process them one at a time"""
+    global _active_requests
     
+    while True:
+        request_data = await REQUEST_QUEUE.get()
+        _active_requests += 1
+        try:
+            await process_request_async(request_data)
+        except Exception:
+            logger.exception("Error in request queue worker")
+        finally:
+            _close_response_stream(request_data["request_id"])
+            _active_requests -= 1
+            REQUEST_QUEUE.task_done()
+
+async def process_request_queue():
+    """Background task to process queued requests with MAX_CONCURRENT_REQUESTS workers"""
+    await asyncio.gather(*(_request_worker() for _ in range(MAX_CONCURRENT_REQUESTS)))
+
+def restore_pending_requests() -> int:
+    """Reload requests left queued or processing by a previous run"""
+    restored, rejected = REQUEST_QUEUE.restore_pending()
+    for request_data in rejected:
+        # Still reported to clients polling for it, rather than disappearing
+        request_id = request_data["request_id"]
+        REQUEST_RESULTS.set(request_id, {
+            "request_id": request_id,
+            "status": "error",
+            "response": None,
+            "user_id": request_data["user_id"],
+            "error": "Request could not be restored after a restart: the request queue was full",
+            "created_at_ts": request_data["created_at_ts"],
+            "completed_at_ts": time.time()
+        })
+    for request_data in restored:
+        request_id = request_data["request_id"]
+        REQUEST_RESULTS.set(request_id, {
+            "request_id": request_id,
+            "status": "queued",
+            "response": None,
+            "user_id": request_data["user_id"],
+            "error": None,
+            "created_at_ts": request_data["created_at_ts"],
+            "completed_at_ts": None
+        })
+    return len(restored)
+
+async def close_request_store():
+    """Cancel running prefetches, then flush the persistent queue's pending writes and close its database"""
+    for prefetch in list(_PREFETCHES.values()):
+        prefetch.cancel()
+    await asyncio.to_thread(REQUEST_QUEUE.close)
+
+async def cleanup_request_store():
+    """Background task to purge finished requests from the persistent queue"""
     while True:
         try:
-            with config.REQUEST_LOCK:
-                if config.ACTIVE_REQUESTS < MAX_CONCURRENT_REQUESTS and not config.REQUEST_QUEUE.empty():
-                    request_data = config.REQUEST_QUEUE.get_nowait()
-                    config.ACTIVE_REQUESTS += 1
-                else:
-                    await asyncio.sleep(0.1)
-                    continue
-            
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(executor, process_request_sync, request_data)
-            
-            with config.REQUEST_LOCK:
-                config.ACTIVE_REQUESTS -= 1
-                
+            await asyncio.to_thread(REQUEST_QUEUE.purge_finished, REQUEST_RETENTION_SECONDS)
         except Exception as e:
-            print(f"Error in request queue processor: {e}")
-            await asyncio.sleep(1)
+            logger.error("Error cleaning up request store: %s", e)
+        await asyncio.sleep(REQUEST_RETENTION_SECONDS / 4)
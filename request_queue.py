@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Request queue and result storage for Porta Finance Assistant
+Mirrors queued async chat requests to SQLite so they survive restarts
+"""
+
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import json_utils
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+FINISHED_STATUSES = frozenset(("completed", "error"))
+
+# Most recently formatted (second, string) pair; consecutive calls usually land in the same second
+_last_formatted = (None, "")
+
+def format_timestamp(epoch: Optional[float] = None) -> str:
+    """Format an epoch time (default: now) as a UTC request timestamp"""
+    global _last_formatted
+    second = int(time.time() if epoch is None else epoch)
+    cached_second, formatted = _last_formatted
+    if second != cached_second:
+        formatted = time.strftime(TIMESTAMP_FORMAT, time.gmtime(second))
+        _last_formatted = (second, formatted)
+    return formatted
+
+class PersistentRequestQueue(asyncio.Queue):
+    """Event-loop request queue backed by a SQLite table of request payloads and statuses
+
+    Writes are handed to a writer thread that commits everything waiting in one transaction,
+    so the event loop never blocks on SQLite. The database and the writer are only opened on first use,
+    so importing config doesn't touch the disk or start a thread.
+    """
+
+    def __init__(self, db_path: str, maxsize: int = 0):
+        super().__init__(maxsize)
+        self._db_path = db_path
+        self._db_lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # Pending (sql, params) writes in submission order; None stops the writer
+        self._writes: "queue.SimpleQueue[Optional[Tuple[str, tuple]]]" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the database and start the writer thread on first use"""
+        with self._open_lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self._db_path, check_same_thread=False)
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS request_queue (
+                        request_id TEXT PRIMARY KEY,
+                        payload TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        completed_at REAL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_request_queue_status ON request_queue(status)")
+                conn.commit()
+                self._conn = conn
+                self._writer = threading.Thread(target=self._write_loop, args=(conn,), name="request-queue-writer", daemon=True)
+                self._writer.start()
+            return self._conn
+
+    def _write(self, sql: str, params: tuple = ()):
+        """Queue a write for the writer thread"""
+        self._connection()
+        self._writes.put((sql, params))
+
+    def _write_loop(self, conn: sqlite3.Connection):
+        """Commit queued writes, batching whatever piled up while the previous commit ran"""
+        while True:
+            batch = [self._writes.get()]
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            statements = [write for write in batch if write is not None]
+            if statements:
+                with self._db_lock:
+                    try:
+                        for sql, params in statements:
+                            conn.execute(sql, params)
+                        conn.commit()
+                    except sqlite3.Error:
+                        conn.rollback()
+                        logger.exception("Failed to persist %d request queue writes", len(statements))
+            if len(statements) < len(batch):
+                return
+
+    def put_nowait(self, item: Dict[str, Any]):
+        """Queue the request's row for the writer thread and hand the request to the in-memory queue"""
+        if self.full():
+            raise asyncio.QueueFull
+        self._write(
+            "INSERT OR REPLACE INTO request_queue (request_id, payload, status, created_at) VALUES (?, ?, 'queued', ?)",
+            (item["request_id"], json_utils.dumps(item), time.time())
+        )
+        super().put_nowait(item)
+
+    def mark_status(self, request_id: str, status: str):
+        """Record a status change; terminal statuses are timestamped for later cleanup"""
+        completed_at = time.time() if status in FINISHED_STATUSES else None
+        self._write(
+            "UPDATE request_queue SET status = ?, completed_at = ? WHERE request_id = ?",
+            (status, completed_at, request_id)
+        )
+
+    def restore_pending(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Re-enqueue requests that were queued or processing when the process stopped
+
+        Returns (restored, rejected); rejected requests didn't fit in the queue and are marked as errors.
+        """
+        conn = self._connection()
+        with self._db_lock:
+            rows = conn.execute(
+                "SELECT payload, created_at FROM request_queue WHERE status IN ('queued', 'processing') ORDER BY created_at"
+            ).fetchall()
+        self._write("UPDATE request_queue SET status = 'queued' WHERE status = 'processing'")
+
+        restored, rejected = [], []
+        for payload, created_at in rows:
+            request_data = json_utils.loads(payload)
+            request_data["created_at_ts"] = created_at
+            if self.full():
+                self.mark_status(request_data["request_id"], "error")
+                rejected.append(request_data)
+                continue
+            super().put_nowait(request_data)
+            restored.append(request_data)
+        return restored, rejected
+
+    def purge_finished(self, max_age_seconds: float) -> int:
+        """Delete completed/errored requests older than max_age_seconds"""
+        cutoff = time.time() - max_age_seconds
+        conn = self._connection()
+        with self._db_lock:
+            cursor = conn.execute(
+                "DELETE FROM request_queue WHERE status IN ('completed', 'error') AND completed_at < ?",
+                (cutoff,)
+            )
+            conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        """Wait for queued writes to be committed, then close the database"""
+        with self._open_lock:
+            if self._conn is None:
+                return
+            self._writes.put(None)
+            self._writer.join()
+            with self._db_lock:
+                self._conn.close()
+            self._conn = self._writer = None
+
+class ShardedResults:
+    """Request results split across shards; per-request reads and writes rely on GIL-atomic dict operations"""
+
+    def __init__(self, num_shards: int = 16):
+        if num_shards & (num_shards - 1):
+            raise ValueError("num_shards must be a power of two")
+        self._mask = num_shards - 1
+        self._shards: List[Dict[str, Dict[str, Any]]] = [{} for _ in range(num_shards)]
+        # Only whole-shard scans and eviction take a shard lock
+        self._locks = [threading.Lock() for _ in range(num_shards)]
+        # Finished request ids in completion order, oldest first; the sync fallback updates results from
+        # executor threads, so every change to it holds its own lock
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+        self._finished_lock = threading.Lock()
+
+    def _index(self, request_id: str) -> int:
+        return hash(request_id) & self._mask
+
+    def __contains__(self, request_id: str) -> bool:
+        return request_id in self._shards[self._index(request_id)]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def set(self, request_id: str, data: Dict[str, Any]):
+        """Store the full result record for a request"""
+        self._shards[self._index(request_id)][request_id] = data
+        with self._finished_lock:
+            self._finished.pop(request_id, None)
+            if data.get("status") in FINISHED_STATUSES:
+                self._finished[request_id] = None
+
+    def update(self, request_id: str, **fields):
+        """Merge fields into a request's result record"""
+        # Each request is updated by the single worker processing it
+        data = self._shards[self._index(request_id)].setdefault(request_id, {})
+        was_finished = data.get("status") in FINISHED_STATUSES
+        data.update(fields)
+        if not was_finished and data.get("status") in FINISHED_STATUSES:
+            with self._finished_lock:
+                self._finished[request_id] = None
+                self._finished.move_to_end(request_id)
+
+    def get(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """Get a copy of a request's result record"""
+        data = self._shards[self._index(request_id)].get(request_id)
+        return dict(data) if data is not None else None
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Copy all result records, oldest first"""
+        records = []
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                records.extend(dict(data) for data in list(shard.values()))
+        records.sort(key=lambda data: data.get("created_at_ts") or 0)
+        return records
+
+    def evict_finished(self, max_stored: int):
+        """Once more than max_stored requests are held, drop the oldest finished ones down to half that"""
+        if len(self) <= max_stored:
+            return
+        keep = max_stored // 2
+        while len(self) > keep:
+            with self._finished_lock:
+                if not self._finished:
+                    break
+                rid, _ = self._finished.popitem(last=False)
+            i = self._index(rid)
+            with self._locks[i]:
+                self._shards[i].pop(rid, None)
@@ -3,870 +3,1482 @@
 Simple sync LangChain tools for Porta Finance Assistant
 """
 
+import asyncio
+import atexit
+import logging
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+from decimal import Decimal
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache, wraps
+from itertools import chain, islice
+from statistics import fmean, quantiles
 from typing import Optional, List, Dict, Any
+from urllib.parse import quote, urlencode, urlsplit
 from langchain.tools import tool # type: ignore
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from config import DEFAULT_USER_ID, DOC_CACHE, WATCHLIST_API_URL, PORTFOLIO_API_URL, WEB_SEARCH_API_URL, USER_PREFERENCES_API_URL, USER_INTERACTIONS_API_URL, PREFERENCE_HISTORY_API_URL
+try:
+    import httpx # type: ignore
+except ImportError:
+    httpx = None
+
+import json_utils
+from config import DEFAULT_USER_ID, WATCHLIST_API_URL, PORTFOLIO_API_URL, WEB_SEARCH_API_URL, USER_PREFERENCES_API_URL, USER_INTERACTIONS_API_URL, PREFERENCE_HISTORY_API_URL
+from config import LIST_CACHE_TTL, SUMMARY_CACHE_TTL, PREFERENCE_CACHE_TTL, WEB_SEARCH_CACHE_TTL, FILTERED_DELETE_ENABLED
 from models import (
     AddPortfolioInput, RemovePortfolioInput, ListPortfolioInput, GetPortfolioSummaryInput,
-    AddWatchlistInput, RemoveWatchlistInput, ListWatchlistInput, GetWatchlistEntryInput,
+    AddWatchlistInput, AddManyWatchlistInput, WatchlistItemInput, RemoveWatchlistInput, RemoveManyWatchlistInput, ListWatchlistInput, GetWatchlistEntryInput, GetUserSnapshotInput,
     WebSearchInput, StressTestInput, UserPreferencesInput, GetUserPreferencesInput, 
     ListUserPreferencesInput, UserInteractionInput, GetUserInteractionsInput, GetPreferenceHistoryInput
 )
 
-# ====== Portfolio Tools ======
-@tool("add_to_portfolio", args_schema=AddPortfolioInput)
-def add_to_portfolio(user_id: str = DEFAULT_USER_ID, ticker: str = "",
-                     quantity: str = "", buy_price: str = "", note: Optional[str] = None):
-    """Add or upsert a holding in the user's portfolio by calling the portfolio API."""
+logger = logging.getLogger(__name__)
+
+class _JitteredRetry(Retry):
+    """urllib3 Retry with full-jitter backoff so concurrent callers don't retry in lockstep"""
+
+    def get_backoff_time(self) -> float:
+        return random.uniform(0, super().get_backoff_time())
+
+# Retry idempotent calls on connection errors and gateway failures; POSTs are retried only when the
+# connection itself failed, since the request was never sent and can't be applied twice
+_RETRY_TOTAL = 3
+_RETRY_BACKOFF = 0.25
+_RETRY_STATUSES = (502, 503, 504)
+_RETRY_METHODS = frozenset(["GET", "DELETE"])
+_RETRIES = _JitteredRetry(
+    total=_RETRY_TOTAL,
+    backoff_factor=_RETRY_BACKOFF,
+    status_forcelist=_RETRY_STATUSES,
+    allowed_methods=_RETRY_METHODS,
+    respect_retry_after_header=True,
+    raise_on_status=False
+)
+# A healthy backend accepts connections almost at once, so give up on a connect quickly and leave
+# the rest of the call's budget for a retry
+_CONNECT_TIMEOUT = 2.0
+
+# Shared session so repeated calls to the backend APIs reuse pooled keep-alive connections
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=_RETRIES)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+# close_http_clients covers server shutdown; this covers scripts that import the tools directly
+atexit.register(_SESSION.close)
+
+# Shared async client for the async tool variants, created inside the running loop because its
+# connections belong to the loop that opened them
+_ACLIENT = None
+_ACLIENT_LOOP = None
+
+def _get_async_client():
+    """Get the shared async client, creating it on first use in the running loop"""
+    global _ACLIENT, _ACLIENT_LOOP, _ABULKHEADS
+    loop = asyncio.get_running_loop()
+    if _ACLIENT_LOOP is not loop:
+        # Semaphores bind to the loop that first waits on them, so each loop gets its own bulkheads
+        _ABULKHEADS = {base_url: asyncio.Semaphore(limit) for base_url, limit in _BULKHEAD_LIMITS.items()}
+    if _ACLIENT is None or _ACLIENT.is_closed or _ACLIENT_LOOP is not loop:
+        limits = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        # HTTP/2 needs the optional h2 package
+        try:
+            transport = httpx.AsyncHTTPTransport(http2=True, limits=limits, retries=3)
+        except ImportError:
+            transport = httpx.AsyncHTTPTransport(limits=limits, retries=3)
+        # Transport retries only cover failed connection attempts, so they are safe for any method;
+        # gateway failures are retried in _arequest_with_retries
+        _ACLIENT = httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(10.0, connect=_CONNECT_TIMEOUT))
+        _ACLIENT_LOOP = loop
+    return _ACLIENT
+
+def _parse_json(response) -> Any:
+    """Decode a response body with the fastest available JSON parser"""
+    return json_utils.loads(response.content)
+
+class _CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a backend whose circuit breaker is open"""
+
+class _BulkheadFullError(Exception):
+    """Raised instead of calling a backend that already has its maximum calls in flight
+
+    Not a connection error: the backend may be fine, so this neither serves stale data nor reports an outage.
+    """
+
+class _CircuitBreaker:
+    """Fail fast after repeated failures of a backend, letting one probe through after a cool-down"""
+
+    def __init__(self, failure_threshold: int = 5, recovery_time: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go through (closed, or half-open with no probe in flight)"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.recovery_time:
+                return False
+            # Half-open: restart the cool-down so only this caller probes the backend
+            self._opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Circuit opened after %s consecutive backend failures", self._failures)
+                self._opened_at = time.monotonic()
+
+_PORTFOLIO_BASE = PORTFOLIO_API_URL.rstrip('/')
+_WATCHLIST_BASE = WATCHLIST_API_URL.rstrip('/')
+_WEB_SEARCH_BASE = WEB_SEARCH_API_URL.rstrip('/')
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# Distinct scheme://host:port of the tool backends, for warming connections at startup
+_BACKEND_ORIGINS = sorted({"{0.scheme}://{0.netloc}".format(urlsplit(url))
+                           for url in (PORTFOLIO_API_URL, WATCHLIST_API_URL, WEB_SEARCH_API_URL)})
+
+# One breaker per backend; failures are counted after the session's retries are exhausted
+_BREAKERS = {
+    _PORTFOLIO_BASE: _CircuitBreaker(),
+    _WATCHLIST_BASE: _CircuitBreaker(),
+    _WEB_SEARCH_BASE: _CircuitBreaker(),
+}
+
+# Cap concurrent calls per backend so one slow service can't tie up every worker thread
+_BULKHEAD_LIMITS = {
+    _PORTFOLIO_BASE: 8,
+    _WATCHLIST_BASE: 8,
+    _WEB_SEARCH_BASE: 4,
+}
+_BULKHEADS = {base_url: threading.BoundedSemaphore(limit) for base_url, limit in _BULKHEAD_LIMITS.items()}
+_ABULKHEADS: Dict[str, "asyncio.Semaphore"] = {}  # Built for the running loop by _get_async_client
+# A call queues for a free slot for up to this share of its timeout before reporting the backend as busy,
+# then gets what is left of its timeout for the request itself
+_BULKHEAD_WAIT_SHARE = 0.8
+_DEFAULT_REQUEST_TIMEOUT = 10.0  # budget assumed for calls that don't pass a timeout
+# Fan-out tools stay well inside a backend's bulkhead so concurrent chats still get slots
+_FANOUT_WORKERS = min(_BULKHEAD_LIMITS.values()) // 2
+
+def _acquire_bulkhead_wait(kwargs: Dict[str, Any]) -> float:
+    """How long a call may wait for a bulkhead slot, given its request kwargs"""
+    timeout = kwargs.get("timeout")
+    budget = timeout if isinstance(timeout, (int, float)) else _DEFAULT_REQUEST_TIMEOUT
+    return budget * _BULKHEAD_WAIT_SHARE
+
+def _spend_timeout(kwargs: Dict[str, Any], waited: float):
+    """Take the time spent waiting for a bulkhead slot out of a numeric request timeout"""
+    timeout = kwargs.get("timeout")
+    if isinstance(timeout, (int, float)):
+        kwargs["timeout"] = max(0.1, timeout - waited)
+
+def _for_backend(table: Dict[str, Any], url: str) -> Any:
+    """Look up the per-backend entry whose base URL prefixes url"""
+    for base_url, value in table.items():
+        if url.startswith(base_url):
+            return value
+    return None
+
+def _breaker_for(url: str) -> Optional[_CircuitBreaker]:
+    return _for_backend(_BREAKERS, url)
+
+def _backend_request(method: str, url: str, **kwargs):
+    """Send a request through the shared session within the backend's bulkhead"""
+    bulkhead = _for_backend(_BULKHEADS, url)
+    if bulkhead is not None:
+        started = time.monotonic()
+        if not bulkhead.acquire(timeout=_acquire_bulkhead_wait(kwargs)):
+            raise _BulkheadFullError(f"Too many concurrent calls to {url}")
+        _spend_timeout(kwargs, time.monotonic() - started)
     try:
-        print(f"[LOG] add_to_portfolio called with user_id={user_id}, ticker={ticker}, quantity={quantity}, buy_price={buy_price}, note={note}")
-        
-        # Validate inputs
-        if not ticker or not ticker.strip():
-            return {"ok": False, "error": "Ticker cannot be empty"}
-        
-        if not user_id or not user_id.strip():
-            return {"ok": False, "error": "User ID cannot be empty"}
-        
-        if not quantity or not quantity.strip():
-            return {"ok": False, "error": "Quantity cannot be empty. Please specify the number of shares."}
-        
-        if not buy_price or not buy_price.strip():
-            return {"ok": False, "error": "Buy price cannot be empty. Please specify the purchase price per share."}
-        
-        ticker = ticker.strip().upper()
-        user_id = user_id.strip()
-        quantity = quantity.strip()
-        buy_price = buy_price.strip()
-        
-        # Validate quantity format (should be a positive number)
+        timeout = kwargs.get("timeout")
+        if isinstance(timeout, (int, float)):
+            kwargs["timeout"] = (min(_CONNECT_TIMEOUT, timeout), timeout)
+        return _guarded_request(method, url, **kwargs)
+    finally:
+        if bulkhead is not None:
+            bulkhead.release()
+
+def _guarded_request(method: str, url: str, **kwargs):
+    """Send a request through the shared session, failing fast while the backend's circuit is open"""
+    breaker = _breaker_for(url)
+    if breaker is None:
+        return _SESSION.request(method, url, **kwargs)
+    if not breaker.allow():
+        raise _CircuitOpenError(f"Circuit open for {url}")
+    try:
+        response = _SESSION.request(method, url, **kwargs)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        breaker.record_failure()
+        raise
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+async def _abackend_request(method: str, url: str, **kwargs):
+    """Async counterpart of _backend_request on the shared async client"""
+    _get_async_client()
+    bulkhead = _for_backend(_ABULKHEADS, url)
+    if bulkhead is not None:
+        started = time.monotonic()
         try:
-            qty_float = float(quantity)
-            if qty_float <= 0:
-                return {"ok": False, "error": "Quantity must be a positive number"}
-        except ValueError:
-            return {"ok": False, "error": "Quantity must be a valid number"}
-        
-        # Validate buy_price format (should be a positive number)
+            await asyncio.wait_for(bulkhead.acquire(), _acquire_bulkhead_wait(kwargs))
+        except asyncio.TimeoutError:
+            raise _BulkheadFullError(f"Too many concurrent calls to {url}")
+        _spend_timeout(kwargs, time.monotonic() - started)
+    try:
+        timeout = kwargs.get("timeout")
+        if isinstance(timeout, (int, float)):
+            kwargs["timeout"] = httpx.Timeout(timeout, connect=min(_CONNECT_TIMEOUT, timeout))
+        return await _aguarded_request(method, url, **kwargs)
+    finally:
+        if bulkhead is not None:
+            bulkhead.release()
+
+async def _arequest_with_retries(method: str, url: str, **kwargs):
+    """Send on the async client with the session's retry policy: idempotent calls retry gateway failures with jittered backoff"""
+    response = await _get_async_client().request(method, url, **kwargs)
+    if method not in _RETRY_METHODS:
+        return response
+    for attempt in range(_RETRY_TOTAL):
+        if response.status_code not in _RETRY_STATUSES:
+            break
+        await asyncio.sleep(random.uniform(0, _RETRY_BACKOFF * (2 ** attempt)))
+        response = await _get_async_client().request(method, url, **kwargs)
+    return response
+
+async def _aguarded_request(method: str, url: str, **kwargs):
+    """Async counterpart of _guarded_request"""
+    breaker = _breaker_for(url)
+    if breaker is None:
+        return await _arequest_with_retries(method, url, **kwargs)
+    if not breaker.allow():
+        raise httpx.ConnectError(f"Circuit open for {url}")
+    try:
+        response = await _arequest_with_retries(method, url, **kwargs)
+    except (httpx.ConnectError, httpx.TimeoutException):
+        breaker.record_failure()
+        raise
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+# Bounded cache of successful portfolio/watchlist list and summary (and user preference, interaction and history) responses, keyed by URL
+_LIST_CACHE_SIZE = 1024
+# Entries are [expires_at, response, ticker index or None]
+_LIST_CACHE: "OrderedDict[str, List[Any]]" = OrderedDict()
+_LIST_CACHE_LOCK = threading.Lock()
+# Bumped by every invalidation; a fetch that started before a write must not cache its (stale) response
+_list_cache_generation = 0
+
+# Last successful response per URL, served (flagged as stale) to read-only portfolio/watchlist tools when the
+# backend is unreachable or failing. Writes drop them along with the cache, so a stale read never predates a
+# change made through the tools; lookups made to write never use them
+_STALE_LIST_MAX_AGE = 2 * LIST_CACHE_TTL  # seconds
+_STALE_LISTS: "OrderedDict[str, tuple]" = OrderedDict()
+
+class _StaleResponse:
+    """A last known good response, standing in for a backend call that failed"""
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.content = response.content
+
+def _stale_list(url: str) -> Optional[_StaleResponse]:
+    """Return the last successful response for url if it isn't too old, or None"""
+    with _LIST_CACHE_LOCK:
+        entry = _STALE_LISTS.get(url)
+    if entry is None or entry[0] + _STALE_LIST_MAX_AGE < time.monotonic():
+        return None
+    logger.warning("Backend unavailable, serving last known response for %s", url)
+    return _StaleResponse(entry[1])
+
+def _mark_stale(result: Dict[str, Any], response) -> Dict[str, Any]:
+    """Flag a tool result built from a stale response"""
+    if isinstance(response, _StaleResponse):
+        result["stale"] = True
+        result["warning"] = "Showing last known data; the live service is unavailable."
+    return result
+
+def _list_cache_get(url: str):
+    """Return a cached list response that hasn't expired, or None"""
+    with _LIST_CACHE_LOCK:
+        entry = _LIST_CACHE.get(url)
+        if entry is None:
+            return None
+        expires_at, response, _ = entry
+        if expires_at < time.monotonic():
+            del _LIST_CACHE[url]
+            return None
+        return response
+
+def _list_cache_put(url: str, response, generation: int, ttl: float = LIST_CACHE_TTL):
+    """Cache a successful list response fetched during the given cache generation"""
+    if response.status_code != 200:
+        return
+    with _LIST_CACHE_LOCK:
+        if generation != _list_cache_generation:
+            return
+        _LIST_CACHE[url] = [time.monotonic() + ttl, response, None]
+        _LIST_CACHE.move_to_end(url)
+        while len(_LIST_CACHE) > _LIST_CACHE_SIZE:
+            _LIST_CACHE.popitem(last=False)
+        _STALE_LISTS[url] = (time.monotonic(), response)
+        _STALE_LISTS.move_to_end(url)
+        while len(_STALE_LISTS) > _LIST_CACHE_SIZE:
+            _STALE_LISTS.popitem(last=False)
+
+def _list_cache_drop(url: str):
+    """Forget a cached response after the resource behind it changes"""
+    global _list_cache_generation
+    with _LIST_CACHE_LOCK:
+        _list_cache_generation += 1
+        _LIST_CACHE.pop(url, None)
+        _STALE_LISTS.pop(url, None)
+    _LIST_FETCHES.pop(url, None)
+    _forget_sync_fetch(url)
+
+# In-flight sync list fetches by URL, so tool calls running in parallel threads share one GET
+_SYNC_LIST_FETCHES: Dict[str, Future] = {}
+_SYNC_LIST_FETCHES_LOCK = threading.Lock()
+
+def _forget_sync_fetch(url: str, fetch: Optional[Future] = None):
+    """Stop sharing an in-flight fetch (only the given one, if passed)"""
+    with _SYNC_LIST_FETCHES_LOCK:
+        if fetch is None or _SYNC_LIST_FETCHES.get(url) is fetch:
+            _SYNC_LIST_FETCHES.pop(url, None)
+
+def _cached_list(url: str, timeout: float = 10, ttl: float = LIST_CACHE_TTL, stale_ok: bool = False):
+    """GET a portfolio/watchlist listing or summary, reusing a response fetched within the last ttl seconds
+
+    stale_ok lets a read-only caller fall back to the last known response while the backend is down.
+    """
+    response = _list_cache_get(url)
+    if response is not None:
+        return response
+    try:
+        response = _fetch_list(url, timeout, ttl)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        stale = _stale_list(url) if stale_ok else None
+        if stale is None:
+            raise
+        return stale
+    if stale_ok and response.status_code >= 500:
+        return _stale_list(url) or response
+    return response
+
+def _fetch_list(url: str, timeout: float, ttl: float):
+    """GET url once for all threads asking for it at the same time, caching a successful response"""
+    with _SYNC_LIST_FETCHES_LOCK:
+        fetch = _SYNC_LIST_FETCHES.get(url)
+        leader = fetch is None
+        if leader:
+            fetch = _SYNC_LIST_FETCHES[url] = Future()
+    if not leader:
         try:
-            price_float = float(buy_price)
-            if price_float <= 0:
-                return {"ok": False, "error": "Buy price must be a positive number"}
-        except ValueError:
-            return {"ok": False, "error": "Buy price must be a valid number"}
-        
-        print(f"[LOG] Making API request to add {ticker} to portfolio for user {user_id}")
-        
-        # Make HTTP request to the portfolio API
-        payload = {
-            "user_id": user_id,
-            "ticker": ticker,
-            "quantity": quantity,
-            "buy_price": buy_price,
-            "note": note
+            return fetch.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise requests.exceptions.Timeout(f"Timed out waiting for the shared fetch of {url}")
+    
+    try:
+        generation = _list_cache_generation
+        response = _backend_request("GET", url, timeout=timeout)
+        _list_cache_put(url, response, generation, ttl)
+        fetch.set_result(response)
+        return response
+    except BaseException as e:
+        fetch.set_exception(e)
+        raise
+    finally:
+        _forget_sync_fetch(url, fetch)
+
+# In-flight async list fetches by URL, so a prefetch and the agent's own call share one GET
+_LIST_FETCHES: Dict[str, "asyncio.Future"] = {}
+
+async def _afetch_list(url: str, ttl: float, timeout: float):
+    generation = _list_cache_generation
+    response = await _abackend_request("GET", url, timeout=timeout)
+    _list_cache_put(url, response, generation, ttl)
+    return response
+
+def _forget_fetch(url: str, fetch: "asyncio.Future"):
+    """Stop sharing a finished fetch, unless an invalidation already replaced it"""
+    if _LIST_FETCHES.get(url) is fetch:
+        del _LIST_FETCHES[url]
+
+async def _acached_list(url: str, timeout: float = 10, ttl: float = LIST_CACHE_TTL, stale_ok: bool = False):
+    """Async counterpart of _cached_list using the shared async client"""
+    response = _list_cache_get(url)
+    if response is not None:
+        return response
+    fetch = _LIST_FETCHES.get(url)
+    if fetch is None:
+        fetch = asyncio.ensure_future(_afetch_list(url, ttl, timeout))
+        _LIST_FETCHES[url] = fetch
+        fetch.add_done_callback(lambda done: _forget_fetch(url, done))
+    try:
+        # A caller joining someone else's fetch still waits no longer than its own budget
+        response = await asyncio.wait_for(asyncio.shield(fetch), timeout)
+    except asyncio.TimeoutError:
+        stale = _stale_list(url) if stale_ok else None
+        if stale is None:
+            raise httpx.TimeoutException(f"Timed out waiting for the shared fetch of {url}")
+        return stale
+    except (httpx.ConnectError, httpx.TimeoutException):
+        stale = _stale_list(url) if stale_ok else None
+        if stale is None:
+            raise
+        return stale
+    if stale_ok and response.status_code >= 500:
+        return _stale_list(url) or response
+    return response
+
+def _ticker_index(url: str, response, alt_field: str, items: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+    """Map tickers to list entries, building the index once per cached response"""
+    with _LIST_CACHE_LOCK:
+        entry = _LIST_CACHE.get(url)
+        if entry is not None and entry[1] is response and entry[2] is not None:
+            return entry[2]
+    
+    if items is None:
+        data = _parse_json(response)
+        items = data.get("items", data.get(alt_field, []))
+    index = {}
+    for item in items:
+        index.setdefault(item.get("ticker"), item)
+    
+    with _LIST_CACHE_LOCK:
+        entry = _LIST_CACHE.get(url)
+        if entry is not None and entry[1] is response:
+            entry[2] = index
+    return index
+
+# Tools, cache lookups and invalidation rebuild the same few URLs per user
+@lru_cache(maxsize=1024)
+def _list_url(api_url: str, user_id: str, ticker: Optional[str] = None) -> str:
+    """Build a list endpoint URL, optionally filtered server-side to one ticker"""
+    url = f"{api_url}?user_id={quote(user_id, safe='')}"
+    if ticker is not None:
+        url += f"&ticker={quote(ticker, safe='')}"
+    return url
+
+def _lookup_url(api_url: str, user_id: str, ticker: str) -> str:
+    """Listing to find one ticker in: the user's cached full list when there is one (indexed by ticker), else the filtered listing"""
+    full_url = _list_url(api_url, user_id)
+    if _list_cache_get(full_url) is not None:
+        return full_url
+    return _list_url(api_url, user_id, ticker)
+
+_BOOL_STR = {True: "true", False: "false"}
+
+@lru_cache(maxsize=256)
+def _summary_url(user_id: str, include_pnl: bool) -> str:
+    """Build the portfolio summary URL for a user"""
+    return f"{PORTFOLIO_API_URL}summary/{quote(user_id, safe='')}?include_pnl={_BOOL_STR[bool(include_pnl)]}"
+
+_INTERACTIONS_USER_BASE = f"{USER_INTERACTIONS_API_URL}user/"
+_HISTORY_USER_BASE = f"{PREFERENCE_HISTORY_API_URL}user/"
+
+@lru_cache(maxsize=256)
+def _user_url(api_url: str, user_id: str) -> str:
+    """Build a per-user resource URL, escaping the user id as one path segment"""
+    return f"{api_url}{quote(user_id, safe='')}"
+
+def _invalidate_list_cache(api_url: str, user_id: str):
+    """Drop cached listings (and summaries) for a user after their portfolio/watchlist changes"""
+    prefix = _list_url(api_url, user_id)
+    summary_prefix = f"{api_url}summary/{quote(user_id, safe='')}?"
+    _list_cache_drop_matching(lambda url: url == prefix or url.startswith(prefix + "&") or url.startswith(summary_prefix))
+
+def _invalidate_user_cache(api_url: str, user_id: str):
+    """Drop every cached page of a per-user resource after it changes"""
+    prefix = _user_url(api_url, user_id)
+    _list_cache_drop_matching(lambda url: url == prefix or url.startswith(prefix + "?"))
+
+def _list_cache_drop_matching(is_stale):
+    """Forget cached and in-flight responses whose URL matches is_stale"""
+    global _list_cache_generation
+    with _LIST_CACHE_LOCK:
+        _list_cache_generation += 1
+        for url in [url for url in _LIST_CACHE if is_stale(url)]:
+            del _LIST_CACHE[url]
+        for url in [url for url in _STALE_LISTS if is_stale(url)]:
+            del _STALE_LISTS[url]
+    # Later callers start a fresh fetch rather than joining one that began before the write.
+    # Snapshot the keys first: async fetches register on the event loop while this may run in a worker thread
+    for url in list(_LIST_FETCHES):
+        if is_stale(url):
+            _LIST_FETCHES.pop(url, None)
+    with _SYNC_LIST_FETCHES_LOCK:
+        for url in [url for url in _SYNC_LIST_FETCHES if is_stale(url)]:
+            del _SYNC_LIST_FETCHES[url]
+
+# API base URLs whose backend answered 405 to a filtered DELETE, so removes go straight to list-then-delete.
+# The list route always exists, so an older backend answers 405; a 404 means the user has no such ticker.
+_NO_FILTERED_DELETE = set()
+
+def _filtered_delete_supported(api_url: str) -> bool:
+    """Whether to try the one-call filtered DELETE; off unless FILTERED_DELETE_ENABLED is set"""
+    return FILTERED_DELETE_ENABLED and api_url not in _NO_FILTERED_DELETE
+
+def _filtered_delete(api_url: str, user_id: str, ticker: str, timeout: float):
+    """Delete a user's ticker in one call; None means the backend needs the list-then-delete path"""
+    if not _filtered_delete_supported(api_url):
+        return None
+    response = _backend_request("DELETE", _list_url(api_url, user_id, ticker), timeout=timeout)
+    if response.status_code == 405:
+        _NO_FILTERED_DELETE.add(api_url)
+        return None
+    return response
+
+async def _afiltered_delete(api_url: str, user_id: str, ticker: str, timeout: float):
+    """Async counterpart of _filtered_delete"""
+    if not _filtered_delete_supported(api_url):
+        return None
+    response = await _abackend_request("DELETE", _list_url(api_url, user_id, ticker), timeout=timeout)
+    if response.status_code == 405:
+        _NO_FILTERED_DELETE.add(api_url)
+        return None
+    return response
+
+def _deadline(seconds: float):
+    """Start an end-to-end time budget; the returned callable gives the timeout left for the next call"""
+    end = time.monotonic() + seconds
+    return lambda: max(0.1, end - time.monotonic())
+
+def _clean_text(value: Optional[str]) -> str:
+    """Normalize a text tool argument; empty means missing"""
+    return (value or "").strip()
+
+def _validation_error_message(error) -> str:
+    """Describe an args_schema validation failure so the agent can correct its input"""
+    problems = "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors()
+    )
+    return f"Invalid input - {problems}"
+
+def _backend_errors(service: str, action: str, unavailable: Optional[str] = None):
+    """Turn a tool's backend request failures into {"ok": False, "error": ...} results
+
+    service names the backend in connection and timeout errors, action finishes "Unexpected error ...";
+    unavailable replaces both the connection and unexpected-error messages for tools that hide backend detail.
+    """
+    connect_error = unavailable or f"Unable to connect to {service} service. Please check if the service is running."
+    busy_error = f"{service[0].upper()}{service[1:]} service is busy with other requests. Please try again."
+    timeout_error = f"{service[0].upper()}{service[1:]} service request timed out. Please try again."
+    
+    def unexpected_error(e: Exception) -> Dict[str, Any]:
+        logger.error("Unexpected error %s: %s", action, e)
+        return {"ok": False, "error": unavailable or f"Unexpected error {action}: {str(e)}"}
+    
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    return await func(*args, **kwargs)
+                except _BulkheadFullError:
+                    logger.warning("Too many concurrent calls to %s API", service)
+                    return {"ok": False, "error": busy_error}
+                except httpx.ConnectError:
+                    logger.warning("Connection error to %s API", service)
+                    return {"ok": False, "error": connect_error}
+                except httpx.TimeoutException:
+                    logger.warning("Timeout error to %s API", service)
+                    return {"ok": False, "error": timeout_error}
+                except (httpx.HTTPError, ValueError) as e:
+                    return unexpected_error(e)
+            return async_wrapper
+        
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except _BulkheadFullError:
+                logger.warning("Too many concurrent calls to %s API", service)
+                return {"ok": False, "error": busy_error}
+            except requests.exceptions.ConnectionError:
+                logger.warning("Connection error to %s API", service)
+                return {"ok": False, "error": connect_error}
+            except requests.exceptions.Timeout:
+                logger.warning("Timeout error to %s API", service)
+                return {"ok": False, "error": timeout_error}
+            except (requests.exceptions.RequestException, ValueError) as e:
+                return unexpected_error(e)
+        return wrapper
+    
+    return decorate
+
+# ====== Portfolio Tools ======
+# Not cached: Decimal("100") and Decimal("100.0000") are equal keys, and the body must keep the form the agent gave
+def _portfolio_add_body(user_id: str, ticker: str, quantity: Decimal, buy_price: Decimal, note: Optional[str]) -> bytes:
+    """Encode an add_to_portfolio request body"""
+    # quantity and buy_price are checked as positive decimals by the schema, so the payload skips revalidation;
+    # model_dump still writes them as strings
+    payload = AddPortfolioInput.model_construct(user_id=user_id, ticker=ticker, quantity=quantity,
+                                                buy_price=buy_price, note=note).model_dump(exclude_none=True)
+    return json_utils.dumps_bytes(payload)
+
+def _portfolio_add_result(user_id: str, ticker: str, response):
+    """Build the add_to_portfolio result from a portfolio API response"""
+    if response.status_code in [200, 201]:  # 200 OK, 201 Created
+        _invalidate_list_cache(PORTFOLIO_API_URL, user_id)
+        result = _parse_json(response)
+        logger.debug("API response success: %s", result)
+        return {
+            "ok": True,
+            "message": f"Successfully added {ticker} to portfolio",
+            "api_response": result
         }
-        
-        print(f"[LOG] API payload: {payload}")
-        
-        response = requests.post(PORTFOLIO_API_URL, json=payload, headers={"Content-Type": "application/json"}, timeout=10)
-        print(f"[LOG] API response status: {response.status_code}")
-        
-        if response.status_code in [200, 201]:  # 200 OK, 201 Created
-            result = response.json()
-            print(f"[LOG] API response success: {result}")
-            return {
-                "ok": True,
-                "message": f"Successfully added {ticker} to portfolio",
-                "api_response": result
-            }
-        elif response.status_code == 400:
-            result = response.json()
-            print(f"[LOG] API response error 400: {result}")
-            return {"ok": False, "error": result.get("detail", "Unable to add ticker to portfolio")}
-        else:
-            print(f"[LOG] API response unexpected status: {response.status_code}")
-            return {"ok": False, "error": "Unable to add ticker to portfolio at this time"}
-            
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to API")
-        return {"ok": False, "error": "Unable to connect to portfolio service. Please check if the service is running."}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to API")
-        return {"ok": False, "error": "Portfolio service request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": f"Unexpected error adding to portfolio: {str(e)}"}
+    elif response.status_code == 400:
+        result = _parse_json(response)
+        logger.debug("API response error 400: %s", result)
+        return {"ok": False, "error": result.get("detail", "Unable to add ticker to portfolio")}
+    else:
+        logger.debug("API response unexpected status: %s", response.status_code)
+        return {"ok": False, "error": "Unable to add ticker to portfolio at this time"}
+
+@tool("add_to_portfolio", args_schema=AddPortfolioInput)
+@_backend_errors("portfolio", "adding to portfolio")
+def add_to_portfolio(user_id: str = DEFAULT_USER_ID, ticker: str = "",
+                     quantity: Decimal = Decimal(0), buy_price: Decimal = Decimal(0), note: Optional[str] = None):
+    """Add or upsert a holding in the user's portfolio by calling the portfolio API. Returns only that holding; use list_portfolio for the full portfolio."""
+    logger.debug("add_to_portfolio called with user_id=%s, ticker=%s, quantity=%s, buy_price=%s, note=%s", user_id, ticker, quantity, buy_price, note)
+    
+    logger.debug("Making API request to add %s to portfolio for user %s", ticker, user_id)
+    
+    # Make HTTP request to the portfolio API
+    body = _portfolio_add_body(user_id, ticker, quantity, buy_price, note)
+    
+    logger.debug("API payload: %s", body)
+    
+    response = _backend_request("POST", PORTFOLIO_API_URL, data=body, headers=_JSON_HEADERS, timeout=10)
+    logger.debug("API response status: %s", response.status_code)
+    
+    return _portfolio_add_result(user_id, ticker, response)
+
+def _portfolio_entry_url(ticker: str, list_url: str, list_response):
+    """Find the delete URL for a ticker in a portfolio listing; returns (url, None) or (None, error)"""
+    logger.debug("List API response status: %s", list_response.status_code)
+    if list_response.status_code != 200:
+        logger.debug("Failed to get portfolio")
+        return None, {"ok": False, "error": "Unable to remove ticker from portfolio"}
+    
+    # Find the entry with matching ticker - handle both "portfolios" and "items" fields
+    item = _ticker_index(list_url, list_response, "portfolios").get(ticker)
+    entry_id = item and (item.get("id") or item.get("portfolio_id"))
+    
+    if not entry_id:
+        logger.debug("Entry not found for ticker %s", ticker)
+        return None, {"ok": False, "error": f"Ticker {ticker} not found in portfolio"}
+    
+    logger.debug("Found entry ID %s, deleting...", entry_id)
+    return f"{_PORTFOLIO_BASE}/{entry_id}", None
+
+def _portfolio_remove_result(user_id: str, ticker: str, delete_response):
+    """Build the remove_from_portfolio result from the delete response"""
+    logger.debug("Delete API response status: %s", delete_response.status_code)
+    if delete_response.status_code in (200, 204):
+        _invalidate_list_cache(PORTFOLIO_API_URL, user_id)
+        logger.debug("Successfully deleted %s from portfolio", ticker)
+        return {
+            "ok": True,
+            "message": f"Successfully removed {ticker} from portfolio"
+        }
+    if delete_response.status_code == 404:
+        return {"ok": False, "error": f"Ticker {ticker} not found in portfolio"}
+    logger.debug("Failed to delete entry")
+    return {"ok": False, "error": "Unable to remove ticker from portfolio"}
 
 @tool("remove_from_portfolio", args_schema=RemovePortfolioInput)
+@_backend_errors("portfolio", "removing from portfolio")
 def remove_from_portfolio(user_id: str = DEFAULT_USER_ID, ticker: str = ""):
-    """Remove a holding from the user's portfolio by calling the portfolio API."""
-    try:
-        print(f"[LOG] remove_from_portfolio called with user_id={user_id}, ticker={ticker}")
-        
-        # Validate inputs
-        if not ticker or not ticker.strip():
-            return {"ok": False, "error": "Ticker cannot be empty"}
-        
-        if not user_id or not user_id.strip():
-            return {"ok": False, "error": "User ID cannot be empty"}
-        
-        ticker = ticker.strip().upper()
-        user_id = user_id.strip()
-        
-        print(f"[LOG] Getting portfolio for user {user_id} to find entry for {ticker}")
-        
-        # First, get the portfolio to find the entry ID
-        list_url = f"{PORTFOLIO_API_URL}?user_id={user_id}&ticker={ticker}"
-        list_response = requests.get(list_url, timeout=10)
-        print(f"[LOG] List API response status: {list_response.status_code}")
-        
-        if list_response.status_code != 200:
-            print(f"[LOG] Failed to get portfolio")
-            return {"ok": False, "error": "Unable to remove ticker from portfolio"}
-        
-        list_data = list_response.json()
-        entry_id = None
-        
-        # Find the entry with matching ticker - handle both "portfolios" and "items" fields
-        items = list_data.get("items", list_data.get("portfolios", []))
-        for item in items:
-            if item.get("ticker") == ticker:
-                entry_id = item.get("id") or item.get("portfolio_id")
-                break
-        
-        if not entry_id:
-            print(f"[LOG] Entry not found for ticker {ticker}")
-            return {"ok": False, "error": f"Ticker {ticker} not found in portfolio"}
-        
-        print(f"[LOG] Found entry ID {entry_id}, deleting...")
+    """Remove a holding from the user's portfolio by calling the portfolio API. Returns only a confirmation; use list_portfolio for the remaining holdings."""
+    logger.debug("remove_from_portfolio called with user_id=%s, ticker=%s", user_id, ticker)
+    
+    logger.debug("Getting portfolio for user %s to find entry for %s", user_id, ticker)
+    
+    # List + delete share one 10s budget rather than 10s each
+    remaining = _deadline(10)
+    
+    # Delete by user and ticker in one round trip when the backend supports it
+    delete_response = _filtered_delete(PORTFOLIO_API_URL, user_id, ticker, remaining())
+    
+    if delete_response is None:
+        # Otherwise get the portfolio to find the entry ID
+        list_url = _lookup_url(PORTFOLIO_API_URL, user_id, ticker)
+        list_response = _cached_list(list_url, timeout=remaining())
+        delete_url, error = _portfolio_entry_url(ticker, list_url, list_response)
+        if error:
+            return error
         
         # Delete the entry
-        delete_url = f"{PORTFOLIO_API_URL.rstrip('/')}/{entry_id}"
-        delete_response = requests.delete(delete_url, timeout=10)
-        print(f"[LOG] Delete API response status: {delete_response.status_code}")
-        
-        if delete_response.status_code == 200:
-            print(f"[LOG] Successfully deleted entry {entry_id}")
-            return {
-                "ok": True,
-                "message": f"Successfully removed {ticker} from portfolio"
-            }
-        else:
-            print(f"[LOG] Failed to delete entry")
-            return {"ok": False, "error": "Unable to remove ticker from portfolio"}
-        
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to API")
-        return {"ok": False, "error": "Unable to connect to portfolio service. Please check if the service is running."}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to API")
-        return {"ok": False, "error": "Portfolio service request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": f"Unexpected error removing from portfolio: {str(e)}"}
+        delete_response = _backend_request("DELETE", delete_url, timeout=remaining())
+    
+    return _portfolio_remove_result(user_id, ticker, delete_response)
+
+def _list_items(user_id: str, response, alt_field: str, service: str):
+    """Parse a list response into (items, None), or (None, error) if the API's total and items disagree"""
+    result = _parse_json(response)
+    logger.debug("API response: %s", result)
+    
+    # Handle both "items" and the service-specific field name
+    items = result.get("items", result.get(alt_field, []))
+    total_count = result.get("total", 0)
+    
+    # Check for data inconsistency
+    if total_count > 0 and not items:
+        logger.debug("Data inconsistency detected: total=%s, items=0", total_count)
+        return None, {
+            "ok": False,
+            "error": f"Data inconsistency detected: API reports {total_count} items but returned empty list. This may be a temporary issue with the {service} service.",
+            "user_id": user_id,
+            "api_total": total_count,
+            "api_items_count": 0
+        }
+    return items, None
+
+def _project(items: List[Dict[str, Any]], fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """Keep only the requested fields of each list entry (all of them when fields is empty)"""
+    if not fields:
+        return items
+    return [{field: item[field] for field in fields if field in item} for item in items]
+
+def _portfolio_list_result(user_id: str, response, summary_only: bool = False, fields: Optional[List[str]] = None):
+    """Build the list_portfolio result from a portfolio API response"""
+    if response.status_code == 200:
+        items, error = _list_items(user_id, response, "portfolios", "portfolio")
+        if error:
+            return error
+        
+        logger.debug("API response success, found %s items", len(items))
+        if summary_only:
+            return _mark_stale({"ok": True, "portfolio_count": len(items), "user_id": user_id}, response)
+        return _mark_stale({
+            "ok": True,
+            "portfolio": _project(items, fields),
+            "portfolio_count": len(items),
+            "user_id": user_id
+        }, response)
+    else:
+        logger.debug("API response failed with status %s", response.status_code)
+        try:
+            error_detail = _parse_json(response)
+            logger.debug("API error detail: %s", error_detail)
+            return {"ok": False, "error": f"Portfolio API error: {error_detail.get('detail', 'Unknown error')}"}
+        except ValueError:
+            return {"ok": False, "error": f"Unable to retrieve portfolio (HTTP {response.status_code})"}
 
 @tool("list_portfolio", args_schema=ListPortfolioInput)
-def list_portfolio(user_id: str = DEFAULT_USER_ID):
-    """List all holdings in the user's portfolio by calling the portfolio API."""
-    try:
-        print(f"[LOG] list_portfolio called with user_id={user_id}")
-        
-        if not user_id or not user_id.strip():
-            print(f"[LOG] Validation failed: user_id is empty")
-            return {"ok": False, "error": "User ID cannot be empty"}
-        
-        user_id = user_id.strip()
-        
-        print(f"[LOG] Making API request to get portfolio for user {user_id}")
-        
-        # Make HTTP request to the portfolio API
-        api_url = f"{PORTFOLIO_API_URL}?user_id={user_id}"
-        
-        response = requests.get(api_url, timeout=10)
-        print(f"[LOG] API response status: {response.status_code}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"[LOG] API response: {result}")
-            
-            # Validate the response structure - handle both "items" and "portfolios" fields
-            items = result.get("items", result.get("portfolios", []))
-            total_count = result.get("total", 0)
-            
-            # Check for data inconsistency
-            if total_count > 0 and (not items or len(items) == 0):
-                print(f"[LOG] Data inconsistency detected: total={total_count}, items={len(items) if items else 0}")
-                return {
-                    "ok": False,
-                    "error": f"Data inconsistency detected: API reports {total_count} items but returned empty list. This may be a temporary issue with the portfolio service.",
-                    "user_id": user_id,
-                    "api_total": total_count,
-                    "api_items_count": len(items) if items else 0
-                }
-            
-            print(f"[LOG] API response success, found {len(items)} items")
-            return {
-                "ok": True,
-                "portfolio": items,
-                "portfolio_count": len(items),
-                "user_id": user_id
-            }
-        else:
-            print(f"[LOG] API response failed with status {response.status_code}")
-            try:
-                error_detail = response.json()
-                print(f"[LOG] API error detail: {error_detail}")
-                return {"ok": False, "error": f"Portfolio API error: {error_detail.get('detail', 'Unknown error')}"}
-            except:
-                return {"ok": False, "error": f"Unable to retrieve portfolio (HTTP {response.status_code})"}
-        
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to API")
-        return {"ok": False, "error": "Unable to connect to portfolio service. Please check if the service is running."}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to API")
-        return {"ok": False, "error": "Portfolio service request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": f"Unexpected error retrieving portfolio: {str(e)}"}
+@_backend_errors("portfolio", "retrieving portfolio")
+def list_portfolio(user_id: str = DEFAULT_USER_ID, summary_only: bool = False, fields: Optional[List[str]] = None):
+    """List all holdings in the user's portfolio by calling the portfolio API. Pass summary_only=True when only the number of holdings is needed, or fields to return only some fields of each holding."""
+    logger.debug("list_portfolio called with user_id=%s, summary_only=%s, fields=%s", user_id, summary_only, fields)
+    
+    logger.debug("Making API request to get portfolio for user %s", user_id)
+    
+    # Make HTTP request to the portfolio API
+    api_url = _list_url(PORTFOLIO_API_URL, user_id)
+    
+    response = _cached_list(api_url, stale_ok=True)
+    logger.debug("API response status: %s", response.status_code)
+    
+    return _portfolio_list_result(user_id, response, summary_only, fields)
+
+def _portfolio_summary_result(user_id: str, include_pnl: bool, response):
+    """Build the get_portfolio_summary result from a portfolio summary API response"""
+    if response.status_code == 200:
+        result = _parse_json(response)
+        logger.debug("API response success: %s", result)
+        return _mark_stale({
+            "ok": True,
+            "summary": result,
+            "user_id": user_id,
+            "include_pnl": include_pnl
+        }, response)
+    else:
+        logger.debug("API response failed with status %s", response.status_code)
+        try:
+            error_detail = _parse_json(response)
+            logger.debug("API error detail: %s", error_detail)
+            return {"ok": False, "error": f"Portfolio summary API error: {error_detail.get('detail', 'Unknown error')}"}
+        except ValueError:
+            return {"ok": False, "error": f"Unable to retrieve portfolio summary (HTTP {response.status_code})"}
 
 @tool("get_portfolio_summary", args_schema=GetPortfolioSummaryInput)
+@_backend_errors("portfolio", "retrieving portfolio summary")
 def get_portfolio_summary(user_id: str = DEFAULT_USER_ID, include_pnl: bool = True):
     """Get portfolio summary with PnL calculations for a user by calling the portfolio API."""
-    try:
-        print(f"[LOG] get_portfolio_summary called with user_id={user_id}, include_pnl={include_pnl}")
-        
-        if not user_id or not user_id.strip():
-            print(f"[LOG] Validation failed: user_id is empty")
-            return {"ok": False, "error": "User ID cannot be empty"}
-        
-        user_id = user_id.strip()
-        
-        print(f"[LOG] Making API request to get portfolio summary for user {user_id}")
-        
-        # Make HTTP request to the portfolio summary API
-        api_url = f"{PORTFOLIO_API_URL}summary/{user_id}?include_pnl={str(include_pnl).lower()}"
-        
-        response = requests.get(api_url, timeout=10)
-        print(f"[LOG] API response status: {response.status_code}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"[LOG] API response success: {result}")
-            return {
-                "ok": True,
-                "summary": result,
-                "user_id": user_id,
-                "include_pnl": include_pnl
-            }
-        else:
-            print(f"[LOG] API response failed with status {response.status_code}")
-            try:
-                error_detail = response.json()
-                print(f"[LOG] API error detail: {error_detail}")
-                return {"ok": False, "error": f"Portfolio summary API error: {error_detail.get('detail', 'Unknown error')}"}
-            except:
-                return {"ok": False, "error": f"Unable to retrieve portfolio summary (HTTP {response.status_code})"}
-        
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to API")
-        return {"ok": False, "error": "Unable to connect to portfolio service. Please check if the service is running."}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to API")
-        return {"ok": False, "error": "Portfolio service request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": f"Unexpected error retrieving portfolio summary: {str(e)}"}
+    logger.debug("get_portfolio_summary called with user_id=%s, include_pnl=%s", user_id, include_pnl)
+    
+    logger.debug("Making API request to get portfolio summary for user %s", user_id)
+    
+    # Make HTTP request to the portfolio summary API
+    api_url = _summary_url(user_id, include_pnl)
+    
+    response = _cached_list(api_url, ttl=SUMMARY_CACHE_TTL, stale_ok=True)
+    logger.debug("API response status: %s", response.status_code)
+    
+    return _portfolio_summary_result(user_id, include_pnl, response)
 
 # ====== Watchlist Tools ======
+@lru_cache(maxsize=256)
+def _watchlist_add_body(user_id: str, ticker: str, note: Optional[str]) -> bytes:
+    """Encode an add_to_watchlist request body, reused for identical retries"""
+    payload = AddWatchlistInput.model_construct(user_id=user_id, ticker=ticker, note=note).model_dump(exclude_none=True)
+    return json_utils.dumps_bytes(payload)
+
+def _watchlist_add_result(user_id: str, ticker: str, response):
+    """Build the add_to_watchlist result from a watchlist API response"""
+    if response.status_code in [200, 201]:  # 200 OK, 201 Created
+        _invalidate_list_cache(WATCHLIST_API_URL, user_id)
+        result = _parse_json(response)
+        logger.debug("API response success: %s", result)
+        return {
+            "ok": True,
+            "message": f"Successfully added {ticker} to watchlist",
+            "api_response": result
+        }
+    elif response.status_code == 400:
+        result = _parse_json(response)
+        logger.debug("API response error 400: %s", result)
+        return {"ok": False, "error": result.get("detail", "Unable to add ticker to watchlist")}
+    else:
+        logger.debug("API response unexpected status: %s", response.status_code)
+        return {"ok": False, "error": "Unable to add ticker to watchlist at this time"}
+
 @tool("add_to_watchlist", args_schema=AddWatchlistInput)
+@_backend_errors("watchlist", "adding to watchlist")
 def add_to_watchlist(user_id: str = DEFAULT_USER_ID, ticker: str = "",
                      note: Optional[str] = None):
     """Add a ticker to the user's watchlist by calling the watchlist API."""
-    try:
-        print(f"[LOG] add_to_watchlist called with user_id={user_id}, ticker={ticker}, note={note}")
-        
-        # Validate inputs
-        if not ticker or not ticker.strip():
-            print(f"[LOG] Validation failed: ticker is empty")
-            return {"ok": False, "error": "Ticker cannot be empty"}
-        
-        if not user_id or not user_id.strip():
-            print(f"[LOG] Validation failed: user_id is empty")
-            return {"ok": False, "error": "User ID cannot be empty"}
-        
-        ticker = ticker.strip().upper()
-        user_id = user_id.strip()
-        
-        print(f"[LOG] Making API request to add {ticker} for user {user_id}")
-        
-        # Make HTTP request to the watchlist API
-        payload = {
-            "user_id": user_id,
-            "ticker": ticker,
-            "note": note
+    logger.debug("add_to_watchlist called with user_id=%s, ticker=%s, note=%s", user_id, ticker, note)
+    
+    logger.debug("Making API request to add %s for user %s", ticker, user_id)
+    
+    # Make HTTP request to the watchlist API
+    body = _watchlist_add_body(user_id, ticker, note)
+    
+    logger.debug("API payload: %s", body)
+    
+    response = _backend_request("POST", WATCHLIST_API_URL, data=body, headers=_JSON_HEADERS, timeout=10)
+    logger.debug("API response status: %s", response.status_code)
+    
+    return _watchlist_add_result(user_id, ticker, response)
+
+def _watchlist_entry_url(ticker: str, list_url: str, list_response):
+    """Find the delete URL for a ticker in a watchlist listing; returns (url, None) or (None, error)"""
+    if list_response.status_code != 200:
+        logger.debug("Failed to get watchlist")
+        return None, {"ok": False, "error": "Unable to remove ticker from watchlist"}
+    
+    # Find the entry with matching ticker - handle both "items" and "watchlists" fields
+    item = _ticker_index(list_url, list_response, "watchlists").get(ticker)
+    entry_id = item and (item.get("id") or item.get("watchlist_id"))
+    
+    if not entry_id:
+        logger.debug("Entry not found for ticker %s", ticker)
+        return None, {"ok": False, "error": f"Ticker {ticker} not found in watchlist"}
+    
+    logger.debug("Found entry ID %s, deleting...", entry_id)
+    return f"{_WATCHLIST_BASE}/{entry_id}", None
+
+def _watchlist_remove_result(user_id: str, ticker: str, delete_response):
+    """Build the remove_from_watchlist result from the delete response"""
+    logger.debug("Delete API response status: %s", delete_response.status_code)
+    if delete_response.status_code in (200, 204):
+        _invalidate_list_cache(WATCHLIST_API_URL, user_id)
+        logger.debug("Successfully deleted %s from watchlist", ticker)
+        return {
+            "ok": True,
+            "message": f"Successfully removed {ticker} from watchlist"
         }
-        
-        print(f"[LOG] API payload: {payload}")
-        
-        response = requests.post(WATCHLIST_API_URL, json=payload, headers={"Content-Type": "application/json"}, timeout=10)
-        print(f"[LOG] API response status: {response.status_code}")
-        
-        if response.status_code in [200, 201]:  # 200 OK, 201 Created
-            result = response.json()
-            print(f"[LOG] API response success: {result}")
-            print(f"[LOG] Tool returning success response")
-            return {
-                "ok": True,
-                "message": f"Successfully added {ticker} to watchlist",
-                "api_response": result
-            }
-        elif response.status_code == 400:
-            result = response.json()
-            print(f"[LOG] API response error 400: {result}")
-            print(f"[LOG] Tool returning error response for 400")
-            return {"ok": False, "error": result.get("detail", "Unable to add ticker to watchlist")}
-        else:
-            print(f"[LOG] API response unexpected status: {response.status_code}")
-            print(f"[LOG] Tool returning error response for unexpected status")
-            return {"ok": False, "error": "Unable to add ticker to watchlist at this time"}
-        
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to API")
-        return {"ok": False, "error": "Unable to connect to watchlist service. Please check if the service is running."}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to API")
-        return {"ok": False, "error": "Watchlist service request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": f"Unexpected error adding to watchlist: {str(e)}"}
+    if delete_response.status_code == 404:
+        return {"ok": False, "error": f"Ticker {ticker} not found in watchlist"}
+    logger.debug("Failed to delete entry")
+    return {"ok": False, "error": "Unable to remove ticker from watchlist"}
+
+@tool("add_many_to_watchlist", args_schema=AddManyWatchlistInput)
+@_backend_errors("watchlist", "adding to watchlist")
+def add_many_to_watchlist(user_id: str = DEFAULT_USER_ID, items: List[Any] = ()):
+    """Add several tickers to the user's watchlist at once. Prefer this over repeated add_to_watchlist calls."""
+    logger.debug("add_many_to_watchlist called with user_id=%s, items=%s", user_id, items)
+    
+    # The schema guarantees at least one item
+    entries = [WatchlistItemInput.model_validate(item) for item in items]
+    tickers = [entry.ticker for entry in entries]
+    
+    # The backend has no batch route, so add them concurrently, one POST each; add_to_watchlist handles its own errors
+    with ThreadPoolExecutor(max_workers=min(len(entries), _FANOUT_WORKERS)) as pool:
+        results = list(pool.map(
+            lambda pair: add_to_watchlist.func(user_id, pair[0], pair[1].note),
+            zip(tickers, entries)
+        ))
+    
+    added = [ticker for ticker, result in zip(tickers, results) if result.get("ok")]
+    failed = [
+        {"ticker": ticker, "error": result.get("error")}
+        for ticker, result in zip(tickers, results) if not result.get("ok")
+    ]
+    return {
+        "ok": not failed,
+        "added": added,
+        "failed": failed,
+        "message": f"Added {len(added)} of {len(tickers)} tickers to watchlist"
+    }
 
 @tool("remove_from_watchlist", args_schema=RemoveWatchlistInput)
+@_backend_errors("watchlist", "removing from watchlist", unavailable="Unable to remove ticker from watchlist at this time")
 def remove_from_watchlist(user_id: str = DEFAULT_USER_ID, ticker: str = ""):
     """Remove a ticker from the user's watchlist by calling the watchlist API."""
-    try:
-        print(f"[LOG] remove_from_watchlist called with user_id={user_id}, ticker={ticker}")
-        
-        # Validate inputs
-        if not ticker or not ticker.strip():
-            print(f"[LOG] Validation failed: ticker is empty")
-            return {"ok": False, "error": "Ticker cannot be empty"}
-        
-        if not user_id or not user_id.strip():
-            print(f"[LOG] Validation failed: user_id is empty")
-            return {"ok": False, "error": "User ID cannot be empty"}
-        
-        ticker = ticker.strip().upper()
-        user_id = user_id.strip()
-        
-        print(f"[LOG] Getting watchlist for user {user_id} to find entry for {ticker}")
-        
-        # First, get the watchlist to find the entry ID
-        list_url = f"{WATCHLIST_API_URL}?user_id={user_id}"
-        list_response = requests.get(list_url, timeout=10)
-        print(f"[LOG] List API response status: {list_response.status_code}")
-        
-        if list_response.status_code != 200:
-            print(f"[LOG] Failed to get watchlist")
-            return {"ok": False, "error": "Unable to remove ticker from watchlist"}
-        
-        list_data = list_response.json()
-        entry_id = None
-        
-        # Find the entry with matching ticker - handle both "items" and "watchlists" fields
-        items = list_data.get("items", list_data.get("watchlists", []))
-        for item in items:
-            if item.get("ticker") == ticker:
-                entry_id = item.get("id") or item.get("watchlist_id")
-                break
-        
-        if not entry_id:
-            print(f"[LOG] Entry not found for ticker {ticker}")
-            return {"ok": False, "error": f"Ticker {ticker} not found in watchlist"}
-        
-        print(f"[LOG] Found entry ID {entry_id}, deleting...")
-        
-        # Delete the entry
-        delete_url = f"{WATCHLIST_API_URL.rstrip('/')}/{entry_id}"
-        delete_response = requests.delete(delete_url, timeout=10)
-        print(f"[LOG] Delete API response status: {delete_response.status_code}")
-        
-        if delete_response.status_code == 200:
-            print(f"[LOG] Successfully deleted entry {entry_id}")
-            return {
-                "ok": True,
-                "message": f"Successfully removed {ticker} from watchlist"
-            }
-        else:
-            print(f"[LOG] Failed to delete entry")
-            return {"ok": False, "error": "Unable to remove ticker from watchlist"}
-        
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to API")
-        return {"ok": False, "error": "Unable to remove ticker from watchlist at this time"}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to API")
-        return {"ok": False, "error": "Watchlist service request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": "Unable to remove ticker from watchlist at this time"}
+    logger.debug("remove_from_watchlist called with user_id=%s, ticker=%s", user_id, ticker)
+    
+    logger.debug("Getting watchlist for user %s to find entry for %s", user_id, ticker)
+    
+    # List + delete share one 10s budget rather than 10s each
+    remaining = _deadline(10)
+    
+    # Delete by user and ticker in one round trip when the backend supports it
+    delete_response = _filtered_delete(WATCHLIST_API_URL, user_id, ticker, remaining())
+    
+    if delete_response is None:
+        # Otherwise get the watchlist to find the entry ID
+        list_url = _lookup_url(WATCHLIST_API_URL, user_id, ticker)
+        list_response = _cached_list(list_url, timeout=remaining())
+        logger.debug("List API response status: %s", list_response.status_code)
+        
+        delete_url, error = _watchlist_entry_url(ticker, list_url, list_response)
+        if error:
+            return error
+        
+        delete_response = _backend_request("DELETE", delete_url, timeout=remaining())
+    
+    return _watchlist_remove_result(user_id, ticker, delete_response)
 
-@tool("list_watchlist", args_schema=ListWatchlistInput)
-def list_watchlist(user_id: str = DEFAULT_USER_ID):
-    """List all tickers in the user's watchlist by calling the watchlist API."""
-    try:
-        print(f"[LOG] list_watchlist called with user_id={user_id}")
-        
-        if not user_id or not user_id.strip():
-            print(f"[LOG] Validation failed: user_id is empty")
-            return {"ok": False, "error": "User ID cannot be empty"}
-        
-        user_id = user_id.strip()
-        
-        print(f"[LOG] Making API request to get watchlist for user {user_id}")
-        
-        # Make HTTP request to the watchlist API
-        api_url = f"{WATCHLIST_API_URL}?user_id={user_id}"
-        
-        response = requests.get(api_url, timeout=10)
-        print(f"[LOG] API response status: {response.status_code}")
+@tool("remove_many_from_watchlist", args_schema=RemoveManyWatchlistInput)
+@_backend_errors("watchlist", "removing from watchlist", unavailable="Unable to remove tickers from watchlist at this time")
+def remove_many_from_watchlist(user_id: str = DEFAULT_USER_ID, tickers: List[str] = ()):
+    """Remove several tickers from the user's watchlist at once. Prefer this over repeated remove_from_watchlist calls."""
+    logger.debug("remove_many_from_watchlist called with user_id=%s, tickers=%s", user_id, tickers)
+    
+    tickers = list(dict.fromkeys(tickers))
+    remaining = _deadline(10)
+    results = {}
+    
+    with ThreadPoolExecutor(max_workers=min(len(tickers), _FANOUT_WORKERS)) as pool:
+        # Delete by user and ticker concurrently when the backend supports it
+        pending = tickers
+        if _filtered_delete_supported(WATCHLIST_API_URL):
+            responses = pool.map(
+                lambda ticker: _filtered_delete(WATCHLIST_API_URL, user_id, ticker, remaining()),
+                tickers
+            )
+            pending = []
+            for ticker, delete_response in zip(tickers, responses):
+                if delete_response is None:
+                    pending.append(ticker)
+                else:
+                    results[ticker] = _watchlist_remove_result(user_id, ticker, delete_response)
         
-        if response.status_code == 200:
-            result = response.json()
-            print(f"[LOG] API response: {result}")
-            
-            # Validate the response structure - handle both "items" and "watchlists" fields
-            items = result.get("items", result.get("watchlists", []))
-            total_count = result.get("total", 0)
+        if pending:
+            # Otherwise one listing maps every ticker to its entry ID, then the deletes fan out
+            list_url = _list_url(WATCHLIST_API_URL, user_id)
+            list_response = _cached_list(list_url, timeout=remaining())
+            logger.debug("List API response status: %s", list_response.status_code)
             
-            # Check for data inconsistency
-            if total_count > 0 and (not items or len(items) == 0):
-                print(f"[LOG] Data inconsistency detected: total={total_count}, items={len(items) if items else 0}")
-                return {
-                    "ok": False,
-                    "error": f"Data inconsistency detected: API reports {total_count} items but returned empty list. This may be a temporary issue with the watchlist service.",
-                    "user_id": user_id,
-                    "api_total": total_count,
-                    "api_items_count": len(items) if items else 0
-                }
+            delete_urls = {}
+            for ticker in pending:
+                delete_url, error = _watchlist_entry_url(ticker, list_url, list_response)
+                if error:
+                    results[ticker] = error
+                else:
+                    delete_urls[ticker] = delete_url
             
-            print(f"[LOG] API response success, found {len(items)} items")
-            return {
+            responses = pool.map(
+                lambda delete_url: _backend_request("DELETE", delete_url, timeout=remaining()),
+                delete_urls.values()
+            )
+            for ticker, delete_response in zip(delete_urls, responses):
+                results[ticker] = _watchlist_remove_result(user_id, ticker, delete_response)
+    
+    removed = [ticker for ticker in tickers if results[ticker].get("ok")]
+    failed = [
+        {"ticker": ticker, "error": results[ticker].get("error")}
+        for ticker in tickers if not results[ticker].get("ok")
+    ]
+    return {
+        "ok": not failed,
+        "removed": removed,
+        "failed": failed,
+        "message": f"Removed {len(removed)} of {len(tickers)} tickers from watchlist"
+    }
+
+def _watchlist_list_result(user_id: str, response, summary_only: bool = False, fields: Optional[List[str]] = None):
+    """Build the list_watchlist result from a watchlist API response"""
+    if response.status_code == 200:
+        items, error = _list_items(user_id, response, "watchlists", "watchlist")
+        if error:
+            return error
+        
+        logger.debug("API response success, found %s items", len(items))
+        if summary_only:
+            return _mark_stale({"ok": True, "count": len(items), "user_id": user_id}, response)
+        return _mark_stale({
+            "ok": True,
+            "watchlist": _project(items, fields),
+            "count": len(items),
+            "user_id": user_id
+        }, response)
+    else:
+        logger.debug("API response failed with status %s", response.status_code)
+        try:
+            error_detail = _parse_json(response)
+            logger.debug("API error detail: %s", error_detail)
+            return {"ok": False, "error": f"Watchlist API error: {error_detail.get('detail', 'Unknown error')}"}
+        except ValueError:
+            return {"ok": False, "error": f"Unable to retrieve watchlist (HTTP {response.status_code})"}
+
+@tool("list_watchlist", args_schema=ListWatchlistInput)
+@_backend_errors("watchlist", "retrieving watchlist")
+def list_watchlist(user_id: str = DEFAULT_USER_ID, summary_only: bool = False, fields: Optional[List[str]] = None):
+    """List all tickers in the user's watchlist by calling the watchlist API. Pass summary_only=True when only the number of entries is needed, or fields to return only some fields of each entry."""
+    logger.debug("list_watchlist called with user_id=%s, summary_only=%s, fields=%s", user_id, summary_only, fields)
+    
+    logger.debug("Making API request to get watchlist for user %s", user_id)
+    
+    # Make HTTP request to the watchlist API
+    api_url = _list_url(WATCHLIST_API_URL, user_id)
+    
+    response = _cached_list(api_url, stale_ok=True)
+    logger.debug("API response status: %s", response.status_code)
+    
+    return _watchlist_list_result(user_id, response, summary_only, fields)
+
+def _watchlist_entry_result(user_id: str, ticker: str, api_url: str, response):
+    """Build the get_watchlist_entry result from a watchlist API response"""
+    if response.status_code == 200:
+        items, error = _list_items(user_id, response, "watchlists", "watchlist")
+        if error:
+            return error
+        
+        # Find the entry with matching ticker
+        item = _ticker_index(api_url, response, "watchlists", items).get(ticker)
+        if item is not None:
+            logger.debug("Found entry for ticker %s", ticker)
+            return _mark_stale({
                 "ok": True,
-                "watchlist": items,
-                "count": len(items),
-                "user_id": user_id
-            }
-        else:
-            print(f"[LOG] API response failed with status {response.status_code}")
-            try:
-                error_detail = response.json()
-                print(f"[LOG] API error detail: {error_detail}")
-                return {"ok": False, "error": f"Watchlist API error: {error_detail.get('detail', 'Unknown error')}"}
-            except:
-                return {"ok": False, "error": f"Unable to retrieve watchlist (HTTP {response.status_code})"}
+                "entry": item,
+                "message": f"Found {ticker} in watchlist"
+            }, response)
         
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to API")
-        return {"ok": False, "error": "Unable to connect to watchlist service. Please check if the service is running."}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to API")
-        return {"ok": False, "error": "Watchlist service request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": f"Unexpected error retrieving watchlist: {str(e)}"}
+        logger.debug("Entry not found for ticker %s", ticker)
+        return {
+            "ok": False, 
+            "error": f"Ticker {ticker} not found in watchlist",
+            "user_id": user_id
+        }
+    else:
+        logger.debug("API response failed with status %s", response.status_code)
+        try:
+            error_detail = _parse_json(response)
+            logger.debug("API error detail: %s", error_detail)
+            return {"ok": False, "error": f"Watchlist API error: {error_detail.get('detail', 'Unknown error')}"}
+        except ValueError:
+            return {"ok": False, "error": f"Unable to retrieve watchlist entry (HTTP {response.status_code})"}
 
 @tool("get_watchlist_entry", args_schema=GetWatchlistEntryInput)
+@_backend_errors("watchlist", "retrieving watchlist entry", unavailable="Unable to retrieve watchlist entry at this time")
 def get_watchlist_entry(user_id: str = DEFAULT_USER_ID, ticker: str = ""):
     """Get a specific watchlist entry by ticker for a user by calling the watchlist API."""
+    logger.debug("get_watchlist_entry called with user_id=%s, ticker=%s", user_id, ticker)
+    
+    logger.debug("Making API request to get watchlist for user %s", user_id)
+    
+    # Make HTTP request to the watchlist API
+    api_url = _lookup_url(WATCHLIST_API_URL, user_id, ticker)
+    
+    response = _cached_list(api_url, stale_ok=True)
+    logger.debug("API response status: %s", response.status_code)
+    
+    return _watchlist_entry_result(user_id, ticker, api_url, response)
+
+# ====== Snapshot Tools ======
+def _snapshot_result(user_id: str, portfolio: Dict[str, Any], summary: Dict[str, Any], watchlist: Dict[str, Any]):
+    """Combine the portfolio, summary and watchlist tool results"""
+    return {
+        "ok": portfolio["ok"] and summary["ok"] and watchlist["ok"],
+        "user_id": user_id,
+        "portfolio": portfolio,
+        "summary": summary,
+        "watchlist": watchlist
+    }
+
+@tool("get_user_snapshot", args_schema=GetUserSnapshotInput)
+def get_user_snapshot(user_id: str = DEFAULT_USER_ID, include_pnl: bool = True):
+    """Get the user's portfolio holdings, portfolio summary and watchlist in one call. Prefer this over separate calls when more than one of them is needed."""
+    logger.debug("get_user_snapshot called with user_id=%s, include_pnl=%s", user_id, include_pnl)
+    
+    # Fetch all three concurrently; each tool handles its own errors
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        portfolio = pool.submit(list_portfolio.func, user_id)
+        summary = pool.submit(get_portfolio_summary.func, user_id, include_pnl)
+        watchlist = pool.submit(list_watchlist.func, user_id)
+        return _snapshot_result(user_id, portfolio.result(), summary.result(), watchlist.result())
+
+# ====== Other Tools ======
+# Result filters whose response section has the same {"total", "results"} shape
+_SECTION_RESULT_TYPES = frozenset(("news", "videos", "locations", "faq", "discussions"))
+# Sections combined for "mixed" searches
+_MIXED_RESULT_TYPES = ("web", "news", "videos", "locations")
+
+_SEARCH_CACHE_SIZE = 256
+# Successful web_search results by (normalized query, search options); entries are (expires_at, result)
+_SEARCH_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_SEARCH_CACHE_LOCK = threading.Lock()
+
+def _search_key(query: str) -> str:
+    """Normalize a search query so queries differing only in case or whitespace share a cache entry"""
+    # Punctuation and word order are kept: "apple -fruit", "S&P 500" and "BRK.B" mean something else without them
+    return " ".join(query.lower().split())
+
+def _search_cache_get(key: tuple):
+    """Return a cached web_search result that hasn't expired, or None"""
+    with _SEARCH_CACHE_LOCK:
+        entry = _SEARCH_CACHE.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del _SEARCH_CACHE[key]
+            return None
+        _SEARCH_CACHE.move_to_end(key)
+        return result
+
+def _search_cache_put(key: tuple, result: Dict[str, Any]):
+    """Cache a successful web_search result"""
+    with _SEARCH_CACHE_LOCK:
+        _SEARCH_CACHE[key] = (time.monotonic() + WEB_SEARCH_CACHE_TTL, result)
+        _SEARCH_CACHE.move_to_end(key)
+        while len(_SEARCH_CACHE) > _SEARCH_CACHE_SIZE:
+            _SEARCH_CACHE.popitem(last=False)
+
+# In-flight web searches by cache key, so identical searches made in parallel share one request
+_SEARCH_FETCHES: Dict[tuple, Future] = {}
+_SEARCH_FETCHES_LOCK = threading.Lock()
+_ASEARCH_FETCHES: Dict[tuple, "asyncio.Future"] = {}
+
+def _shared_search(key: tuple, search, timeout: float):
+    """Run search() for key unless the same search is already running, in which case wait for its result"""
+    with _SEARCH_FETCHES_LOCK:
+        fetch = _SEARCH_FETCHES.get(key)
+        leader = fetch is None
+        if leader:
+            fetch = _SEARCH_FETCHES[key] = Future()
+    if not leader:
+        try:
+            return fetch.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise requests.exceptions.Timeout("Timed out waiting for a shared web search")
+    
     try:
-        print(f"[LOG] get_watchlist_entry called with user_id={user_id}, ticker={ticker}")
-        
-        # Validate inputs
-        if not ticker or not ticker.strip():
-            print(f"[LOG] Validation failed: ticker is empty")
-            return {"ok": False, "error": "Ticker cannot be empty"}
-        
-        if not user_id or not user_id.strip():
-            print(f"[LOG] Validation failed: user_id is empty")
-            return {"ok": False, "error": "User ID cannot be empty"}
-        
-        ticker = ticker.strip().upper()
-        user_id = user_id.strip()
-        
-        print(f"[LOG] Making API request to get watchlist for user {user_id}")
-        
-        # Make HTTP request to the watchlist API
-        api_url = f"{WATCHLIST_API_URL}?user_id={user_id}"
-        
-        response = requests.get(api_url, timeout=10)
-        print(f"[LOG] API response status: {response.status_code}")
+        result = search()
+        fetch.set_result(result)
+        return result
+    except BaseException as e:
+        fetch.set_exception(e)
+        raise
+    finally:
+        with _SEARCH_FETCHES_LOCK:
+            _SEARCH_FETCHES.pop(key, None)
+
+async def _ashared_search(key: tuple, search):
+    """Async counterpart of _shared_search"""
+    fetch = _ASEARCH_FETCHES.get(key)
+    if fetch is None:
+        fetch = asyncio.ensure_future(search())
+        _ASEARCH_FETCHES[key] = fetch
+        fetch.add_done_callback(lambda done: _ASEARCH_FETCHES.pop(key, None))
+    return await asyncio.shield(fetch)
+
+# Web search failures whose message doesn't depend on the response body
+_WEB_SEARCH_STATUS_ERRORS = {
+    401: "Web search service authentication failed",
+    429: "Web search rate limit exceeded. Please try again later.",
+}
+
+def _web_search_result(query: str, result_filter: str, count: int, response):
+    """Build the web_search result from a web search API response"""
+    if response.status_code == 200:
+        result = _parse_json(response)
+        logger.debug("API response success: %s", result)
+        
+        # Extract relevant information from the response
+        search_results = {
+            "query": result.get("query", {}).get("original", query),
+            "total_results": 0,
+            "results": [],
+            "result_type": result_filter
+        }
         
-        if response.status_code == 200:
-            result = response.json()
-            print(f"[LOG] API response: {result}")
-            
-            # Validate the response structure - handle both "items" and "watchlists" fields
-            items = result.get("items", result.get("watchlists", []))
-            total_count = result.get("total", 0)
-            
-            # Check for data inconsistency
-            if total_count > 0 and (not items or len(items) == 0):
-                print(f"[LOG] Data inconsistency detected: total={total_count}, items={len(items) if items else 0}")
-                return {
-                    "ok": False,
-                    "error": f"Data inconsistency detected: API reports {total_count} items but returned empty list. This may be a temporary issue with the watchlist service.",
-                    "user_id": user_id,
-                    "api_total": total_count,
-                    "api_items_count": len(items) if items else 0
-                }
-            
-            # Find the entry with matching ticker
-            for item in items:
-                if item.get("ticker") == ticker:
-                    print(f"[LOG] Found entry for ticker {ticker}")
-                    return {
-                        "ok": True,
-                        "entry": item,
-                        "message": f"Found {ticker} in watchlist"
-                    }
-            
-            print(f"[LOG] Entry not found for ticker {ticker}")
-            return {
-                "ok": False, 
-                "error": f"Ticker {ticker} not found in watchlist",
-                "user_id": user_id
-            }
+        # Handle different result types
+        if result_filter == "infobox" and "infobox" in result:
+            search_results["infobox"] = result["infobox"]
+        elif result_filter == "mixed":
+            # For mixed results, combine all available result types, distributed evenly
+            per_type = max(1, count // len(_MIXED_RESULT_TYPES))
+            sections = [result[result_type] for result_type in _MIXED_RESULT_TYPES if result.get(result_type)]
+            search_results["total_results"] = sum(section.get("total", 0) for section in sections)
+            search_results["results"] = list(islice(
+                chain.from_iterable(islice(section.get("results", ()), per_type) for section in sections), count
+            ))
         else:
-            print(f"[LOG] API response failed with status {response.status_code}")
-            try:
-                error_detail = response.json()
-                print(f"[LOG] API error detail: {error_detail}")
-                return {"ok": False, "error": f"Watchlist API error: {error_detail.get('detail', 'Unknown error')}"}
-            except:
-                return {"ok": False, "error": f"Unable to retrieve watchlist entry (HTTP {response.status_code})"}
+            # Sections share one shape; default to web results when the requested one is missing
+            section = result.get(result_filter) if result_filter in _SECTION_RESULT_TYPES else None
+            if section is None:
+                section = result.get("web", {})
+            search_results["total_results"] = section.get("total", 0)
+            search_results["results"] = section.get("results", [])
+        
+        return {
+            "ok": True,
+            "search_results": search_results,
+            "message": f"Successfully performed {result_filter} search for '{query}'"
+        }
         
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to API")
-        return {"ok": False, "error": "Unable to retrieve watchlist entry at this time"}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to API")
-        return {"ok": False, "error": "Watchlist service request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": "Unable to retrieve watchlist entry at this time"}
+    elif response.status_code == 400:
+        result = _parse_json(response)
+        logger.debug("API response error 400: %s", result)
+        return {"ok": False, "error": result.get("detail", "Invalid search request")}
+    elif response.status_code in _WEB_SEARCH_STATUS_ERRORS:
+        logger.debug("API response error %s", response.status_code)
+        return {"ok": False, "error": _WEB_SEARCH_STATUS_ERRORS[response.status_code]}
+    elif response.status_code == 500:
+        result = _parse_json(response)
+        logger.debug("API response error 500: %s", result)
+        error_msg = result.get("detail", "Web search service error")
+        if "API key not configured" in error_msg:
+            return {"ok": False, "error": "Web search service not properly configured"}
+        return {"ok": False, "error": error_msg}
+    else:
+        logger.debug("API response unexpected status: %s", response.status_code)
+        return {"ok": False, "error": f"Web search service error (HTTP {response.status_code})"}
 
-# ====== Other Tools ======
 @tool("web_search", args_schema=WebSearchInput)
+@_backend_errors("web search", "during web search")
 def web_search(query: str, result_filter: str = "web", search_lang: str = "en_US", 
                country: str = "US", ui_lang: str = "en", count: int = 10, 
                offset: int = 0, safesearch: str = "moderate"):
     """Perform a web search using the Brave Search API through our web search endpoint."""
-    try:
-        print(f"[LOG] web_search called with query='{query}', filter='{result_filter}', count={count}")
-        
-        # Validate inputs
-        if not query or not query.strip():
-            print(f"[LOG] Validation failed: query is empty")
-            return {"ok": False, "error": "Search query cannot be empty"}
-        
-        if len(query.strip()) > 500:
-            print(f"[LOG] Validation failed: query too long ({len(query.strip())} chars)")
-            return {"ok": False, "error": "Search query cannot exceed 500 characters"}
-        
-        query = query.strip()
-        
-        # Validate count
-        if count < 1 or count > 50:
-            print(f"[LOG] Validation failed: count out of range ({count})")
-            return {"ok": False, "error": "Count must be between 1 and 50"}
-        
-        # Validate offset
-        if offset < 0:
-            print(f"[LOG] Validation failed: offset negative ({offset})")
-            return {"ok": False, "error": "Offset cannot be negative"}
-        
-        print(f"[LOG] Making API request to web search endpoint")
-        
-        # Prepare the request payload
-        payload = {
-            "query": query,
-            "result_filter": result_filter,
-            "search_lang": search_lang,
-            "country": country,
-            "ui_lang": ui_lang,
-            "count": count,
-            "offset": offset,
-            "safesearch": safesearch
-        }
-        
-        print(f"[LOG] API payload: {payload}")
-        
+    logger.debug("web_search called with query='%s', filter='%s', count=%s", query, result_filter, count)
+    
+    # Agents often repeat a search in slightly different words within one conversation
+    cache_key = (_search_key(query), result_filter, search_lang, country, ui_lang, count, offset, safesearch)
+    cached = _search_cache_get(cache_key)
+    if cached is not None:
+        logger.debug("Web search cache hit for '%s'", query)
+        return cached
+    
+    logger.debug("Making API request to web search endpoint")
+    
+    # Prepare the request payload
+    payload = {
+        "query": query,
+        "result_filter": result_filter,
+        "search_lang": search_lang,
+        "country": country,
+        "ui_lang": ui_lang,
+        "count": count,
+        "offset": offset,
+        "safesearch": safesearch
+    }
+    
+    logger.debug("API payload: %s", payload)
+    
+    def search():
         # Make HTTP request to the web search API
-        response = requests.post(
+        response = _backend_request(
+            "POST",
             WEB_SEARCH_API_URL, 
-            json=payload, 
-            headers={"Content-Type": "application/json"}, 
+            data=json_utils.dumps_bytes(payload), 
+            headers=_JSON_HEADERS, 
             timeout=30
         )
-        print(f"[LOG] API response status: {response.status_code}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"[LOG] API response success: {result}")
-            
-            # Extract relevant information from the response
-            search_results = {
-                "query": result.get("query", {}).get("original", query),
-                "total_results": 0,
-                "results": [],
-                "result_type": result_filter
-            }
-            
-            # Handle different result types
-            if result_filter == "news" and "news" in result:
-                news_data = result["news"]
-                search_results["total_results"] = news_data.get("total", 0)
-                search_results["results"] = news_data.get("results", [])
-            elif result_filter == "videos" and "videos" in result:
-                videos_data = result["videos"]
-                search_results["total_results"] = videos_data.get("total", 0)
-                search_results["results"] = videos_data.get("results", [])
-            elif result_filter == "locations" and "locations" in result:
-                locations_data = result["locations"]
-                search_results["total_results"] = locations_data.get("total", 0)
-                search_results["results"] = locations_data.get("results", [])
-            elif result_filter == "faq" and "faq" in result:
-                faq_data = result["faq"]
-                search_results["total_results"] = faq_data.get("total", 0)
-                search_results["results"] = faq_data.get("results", [])
-            elif result_filter == "discussions" and "discussions" in result:
-                discussions_data = result["discussions"]
-                search_results["total_results"] = discussions_data.get("total", 0)
-                search_results["results"] = discussions_data.get("results", [])
-            elif result_filter == "infobox" and "infobox" in result:
-                infobox_data = result["infobox"]
-                search_results["infobox"] = infobox_data
-            elif result_filter == "mixed":
-                # For mixed results, combine all available result types
-                all_results = []
-                total_count = 0
-                for result_type in ["web", "news", "videos", "locations"]:
-                    if result_type in result:
-                        type_data = result[result_type]
-                        type_results = type_data.get("results", [])
-                        all_results.extend(type_results[:count//4])  # Distribute evenly
-                        total_count += type_data.get("total", 0)
-                search_results["total_results"] = total_count
-                search_results["results"] = all_results[:count]
-            else:
-                # Default to web results
-                web_data = result.get("web", {})
-                search_results["total_results"] = web_data.get("total", 0)
-                search_results["results"] = web_data.get("results", [])
-            
-            return {
-                "ok": True,
-                "search_results": search_results,
-                "message": f"Successfully performed {result_filter} search for '{query}'"
-            }
-            
-        elif response.status_code == 400:
-            result = response.json()
-            print(f"[LOG] API response error 400: {result}")
-            return {"ok": False, "error": result.get("detail", "Invalid search request")}
-        elif response.status_code == 401:
-            print(f"[LOG] API response error 401: Unauthorized")
-            return {"ok": False, "error": "Web search service authentication failed"}
-        elif response.status_code == 429:
-            print(f"[LOG] API response error 429: Rate limit exceeded")
-            return {"ok": False, "error": "Web search rate limit exceeded. Please try again later."}
-        elif response.status_code == 500:
-            result = response.json()
-            print(f"[LOG] API response error 500: {result}")
-            error_msg = result.get("detail", "Web search service error")
-            if "API key not configured" in error_msg:
-                return {"ok": False, "error": "Web search service not properly configured"}
-            return {"ok": False, "error": error_msg}
-        else:
-            print(f"[LOG] API response unexpected status: {response.status_code}")
-            return {"ok": False, "error": f"Web search service error (HTTP {response.status_code})"}
-        
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to web search API")
-        return {"ok": False, "error": "Unable to connect to web search service. Please check if the service is running."}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to web search API")
-        return {"ok": False, "error": "Web search request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": f"Unexpected error during web search: {str(e)}"}
+        logger.debug("API response status: %s", response.status_code)
+        
+        result = _web_search_result(query, result_filter, count, response)
+        if result["ok"]:
+            _search_cache_put(cache_key, result)
+        return result
+    
+    return _shared_search(cache_key, search, timeout=30)
 
 # ====== Stress Test Tool ======
+def _stress_test_result(target_url: str, num_requests: int, outcomes: List[Dict[str, Any]], total_time: float):
+    """Summarize per-request stress test outcomes"""
+    succeeded = [result for result in outcomes if result["success"]]
+    errors = {result["error"] for result in outcomes if not result["success"]}
+    # Track status codes
+    status_codes = Counter(result["status_code"] for result in succeeded)
+    response_times = [result["response_time"] for result in succeeded]
+    avg_response_time = fmean(response_times) if response_times else 0
+    # quantiles() needs two points; a single response is every percentile
+    if len(response_times) >= 2:
+        percentiles = quantiles(response_times, n=100, method="inclusive")
+        p50, p95, p99 = percentiles[49], percentiles[94], percentiles[98]
+    else:
+        p50 = p95 = p99 = response_times[0] if response_times else 0
+    
+    # Calculate success rate
+    success_rate = (len(succeeded) / num_requests) * 100 if num_requests > 0 else 0
+    
+    logger.debug("Stress test completed: %s/%s successful (%.1f%%)", len(succeeded), num_requests, success_rate)
+    
+    return {
+        "ok": True,
+        "message": f"Stress test completed for {target_url}",
+        "results": {
+            "target_url": target_url,
+            "total_requests": num_requests,
+            "successful_requests": len(succeeded),
+            "failed_requests": len(outcomes) - len(succeeded),
+            "success_rate_percent": round(success_rate, 1),
+            "total_test_time_seconds": round(total_time, 2),
+            "average_response_time_seconds": round(avg_response_time, 3),
+            "p50_response_time_seconds": round(p50, 3),
+            "p95_response_time_seconds": round(p95, 3),
+            "p99_response_time_seconds": round(p99, 3),
+            "status_code_distribution": dict(status_codes),
+            "common_errors": list(errors)
+        }
+    }
+
+# Bodies up to this size are read and discarded after the headers so the connection goes back to the pool;
+# closing a response mid-body drops its connection and the next request pays for a new one
+_STRESS_DRAIN_LIMIT = 64 * 1024
+
+def _drainable(response) -> bool:
+    """Whether a streamed stress_test response is small enough to read off before reusing its connection"""
+    length = response.headers.get("content-length")
+    return length is None or (length.isdigit() and int(length) <= _STRESS_DRAIN_LIMIT)
+
 @tool("stress_test", args_schema=StressTestInput)
-def stress_test(target_url: str, num_requests: int = 10, timeout_seconds: int = 5):
+def stress_test(target_url: str, num_requests: int = 10, timeout_seconds: int = 5, measure_body: bool = False):
     """Perform a simple stress test by sending multiple concurrent HTTP requests to a target URL."""
-    try:
-        print(f"[LOG] stress_test called with target_url={target_url}, num_requests={num_requests}, timeout_seconds={timeout_seconds}")
-        
-        # Validate inputs
-        if not target_url or not target_url.strip():
-            return {"ok": False, "error": "Target URL cannot be empty"}
-        
-        if not target_url.startswith(('http://', 'https://')):
-            return {"ok": False, "error": "Target URL must start with http:// or https://"}
-        
-        target_url = target_url.strip()
-        
-        print(f"[LOG] Starting stress test with {num_requests} requests to {target_url}")
-        
-        import concurrent.futures
-        import time
-        
-        results = {
-            "successful": 0,
-            "failed": 0,
-            "total_time": 0,
-            "avg_response_time": 0,
-            "status_codes": {},
-            "errors": []
-        }
-        
-        start_time = time.time()
-        
-        def make_request():
-            try:
-                response = requests.get(target_url, timeout=timeout_seconds)
-                return {
-                    "status_code": response.status_code,
-                    "response_time": response.elapsed.total_seconds(),
-                    "success": True
-                }
-            except requests.exceptions.Timeout:
-                return {
-                    "status_code": None,
-                    "response_time": timeout_seconds,
-                    "success": False,
-                    "error": "Timeout"
-                }
-            except requests.exceptions.ConnectionError:
-                return {
-                    "status_code": None,
-                    "response_time": 0,
-                    "success": False,
-                    "error": "Connection Error"
-                }
-            except Exception as e:
-                return {
-                    "status_code": None,
-                    "response_time": 0,
-                    "success": False,
-                    "error": str(e)
-                }
-        
-        # Use ThreadPoolExecutor for concurrent requests
-        with concurrent.futures.ThreadPoolExecutor(max_workers=min(num_requests, 20)) as executor:
-            # Submit all requests
-            future_to_request = {executor.submit(make_request): i for i in range(num_requests)}
-            
-            # Collect results as they complete
-            response_times = []
-            for future in concurrent.futures.as_completed(future_to_request):
-                result = future.result()
-                
-                if result["success"]:
-                    results["successful"] += 1
-                    response_times.append(result["response_time"])
-                    
-                    # Track status codes
-                    status_code = result["status_code"]
-                    results["status_codes"][status_code] = results["status_codes"].get(status_code, 0) + 1
-                else:
-                    results["failed"] += 1
-                    results["errors"].append(result["error"])
-        
-        total_time = time.time() - start_time
-        results["total_time"] = total_time
-        
-        if response_times:
-            results["avg_response_time"] = sum(response_times) / len(response_times)
-        
-        # Calculate success rate
-        success_rate = (results["successful"] / num_requests) * 100 if num_requests > 0 else 0
-        
-        print(f"[LOG] Stress test completed: {results['successful']}/{num_requests} successful ({success_rate:.1f}%)")
-        
-        return {
-            "ok": True,
-            "message": f"Stress test completed for {target_url}",
-            "results": {
-                "target_url": target_url,
-                "total_requests": num_requests,
-                "successful_requests": results["successful"],
-                "failed_requests": results["failed"],
-                "success_rate_percent": round(success_rate, 1),
-                "total_test_time_seconds": round(total_time, 2),
-                "average_response_time_seconds": round(results["avg_response_time"], 3),
-                "status_code_distribution": results["status_codes"],
-                "common_errors": list(set(results["errors"])) if results["errors"] else []
+    logger.debug("stress_test called with target_url=%s, num_requests=%s, timeout_seconds=%s", target_url, num_requests, timeout_seconds)
+    
+    logger.debug("Starting stress test with %s requests to %s", num_requests, target_url)
+    
+    import concurrent.futures
+    
+    workers = min(num_requests, 20)
+    # A run-scoped session reuses connections between requests without the shared session's retries,
+    # which would hide the failures being measured
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_maxsize=workers))
+    session.mount("https://", HTTPAdapter(pool_maxsize=workers))
+    # Every request is identical, so the URL is parsed and the request built once
+    prepared = session.prepare_request(requests.Request("GET", target_url))
+    
+    start_time = time.time()
+    
+    def make_request():
+        try:
+            sent_at = time.perf_counter()
+            # Unless the body is being measured, stop once the headers are in rather than downloading it
+            response = session.send(prepared.copy(), timeout=timeout_seconds, stream=not measure_body)
+            if not measure_body and _drainable(response):
+                response.raw.drain_conn()
+            response.close()
+            return {
+                "status_code": response.status_code,
+                "response_time": time.perf_counter() - sent_at if measure_body else response.elapsed.total_seconds(),
+                "success": True
             }
-        }
-        
-    except Exception as e:
-        print(f"[LOG] Unexpected error during stress test: {str(e)}")
-        return {"ok": False, "error": f"Unexpected error during stress test: {str(e)}"}
+        except requests.exceptions.Timeout:
+            return {
+                "status_code": None,
+                "response_time": timeout_seconds,
+                "success": False,
+                "error": "Timeout"
+            }
+        except requests.exceptions.ConnectionError:
+            return {
+                "status_code": None,
+                "response_time": 0,
+                "success": False,
+                "error": "Connection Error"
+            }
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return {
+                "status_code": None,
+                "response_time": 0,
+                "success": False,
+                "error": str(e)
+            }
+    
+    # Use ThreadPoolExecutor for concurrent requests
+    with session, concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(lambda _: make_request(), range(num_requests)))
+    
+    return _stress_test_result(target_url, num_requests, outcomes, time.time() - start_time)
 
 # ====== User Preferences Tools ======
 @tool("get_user_preferences", args_schema=GetUserPreferencesInput)
+@_backend_errors("user preferences", "retrieving user preferences")
 def get_user_preferences(user_id: str):
     """Get user preferences by user ID from the external user preferences API."""
-    try:
-        print(f"[LOG] get_user_preferences called with user_id={user_id}")
-        
-        if not user_id or not user_id.strip():
-            return {"ok": False, "error": "User ID cannot be empty"}
-        
-        user_id = user_id.strip()
-        
-        print(f"[LOG] Making API request to get user preferences for user {user_id}")
-        
-        # Make HTTP request to the user preferences API
-        api_url = f"{USER_PREFERENCES_API_URL}{user_id}"
-        
-        response = requests.get(api_url, timeout=10)
-        print(f"[LOG] API response status: {response.status_code}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"[LOG] API response success: {result}")
-            return {
-                "ok": True,
-                "preferences": result,
-                "user_id": user_id
-            }
-        elif response.status_code == 404:
-            return {"ok": False, "error": "User preferences not found"}
-        else:
-            print(f"[LOG] API response failed with status {response.status_code}")
-            try:
-                error_detail = response.json()
-                return {"ok": False, "error": f"User preferences API error: {error_detail.get('detail', 'Unknown error')}"}
-            except:
-                return {"ok": False, "error": f"Unable to retrieve user preferences (HTTP {response.status_code})"}
-        
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to API")
-        return {"ok": False, "error": "Unable to connect to user preferences service. Please check if the service is running."}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to API")
-        return {"ok": False, "error": "User preferences service request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": f"Unexpected error retrieving user preferences: {str(e)}"}
+    logger.debug("get_user_preferences called with user_id=%s", user_id)
+    
+    logger.debug("Making API request to get user preferences for user %s", user_id)
+    
+    # Make HTTP request to the user preferences API
+    api_url = _user_url(USER_PREFERENCES_API_URL, user_id)
+    
+    # Loaded for every chat message, so reuse a recent copy; create/update drop it
+    response = _cached_list(api_url, ttl=PREFERENCE_CACHE_TTL)
+    logger.debug("API response status: %s", response.status_code)
+    
+    if response.status_code == 200:
+        result = _parse_json(response)
+        logger.debug("API response success: %s", result)
+        return {
+            "ok": True,
+            "preferences": result,
+            "user_id": user_id
+        }
+    elif response.status_code == 404:
+        return {"ok": False, "error": "User preferences not found"}
+    else:
+        logger.debug("API response failed with status %s", response.status_code)
+        try:
+            error_detail = _parse_json(response)
+            return {"ok": False, "error": f"User preferences API error: {error_detail.get('detail', 'Unknown error')}"}
+        except ValueError:
+            return {"ok": False, "error": f"Unable to retrieve user preferences (HTTP {response.status_code})"}
+
+def _preferences_payload(**preferences) -> Dict[str, Any]:
+    """Keep the preference fields that were given a value"""
+    return {field: value for field, value in preferences.items() if value}
 
 @tool("create_user_preferences", args_schema=UserPreferencesInput)
+@_backend_errors("user preferences", "creating user preferences")
 def create_user_preferences(user_id: str, experience_level: Optional[str] = None, 
                            investment_style: Optional[str] = None, risk_tolerance: Optional[str] = None,
                            communication_style: Optional[str] = None, preferred_sectors: Optional[List[str]] = None,
@@ -874,74 +1486,44 @@ def create_user_preferences(user_id: str, experience_level: Optional[str] = None
                            preferred_asset_classes: Optional[List[str]] = None, language: Optional[str] = None,
                            currency: Optional[str] = None, timezone: Optional[str] = None):
     """Create new user preferences by calling the external user preferences API."""
-    try:
-        print(f"[LOG] create_user_preferences called with user_id={user_id}")
-        
-        if not user_id or not user_id.strip():
-            return {"ok": False, "error": "User ID cannot be empty"}
-        
-        user_id = user_id.strip()
-        
-        # Build payload with only provided values
-        payload = {"user_id": user_id}
-        if experience_level:
-            payload["experience_level"] = experience_level
-        if investment_style:
-            payload["investment_style"] = investment_style
-        if risk_tolerance:
-            payload["risk_tolerance"] = risk_tolerance
-        if communication_style:
-            payload["communication_style"] = communication_style
-        if preferred_sectors:
-            payload["preferred_sectors"] = preferred_sectors
-        if investment_goals:
-            payload["investment_goals"] = investment_goals
-        if preferred_timeframe:
-            payload["preferred_timeframe"] = preferred_timeframe
-        if preferred_asset_classes:
-            payload["preferred_asset_classes"] = preferred_asset_classes
-        if language:
-            payload["language"] = language
-        if currency:
-            payload["currency"] = currency
-        if timezone:
-            payload["timezone"] = timezone
-        
-        print(f"[LOG] Making API request to create user preferences for user {user_id}")
-        print(f"[LOG] API payload: {payload}")
-        
-        # Make HTTP request to the user preferences API
-        response = requests.post(USER_PREFERENCES_API_URL, json=payload, 
-                               headers={"Content-Type": "application/json"}, timeout=10)
-        print(f"[LOG] API response status: {response.status_code}")
-        
-        if response.status_code in [200, 201]:
-            result = response.json()
-            print(f"[LOG] API response success: {result}")
-            return {
-                "ok": True,
-                "message": "Successfully created user preferences",
-                "preferences": result,
-                "user_id": user_id
-            }
-        elif response.status_code == 400:
-            result = response.json()
-            return {"ok": False, "error": result.get("detail", "Unable to create user preferences")}
-        else:
-            print(f"[LOG] API response unexpected status: {response.status_code}")
-            return {"ok": False, "error": "Unable to create user preferences at this time"}
-        
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to API")
-        return {"ok": False, "error": "Unable to connect to user preferences service. Please check if the service is running."}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to API")
-        return {"ok": False, "error": "User preferences service request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": f"Unexpected error creating user preferences: {str(e)}"}
+    logger.debug("create_user_preferences called with user_id=%s", user_id)
+    
+    # Build payload with only provided values
+    payload = {"user_id": user_id, **_preferences_payload(
+        experience_level=experience_level, investment_style=investment_style, risk_tolerance=risk_tolerance,
+        communication_style=communication_style, preferred_sectors=preferred_sectors,
+        investment_goals=investment_goals, preferred_timeframe=preferred_timeframe,
+        preferred_asset_classes=preferred_asset_classes, language=language, currency=currency, timezone=timezone
+    )}
+    
+    logger.debug("Making API request to create user preferences for user %s", user_id)
+    logger.debug("API payload: %s", payload)
+    
+    # Make HTTP request to the user preferences API
+    response = _backend_request("POST", USER_PREFERENCES_API_URL, data=json_utils.dumps_bytes(payload),
+                                headers=_JSON_HEADERS, timeout=10)
+    logger.debug("API response status: %s", response.status_code)
+    
+    if response.status_code in [200, 201]:
+        _list_cache_drop(_user_url(USER_PREFERENCES_API_URL, user_id))
+        _invalidate_user_cache(_HISTORY_USER_BASE, user_id)
+        result = _parse_json(response)
+        logger.debug("API response success: %s", result)
+        return {
+            "ok": True,
+            "message": "Successfully created user preferences",
+            "preferences": result,
+            "user_id": user_id
+        }
+    elif response.status_code == 400:
+        result = _parse_json(response)
+        return {"ok": False, "error": result.get("detail", "Unable to create user preferences")}
+    else:
+        logger.debug("API response unexpected status: %s", response.status_code)
+        return {"ok": False, "error": "Unable to create user preferences at this time"}
 
 @tool("update_user_preferences", args_schema=UserPreferencesInput)
+@_backend_errors("user preferences", "updating user preferences")
 def update_user_preferences(user_id: str, experience_level: Optional[str] = None, 
                            investment_style: Optional[str] = None, risk_tolerance: Optional[str] = None,
                            communication_style: Optional[str] = None, preferred_sectors: Optional[List[str]] = None,
@@ -949,250 +1531,420 @@ def update_user_preferences(user_id: str, experience_level: Optional[str] = None
                            preferred_asset_classes: Optional[List[str]] = None, language: Optional[str] = None,
                            currency: Optional[str] = None, timezone: Optional[str] = None):
     """Update user preferences by calling the external user preferences API."""
-    try:
-        print(f"[LOG] update_user_preferences called with user_id={user_id}")
-        
-        if not user_id or not user_id.strip():
-            return {"ok": False, "error": "User ID cannot be empty"}
-        
-        user_id = user_id.strip()
-        
-        # Build payload with only provided values
-        payload = {}
-        if experience_level:
-            payload["experience_level"] = experience_level
-        if investment_style:
-            payload["investment_style"] = investment_style
-        if risk_tolerance:
-            payload["risk_tolerance"] = risk_tolerance
-        if communication_style:
-            payload["communication_style"] = communication_style
-        if preferred_sectors:
-            payload["preferred_sectors"] = preferred_sectors
-        if investment_goals:
-            payload["investment_goals"] = investment_goals
-        if preferred_timeframe:
-            payload["preferred_timeframe"] = preferred_timeframe
-        if preferred_asset_classes:
-            payload["preferred_asset_classes"] = preferred_asset_classes
-        if language:
-            payload["language"] = language
-        if currency:
-            payload["currency"] = currency
-        if timezone:
-            payload["timezone"] = timezone
-        
-        if not payload:
-            return {"ok": False, "error": "No fields provided for update"}
-        
-        print(f"[LOG] Making API request to update user preferences for user {user_id}")
-        print(f"[LOG] API payload: {payload}")
-        
-        # Make HTTP request to the user preferences API
-        api_url = f"{USER_PREFERENCES_API_URL}{user_id}"
-        response = requests.put(api_url, json=payload, 
-                              headers={"Content-Type": "application/json"}, timeout=10)
-        print(f"[LOG] API response status: {response.status_code}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"[LOG] API response success: {result}")
-            return {
-                "ok": True,
-                "message": "Successfully updated user preferences",
-                "preferences": result,
-                "user_id": user_id
-            }
-        elif response.status_code == 404:
-            return {"ok": False, "error": "User preferences not found"}
-        elif response.status_code == 400:
-            result = response.json()
-            return {"ok": False, "error": result.get("detail", "Unable to update user preferences")}
-        else:
-            print(f"[LOG] API response unexpected status: {response.status_code}")
-            return {"ok": False, "error": "Unable to update user preferences at this time"}
-        
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to API")
-        return {"ok": False, "error": "Unable to connect to user preferences service. Please check if the service is running."}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to API")
-        return {"ok": False, "error": "User preferences service request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": f"Unexpected error updating user preferences: {str(e)}"}
+    logger.debug("update_user_preferences called with user_id=%s", user_id)
+    
+    # Build payload with only provided values
+    payload = _preferences_payload(
+        experience_level=experience_level, investment_style=investment_style, risk_tolerance=risk_tolerance,
+        communication_style=communication_style, preferred_sectors=preferred_sectors,
+        investment_goals=investment_goals, preferred_timeframe=preferred_timeframe,
+        preferred_asset_classes=preferred_asset_classes, language=language, currency=currency, timezone=timezone
+    )
+    
+    if not payload:
+        return {"ok": False, "error": "No fields provided for update"}
+    
+    logger.debug("Making API request to update user preferences for user %s", user_id)
+    logger.debug("API payload: %s", payload)
+    
+    # Make HTTP request to the user preferences API
+    api_url = _user_url(USER_PREFERENCES_API_URL, user_id)
+    response = _backend_request("PUT", api_url, data=json_utils.dumps_bytes(payload),
+                                headers=_JSON_HEADERS, timeout=10)
+    logger.debug("API response status: %s", response.status_code)
+    
+    if response.status_code == 200:
+        _list_cache_drop(api_url)
+        _invalidate_user_cache(_HISTORY_USER_BASE, user_id)
+        result = _parse_json(response)
+        logger.debug("API response success: %s", result)
+        return {
+            "ok": True,
+            "message": "Successfully updated user preferences",
+            "preferences": result,
+            "user_id": user_id
+        }
+    elif response.status_code == 404:
+        return {"ok": False, "error": "User preferences not found"}
+    elif response.status_code == 400:
+        result = _parse_json(response)
+        return {"ok": False, "error": result.get("detail", "Unable to update user preferences")}
+    else:
+        logger.debug("API response unexpected status: %s", response.status_code)
+        return {"ok": False, "error": "Unable to update user preferences at this time"}
 
 @tool("record_user_interaction", args_schema=UserInteractionInput)
+@_backend_errors("user interactions", "recording user interaction")
 def record_user_interaction(user_id: str, interaction_type: str, content: Optional[Dict[str, Any]] = None,
                            satisfaction_score: Optional[int] = None, metadata: Optional[Dict[str, Any]] = None):
     """Record a user interaction by calling the external user interactions API."""
-    try:
-        print(f"[LOG] record_user_interaction called with user_id={user_id}, type={interaction_type}")
-        
-        if not user_id or not user_id.strip():
-            return {"ok": False, "error": "User ID cannot be empty"}
-        
-        if not interaction_type or not interaction_type.strip():
-            return {"ok": False, "error": "Interaction type cannot be empty"}
-        
-        user_id = user_id.strip()
-        interaction_type = interaction_type.strip()
-        
-        # Build payload
-        payload = {
-            "user_id": user_id,
-            "interaction_type": interaction_type
+    logger.debug("record_user_interaction called with user_id=%s, type=%s", user_id, interaction_type)
+    
+    # Build payload
+    payload = {
+        "user_id": user_id,
+        "interaction_type": interaction_type
+    }
+    if content:
+        payload["content"] = content
+    if satisfaction_score:
+        payload["satisfaction_score"] = satisfaction_score
+    if metadata:
+        payload["metadata"] = metadata
+    
+    logger.debug("Making API request to record user interaction for user %s", user_id)
+    logger.debug("API payload: %s", payload)
+    
+    # Make HTTP request to the user interactions API
+    response = _backend_request("POST", USER_INTERACTIONS_API_URL, data=json_utils.dumps_bytes(payload),
+                                headers=_JSON_HEADERS, timeout=10)
+    logger.debug("API response status: %s", response.status_code)
+    
+    if response.status_code in [200, 201]:
+        _invalidate_user_cache(_INTERACTIONS_USER_BASE, user_id)
+        result = _parse_json(response)
+        logger.debug("API response success: %s", result)
+        return {
+            "ok": True,
+            "message": "Successfully recorded user interaction",
+            "interaction": result,
+            "user_id": user_id
         }
-        if content:
-            payload["content"] = content
-        if satisfaction_score:
-            payload["satisfaction_score"] = satisfaction_score
-        if metadata:
-            payload["metadata"] = metadata
-        
-        print(f"[LOG] Making API request to record user interaction for user {user_id}")
-        print(f"[LOG] API payload: {payload}")
-        
-        # Make HTTP request to the user interactions API
-        response = requests.post(USER_INTERACTIONS_API_URL, json=payload, 
-                               headers={"Content-Type": "application/json"}, timeout=10)
-        print(f"[LOG] API response status: {response.status_code}")
-        
-        if response.status_code in [200, 201]:
-            result = response.json()
-            print(f"[LOG] API response success: {result}")
-            return {
-                "ok": True,
-                "message": "Successfully recorded user interaction",
-                "interaction": result,
-                "user_id": user_id
-            }
-        elif response.status_code == 400:
-            result = response.json()
-            return {"ok": False, "error": result.get("detail", "Unable to record user interaction")}
-        else:
-            print(f"[LOG] API response unexpected status: {response.status_code}")
-            return {"ok": False, "error": "Unable to record user interaction at this time"}
-        
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to API")
-        return {"ok": False, "error": "Unable to connect to user interactions service. Please check if the service is running."}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to API")
-        return {"ok": False, "error": "User interactions service request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": f"Unexpected error recording user interaction: {str(e)}"}
+    elif response.status_code == 400:
+        result = _parse_json(response)
+        return {"ok": False, "error": result.get("detail", "Unable to record user interaction")}
+    else:
+        logger.debug("API response unexpected status: %s", response.status_code)
+        return {"ok": False, "error": "Unable to record user interaction at this time"}
 
 @tool("get_user_interactions", args_schema=GetUserInteractionsInput)
+@_backend_errors("user interactions", "retrieving user interactions")
 def get_user_interactions(user_id: str, page: int = 1, size: int = 10, interaction_type: Optional[str] = None):
     """Get user interactions for a specific user from the external user interactions API."""
-    try:
-        print(f"[LOG] get_user_interactions called with user_id={user_id}, page={page}, size={size}")
-        
-        if not user_id or not user_id.strip():
-            return {"ok": False, "error": "User ID cannot be empty"}
-        
-        user_id = user_id.strip()
-        
-        # Build query parameters
-        params = {"user_id": user_id, "page": page, "size": size}
-        if interaction_type:
-            params["interaction_type"] = interaction_type
-        
-        print(f"[LOG] Making API request to get user interactions for user {user_id}")
-        
-        # Make HTTP request to the user interactions API
-        api_url = f"{USER_INTERACTIONS_API_URL}user/{user_id}"
-        response = requests.get(api_url, params=params, timeout=10)
-        print(f"[LOG] API response status: {response.status_code}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"[LOG] API response success: {result}")
-            return {
-                "ok": True,
-                "interactions": result.get("interactions", []),
-                "total": result.get("total", 0),
-                "page": result.get("page", page),
-                "size": result.get("size", size),
-                "pages": result.get("pages", 0),
-                "user_id": user_id
-            }
-        elif response.status_code == 404:
-            return {"ok": False, "error": "User interactions not found"}
-        else:
-            print(f"[LOG] API response failed with status {response.status_code}")
-            try:
-                error_detail = response.json()
-                return {"ok": False, "error": f"User interactions API error: {error_detail.get('detail', 'Unknown error')}"}
-            except:
-                return {"ok": False, "error": f"Unable to retrieve user interactions (HTTP {response.status_code})"}
-        
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to API")
-        return {"ok": False, "error": "Unable to connect to user interactions service. Please check if the service is running."}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to API")
-        return {"ok": False, "error": "User interactions service request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": f"Unexpected error retrieving user interactions: {str(e)}"}
+    logger.debug("get_user_interactions called with user_id=%s, page=%s, size=%s", user_id, page, size)
+    
+    # Build query parameters
+    params = {"user_id": user_id, "page": page, "size": size}
+    if interaction_type:
+        params["interaction_type"] = interaction_type
+    
+    logger.debug("Making API request to get user interactions for user %s", user_id)
+    
+    # Make HTTP request to the user interactions API
+    # Cached per page and filter; record_user_interaction drops the user's pages
+    api_url = f"{_user_url(_INTERACTIONS_USER_BASE, user_id)}?{urlencode(params)}"
+    response = _cached_list(api_url, ttl=PREFERENCE_CACHE_TTL)
+    logger.debug("API response status: %s", response.status_code)
+    
+    if response.status_code == 200:
+        result = _parse_json(response)
+        logger.debug("API response success: %s", result)
+        return {
+            "ok": True,
+            "interactions": result.get("interactions", []),
+            "total": result.get("total", 0),
+            "page": result.get("page", page),
+            "size": result.get("size", size),
+            "pages": result.get("pages", 0),
+            "user_id": user_id
+        }
+    elif response.status_code == 404:
+        return {"ok": False, "error": "User interactions not found"}
+    else:
+        logger.debug("API response failed with status %s", response.status_code)
+        try:
+            error_detail = _parse_json(response)
+            return {"ok": False, "error": f"User interactions API error: {error_detail.get('detail', 'Unknown error')}"}
+        except ValueError:
+            return {"ok": False, "error": f"Unable to retrieve user interactions (HTTP {response.status_code})"}
 
 @tool("get_preference_history", args_schema=GetPreferenceHistoryInput)
+@_backend_errors("preference history", "retrieving preference history")
 def get_preference_history(user_id: str, page: int = 1, size: int = 10, field_name: Optional[str] = None):
     """Get preference history for a specific user from the external preference history API."""
-    try:
-        print(f"[LOG] get_preference_history called with user_id={user_id}, page={page}, size={size}")
-        
-        if not user_id or not user_id.strip():
-            return {"ok": False, "error": "User ID cannot be empty"}
-        
-        user_id = user_id.strip()
-        
-        # Build query parameters
-        params = {"user_id": user_id, "page": page, "size": size}
-        if field_name:
-            params["field_name"] = field_name
-        
-        print(f"[LOG] Making API request to get preference history for user {user_id}")
-        
-        # Make HTTP request to the preference history API
-        api_url = f"{PREFERENCE_HISTORY_API_URL}user/{user_id}"
-        response = requests.get(api_url, params=params, timeout=10)
-        print(f"[LOG] API response status: {response.status_code}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"[LOG] API response success: {result}")
-            return {
-                "ok": True,
-                "history": result.get("history", []),
-                "total": result.get("total", 0),
-                "page": result.get("page", page),
-                "size": result.get("size", size),
-                "pages": result.get("pages", 0),
-                "user_id": user_id
-            }
-        elif response.status_code == 404:
-            return {"ok": False, "error": "Preference history not found"}
-        else:
-            print(f"[LOG] API response failed with status {response.status_code}")
+    logger.debug("get_preference_history called with user_id=%s, page=%s, size=%s", user_id, page, size)
+    
+    # Build query parameters
+    params = {"user_id": user_id, "page": page, "size": size}
+    if field_name:
+        params["field_name"] = field_name
+    
+    logger.debug("Making API request to get preference history for user %s", user_id)
+    
+    # Make HTTP request to the preference history API
+    # Cached per page and filter; preference writes drop the user's pages
+    api_url = f"{_user_url(_HISTORY_USER_BASE, user_id)}?{urlencode(params)}"
+    response = _cached_list(api_url, ttl=PREFERENCE_CACHE_TTL)
+    logger.debug("API response status: %s", response.status_code)
+    
+    if response.status_code == 200:
+        result = _parse_json(response)
+        logger.debug("API response success: %s", result)
+        return {
+            "ok": True,
+            "history": result.get("history", []),
+            "total": result.get("total", 0),
+            "page": result.get("page", page),
+            "size": result.get("size", size),
+            "pages": result.get("pages", 0),
+            "user_id": user_id
+        }
+    elif response.status_code == 404:
+        return {"ok": False, "error": "Preference history not found"}
+    else:
+        logger.debug("API response failed with status %s", response.status_code)
+        try:
+            error_detail = _parse_json(response)
+            return {"ok": False, "error": f"Preference history API error: {error_detail.get('detail', 'Unknown error')}"}
+        except ValueError:
+            return {"ok": False, "error": f"Unable to retrieve preference history (HTTP {response.status_code})"}
+
+# ====== Async Tool Variants ======
+# Used by LangChain when the agent runs asynchronously, so concurrent tool calls share one event loop
+@_backend_errors("portfolio", "retrieving portfolio")
+async def _alist_portfolio(user_id: str = DEFAULT_USER_ID, summary_only: bool = False, fields: Optional[List[str]] = None):
+    """List all holdings in the user's portfolio by calling the portfolio API."""
+    response = await _acached_list(_list_url(PORTFOLIO_API_URL, user_id), stale_ok=True)
+    logger.debug("API response status: %s", response.status_code)
+    
+    return _portfolio_list_result(user_id, response, summary_only, fields)
+
+@_backend_errors("portfolio", "adding to portfolio")
+async def _aadd_to_portfolio(user_id: str = DEFAULT_USER_ID, ticker: str = "",
+                             quantity: Decimal = Decimal(0), buy_price: Decimal = Decimal(0), note: Optional[str] = None):
+    """Add or upsert a holding in the user's portfolio by calling the portfolio API. Returns only that holding; use list_portfolio for the full portfolio."""
+    body = _portfolio_add_body(user_id, ticker, quantity, buy_price, note)
+    response = await _abackend_request("POST", PORTFOLIO_API_URL, content=body, headers=_JSON_HEADERS)
+    logger.debug("API response status: %s", response.status_code)
+    
+    return _portfolio_add_result(user_id, ticker, response)
+
+@_backend_errors("portfolio", "removing from portfolio")
+async def _aremove_from_portfolio(user_id: str = DEFAULT_USER_ID, ticker: str = ""):
+    """Remove a holding from the user's portfolio by calling the portfolio API. Returns only a confirmation; use list_portfolio for the remaining holdings."""
+    remaining = _deadline(10)
+    delete_response = await _afiltered_delete(PORTFOLIO_API_URL, user_id, ticker, remaining())
+    
+    if delete_response is None:
+        list_url = _lookup_url(PORTFOLIO_API_URL, user_id, ticker)
+        list_response = await _acached_list(list_url, timeout=remaining())
+        delete_url, error = _portfolio_entry_url(ticker, list_url, list_response)
+        if error:
+            return error
+        delete_response = await _abackend_request("DELETE", delete_url, timeout=remaining())
+    
+    return _portfolio_remove_result(user_id, ticker, delete_response)
+
+@_backend_errors("portfolio", "retrieving portfolio summary")
+async def _aget_portfolio_summary(user_id: str = DEFAULT_USER_ID, include_pnl: bool = True):
+    """Get portfolio summary with PnL calculations for a user by calling the portfolio API."""
+    response = await _acached_list(_summary_url(user_id, include_pnl), ttl=SUMMARY_CACHE_TTL, stale_ok=True)
+    logger.debug("API response status: %s", response.status_code)
+    
+    return _portfolio_summary_result(user_id, include_pnl, response)
+
+@_backend_errors("watchlist", "retrieving watchlist")
+async def _alist_watchlist(user_id: str = DEFAULT_USER_ID, summary_only: bool = False, fields: Optional[List[str]] = None):
+    """List all tickers in the user's watchlist by calling the watchlist API."""
+    response = await _acached_list(_list_url(WATCHLIST_API_URL, user_id), stale_ok=True)
+    logger.debug("API response status: %s", response.status_code)
+    
+    return _watchlist_list_result(user_id, response, summary_only, fields)
+
+@_backend_errors("watchlist", "adding to watchlist")
+async def _aadd_to_watchlist(user_id: str = DEFAULT_USER_ID, ticker: str = "",
+                             note: Optional[str] = None):
+    """Add a ticker to the user's watchlist by calling the watchlist API."""
+    body = _watchlist_add_body(user_id, ticker, note)
+    response = await _abackend_request("POST", WATCHLIST_API_URL, content=body, headers=_JSON_HEADERS)
+    logger.debug("API response status: %s", response.status_code)
+    
+    return _watchlist_add_result(user_id, ticker, response)
+
+@_backend_errors("watchlist", "removing from watchlist", unavailable="Unable to remove ticker from watchlist at this time")
+async def _aremove_from_watchlist(user_id: str = DEFAULT_USER_ID, ticker: str = ""):
+    """Remove a ticker from the user's watchlist by calling the watchlist API."""
+    remaining = _deadline(10)
+    delete_response = await _afiltered_delete(WATCHLIST_API_URL, user_id, ticker, remaining())
+    
+    if delete_response is None:
+        list_url = _lookup_url(WATCHLIST_API_URL, user_id, ticker)
+        list_response = await _acached_list(list_url, timeout=remaining())
+        delete_url, error = _watchlist_entry_url(ticker, list_url, list_response)
+        if error:
+            return error
+        delete_response = await _abackend_request("DELETE", delete_url, timeout=remaining())
+    
+    return _watchlist_remove_result(user_id, ticker, delete_response)
+
+@_backend_errors("watchlist", "retrieving watchlist entry", unavailable="Unable to retrieve watchlist entry at this time")
+async def _aget_watchlist_entry(user_id: str = DEFAULT_USER_ID, ticker: str = ""):
+    """Get a specific watchlist entry by ticker for a user by calling the watchlist API."""
+    api_url = _lookup_url(WATCHLIST_API_URL, user_id, ticker)
+    response = await _acached_list(api_url, stale_ok=True)
+    logger.debug("API response status: %s", response.status_code)
+    
+    return _watchlist_entry_result(user_id, ticker, api_url, response)
+
+@_backend_errors("web search", "during web search")
+async def _aweb_search(query: str, result_filter: str = "web", search_lang: str = "en_US",
+                       country: str = "US", ui_lang: str = "en", count: int = 10,
+                       offset: int = 0, safesearch: str = "moderate"):
+    """Perform a web search using the Brave Search API through our web search endpoint."""
+    cache_key = (_search_key(query), result_filter, search_lang, country, ui_lang, count, offset, safesearch)
+    cached = _search_cache_get(cache_key)
+    if cached is not None:
+        logger.debug("Web search cache hit for '%s'", query)
+        return cached
+    
+    payload = {
+        "query": query,
+        "result_filter": result_filter,
+        "search_lang": search_lang,
+        "country": country,
+        "ui_lang": ui_lang,
+        "count": count,
+        "offset": offset,
+        "safesearch": safesearch
+    }
+    
+    async def search():
+        response = await _abackend_request("POST", WEB_SEARCH_API_URL, content=json_utils.dumps_bytes(payload),
+                                           headers=_JSON_HEADERS, timeout=30)
+        logger.debug("API response status: %s", response.status_code)
+        
+        result = _web_search_result(query, result_filter, count, response)
+        if result["ok"]:
+            _search_cache_put(cache_key, result)
+        return result
+    
+    return await _ashared_search(cache_key, search)
+
+async def _astress_test(target_url: str, num_requests: int = 10, timeout_seconds: int = 5, measure_body: bool = False):
+    """Perform a simple stress test by sending multiple concurrent HTTP requests to a target URL."""
+    logger.debug("Starting stress test with %s requests to %s", num_requests, target_url)
+    
+    # All requests in flight at once on the event loop; a run-scoped client without retries, like the sync tool
+    limits = httpx.Limits(max_connections=num_requests, max_keepalive_connections=num_requests)
+    start_time = time.time()
+    
+    async with httpx.AsyncClient(limits=limits, timeout=timeout_seconds) as client:
+        request = client.build_request("GET", target_url)
+        
+        async def make_request():
             try:
-                error_detail = response.json()
-                return {"ok": False, "error": f"Preference history API error: {error_detail.get('detail', 'Unknown error')}"}
-            except:
-                return {"ok": False, "error": f"Unable to retrieve preference history (HTTP {response.status_code})"}
+                sent_at = time.perf_counter()
+                response = await client.send(request, stream=not measure_body)
+                response_time = time.perf_counter() - sent_at
+                if not measure_body and _drainable(response):
+                    async for _ in response.aiter_raw():
+                        pass
+                await response.aclose()
+                return {
+                    "status_code": response.status_code,
+                    "response_time": response_time,
+                    "success": True
+                }
+            except httpx.TimeoutException:
+                return {
+                    "status_code": None,
+                    "response_time": timeout_seconds,
+                    "success": False,
+                    "error": "Timeout"
+                }
+            except httpx.ConnectError:
+                return {
+                    "status_code": None,
+                    "response_time": 0,
+                    "success": False,
+                    "error": "Connection Error"
+                }
+            except httpx.HTTPError as e:
+                return {
+                    "status_code": None,
+                    "response_time": 0,
+                    "success": False,
+                    "error": str(e)
+                }
         
-    except requests.exceptions.ConnectionError:
-        print(f"[LOG] Connection error to API")
-        return {"ok": False, "error": "Unable to connect to preference history service. Please check if the service is running."}
-    except requests.exceptions.Timeout:
-        print(f"[LOG] Timeout error to API")
-        return {"ok": False, "error": "Preference history service request timed out. Please try again."}
-    except Exception as e:
-        print(f"[LOG] Unexpected error: {str(e)}")
-        return {"ok": False, "error": f"Unexpected error retrieving preference history: {str(e)}"}
+        outcomes = await asyncio.gather(*(make_request() for _ in range(num_requests)))
+    
+    return _stress_test_result(target_url, num_requests, outcomes, time.time() - start_time)
+
+async def _aget_user_snapshot(user_id: str = DEFAULT_USER_ID, include_pnl: bool = True):
+    """Get the user's portfolio holdings, portfolio summary and watchlist in one call. Prefer this over separate calls when more than one of them is needed."""
+    portfolio, summary, watchlist = await asyncio.gather(
+        _alist_portfolio(user_id),
+        _aget_portfolio_summary(user_id, include_pnl),
+        _alist_watchlist(user_id)
+    )
+    return _snapshot_result(user_id, portfolio, summary, watchlist)
+
+if httpx is not None:
+    add_to_portfolio.coroutine = _aadd_to_portfolio
+    remove_from_portfolio.coroutine = _aremove_from_portfolio
+    list_portfolio.coroutine = _alist_portfolio
+    get_portfolio_summary.coroutine = _aget_portfolio_summary
+    list_watchlist.coroutine = _alist_watchlist
+    add_to_watchlist.coroutine = _aadd_to_watchlist
+    remove_from_watchlist.coroutine = _aremove_from_watchlist
+    get_watchlist_entry.coroutine = _aget_watchlist_entry
+    get_user_snapshot.coroutine = _aget_user_snapshot
+    web_search.coroutine = _aweb_search
+    stress_test.coroutine = _astress_test
+
+def user_state_cached(user_id: str) -> bool:
+    """Whether the user's portfolio and watchlist listings are already in the list cache"""
+    user_id = _clean_text(user_id)
+    return bool(user_id) and all(
+        _list_cache_get(_list_url(api_url, user_id)) is not None for api_url in (PORTFOLIO_API_URL, WATCHLIST_API_URL)
+    )
+
+async def prefetch_user_state(user_id: str):
+    """Warm the list cache with the user's portfolio and watchlist while the agent works out its first step"""
+    user_id = _clean_text(user_id)
+    if not user_id:
+        return
+    urls = [url for url in (_list_url(PORTFOLIO_API_URL, user_id), _list_url(WATCHLIST_API_URL, user_id))
+            if _list_cache_get(url) is None]
+    if not urls:
+        return
+    if httpx is not None:
+        fetches = [_acached_list(url) for url in urls]
+    else:
+        fetches = [asyncio.to_thread(_cached_list, url) for url in urls]
+    for url, result in zip(urls, await asyncio.gather(*fetches, return_exceptions=True)):
+        if isinstance(result, Exception):
+            logger.debug("Prefetch of %s failed: %s", url, result)
+
+async def warm_http_clients():
+    """Open a pooled connection to each backend so the first tool calls skip DNS and connection setup"""
+    def warm(origin: str):
+        try:
+            _SESSION.head(origin, timeout=_CONNECT_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            logger.debug("Warming connection to %s failed: %s", origin, e)
+    
+    async def awarm(origin: str):
+        try:
+            await _get_async_client().head(origin, timeout=_CONNECT_TIMEOUT)
+        except httpx.HTTPError as e:
+            logger.debug("Warming async connection to %s failed: %s", origin, e)
+    
+    # Straight to the clients: a backend that isn't up yet shouldn't count against its circuit breaker
+    warmups = [asyncio.to_thread(warm, origin) for origin in _BACKEND_ORIGINS]
+    if httpx is not None:
+        warmups += [awarm(origin) for origin in _BACKEND_ORIGINS]
+    await asyncio.gather(*warmups)
+
+async def close_http_clients():
+    """Close the shared HTTP session and async client, releasing their pooled connections"""
+    global _ACLIENT, _ACLIENT_LOOP
+    _SESSION.close()
+    # A client opened on another loop can't be closed from this one; dropping it releases its sockets
+    if _ACLIENT is not None and _ACLIENT_LOOP is asyncio.get_running_loop():
+        await _ACLIENT.aclose()
+    _ACLIENT = _ACLIENT_LOOP = None
 
 # ====== Tool List ======
 TOOLS = [
@@ -1201,9 +1953,12 @@ TOOLS = [
     list_portfolio,
     get_portfolio_summary,
     add_to_watchlist,
+    add_many_to_watchlist,
     remove_from_watchlist,
+    remove_many_from_watchlist,
     list_watchlist,
     get_watchlist_entry,
+    get_user_snapshot,
     web_search,
     stress_test,
     get_user_preferences,
@@ -1213,3 +1968,7 @@ TOOLS = [
     get_user_interactions,
     get_preference_history,
 ]
+
+# The schemas normalize and reject bad arguments; report that back to the agent instead of raising
+for _schema_tool in TOOLS:
+    _schema_tool.handle_validation_error = _validation_error_message